@@ -0,0 +1,158 @@
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+
+# --- Content-addressed cache for expensive analysis stages (<ANALYSIS_CACHE_DIR>/) ---
+# A stage result is stored under a key hashed from the stage name, its inputs (file hashes or the
+# keys of upstream stages) and its parameters, so changing one parameter only misses the stages
+# that depend on it. Arrays are .npy (memory-mapped on load), small results .json. Least recently
+# used entries are deleted once the directory grows past ANALYSIS_CACHE_MAX_BYTES.
+ANALYSIS_CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', '.analysis_cache')
+ANALYSIS_CACHE_MAX_BYTES = 4 * 2**30  # 4 GiB
+FILE_HASH_CHUNK_SIZE = 2**24          # Bytes read per step while hashing a recording
+FILE_HASHES_DIR = 'file_hashes'       # One small file per (path, size, mtime) holding the content hash
+
+
+class AnalysisCache:
+    """
+    Directory of memoized stage results. Writes go through a temporary file and
+    os.replace, so several processes can share one cache.
+    """
+
+    def __init__(self, directory=ANALYSIS_CACHE_DIR, max_bytes=ANALYSIS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def _write(self, path, write, evict=True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates 0600
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if evict:
+            self.evict()
+
+    def file_hash(self, file_path):
+        """
+        BLAKE2b of the file contents, remembered per (path, size, mtime) so an
+        unchanged recording is only read once. Each memo entry is its own file,
+        so concurrent callers never overwrite each other's entries.
+        """
+        stat = os.stat(file_path)
+        memo_key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        memo_name = hashlib.blake2b(memo_key.encode(), digest_size=16).hexdigest()
+        memo_path = os.path.join(self.directory, FILE_HASHES_DIR, memo_name)
+        try:
+            with open(memo_path, 'r') as f:
+                content_hash = f.read().strip()
+            if content_hash:
+                return content_hash
+        except OSError:
+            pass
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(FILE_HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        self._write(memo_path, lambda f: f.write(content_hash.encode()), evict=False)
+        return content_hash
+
+    @staticmethod
+    def key(stage, *inputs, **params):
+        """
+        Cache key of a stage: inputs are file hashes or upstream keys, params any
+        JSON-serializable values (numpy scalars and arrays are converted).
+        """
+        description = json.dumps({'stage': stage, 'inputs': list(inputs), 'params': params},
+                                  sort_keys=True, default=lambda value: np.asarray(value).tolist())
+        return f"{stage}-{hashlib.blake2b(description.encode(), digest_size=16).hexdigest()}"
+
+    def _touch(self, path):
+        try:
+            os.utime(path)  # mtime is the LRU clock
+        except OSError:
+            pass
+
+    def array(self, key, compute):
+        """
+        Returns the cached array for key (read-only, memory-mapped), or computes,
+        stores and returns it.
+        """
+        path = self._path(key, '.npy')
+        if os.path.exists(path):
+            try:
+                cached = np.load(path, mmap_mode='r')
+                self._touch(path)
+                return cached
+            except (ValueError, OSError):
+                pass  # Truncated by a crash or an eviction race: recompute
+        result = np.asarray(compute())
+        self._write(path, lambda f: np.save(f, result))
+        return result
+
+    def json(self, key, compute):
+        """
+        Returns the cached JSON-serializable result for key (None included), or
+        computes, stores and returns it. Tuples come back as lists.
+        """
+        path = self._path(key, '.json')
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    cached = json.load(f)['result']
+                self._touch(path)
+                return cached
+            except (ValueError, KeyError, OSError):
+                pass
+        result = compute()
+        self._write(path, lambda f: f.write(json.dumps({'key': key, 'result': result}, indent=2).encode()))
+        return result
+
+    def entries(self):
+        """
+        (path, size, mtime) of every stored result, least recently used first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(('.npy', '.json')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, max_bytes=None):
+        """
+        Deletes least recently used results until the cache fits in max_bytes.
+        Returns the number of bytes freed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        freed = 0
+        for path, size, _ in entries:
+            if total_bytes - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def clear(self):
+        return self.evict(0)
@@ -0,0 +1,138 @@
+import numpy as np
+import json
+import os
+from iq_dsp import StreamingBurstDetector, Burst, BURST_FRAME_SIZE
+from iq_io import open_iq_recording, close_iq_recording, iter_iq_blocks
+
+# --- Burst index sidecar (<recording>.bursts.json) ---
+BURST_INDEX_SUFFIX = '.bursts.json'
+BURST_INDEX_BLOCK_SIZE = 2**20        # Samples fed to the detector per step
+BURST_PADDING_S = 0.002               # Context kept around each burst when reading burst regions
+
+
+def burst_index_path(file_path):
+    return file_path + BURST_INDEX_SUFFIX
+
+
+def detect_bursts(iq_samples, sample_rate, block_size=BURST_INDEX_BLOCK_SIZE):
+    """
+    Runs StreamingBurstDetector over a whole recording in one pass and returns its bursts.
+    """
+    detector = StreamingBurstDetector(sample_rate)
+    bursts = []
+    for block in iter_iq_blocks(iq_samples, sample_rate, block_size):
+        bursts.extend(detector.process(block.samples))
+    bursts.extend(detector.flush())
+    return bursts
+
+
+def write_burst_index(file_path, bursts, sample_rate, num_samples):
+    index = {
+        'recording': os.path.basename(file_path),
+        'sample_rate': sample_rate,
+        'num_samples': num_samples,
+        'frame_size': BURST_FRAME_SIZE,
+        'bursts': [burst._asdict() for burst in bursts],
+    }
+    with open(burst_index_path(file_path), 'w') as f:
+        json.dump(index, f, indent=2)
+
+
+def read_burst_index(file_path):
+    """
+    Returns the bursts listed in the recording's sidecar, or None if there is no
+    sidecar or the recording was modified after it was written.
+    """
+    index_path = burst_index_path(file_path)
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(file_path):
+        return None
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    return [Burst(**burst) for burst in index['bursts']]
+
+
+def load_burst_index(file_path, iq_samples=None, sample_rate=None):
+    """
+    Reads the burst sidecar of a recording, building it first if it is missing or stale.
+    """
+    bursts = read_burst_index(file_path)
+    if bursts is not None:
+        return bursts
+    if iq_samples is None:
+        iq_samples, sample_rate = open_iq_recording(file_path)
+        try:
+            return load_burst_index(file_path, iq_samples, sample_rate)
+        finally:
+            close_iq_recording(iq_samples)
+    print(f"Building burst index for '{file_path}'...")
+    bursts = detect_bursts(iq_samples, sample_rate)
+    write_burst_index(file_path, bursts, sample_rate, len(iq_samples))
+    print(f"Found {len(bursts)} bursts. Index saved to '{burst_index_path(file_path)}'.")
+    return bursts
+
+
+def burst_sample_ranges(bursts, sample_rate, num_samples, padding_s=BURST_PADDING_S):
+    """
+    Returns merged [start, end) sample ranges covering every burst plus padding_s on each side.
+    """
+    padding = int(padding_s * sample_rate)
+    ranges = []
+    for burst in sorted(bursts):
+        start, end = max(burst.start - padding, 0), min(burst.end + padding, num_samples)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [(start, end) for start, end in ranges]
+
+
+class FreeSpaceSampler:
+    """
+    Draws non-overlapping windows of window_length samples from the parts of
+    [0, num_samples) outside occupied_ranges (signal regions, burst ranges; may
+    overlap). Each free interval holds gap_length // window_length window slots;
+    a draw picks slots without replacement to decide how many windows land in
+    each interval, then places those windows at random, non-overlapping offsets
+    inside it, so windows are not tied to a fixed grid.
+    """
+
+    def __init__(self, occupied_ranges, num_samples, window_length, rng=None):
+        self.window_length = int(window_length)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        gap_starts, gap_lengths = [], []
+        position = 0
+        for start, end in sorted(occupied_ranges) + [(num_samples, num_samples)]:
+            start, end = max(int(start), 0), min(int(end), num_samples)
+            if start - position >= self.window_length:
+                gap_starts.append(position)
+                gap_lengths.append(start - position)
+            position = max(position, end)
+        self.gap_starts = np.array(gap_starts, dtype=np.int64)
+        self.gap_lengths = np.array(gap_lengths, dtype=np.int64)
+        self.cumulative_slots = np.cumsum(self.gap_lengths // self.window_length)
+
+    @property
+    def num_windows(self):
+        """Non-overlapping windows that fit in the free space (the most sample() can return)."""
+        return int(self.cumulative_slots[-1]) if len(self.cumulative_slots) else 0
+
+    def sample(self, count):
+        """
+        Sorted start indices of count non-overlapping windows. Raises ValueError
+        when the free space cannot hold count non-overlapping windows.
+        """
+        if self.num_windows < count:
+            raise ValueError(f"Free space holds only {self.num_windows} windows of {self.window_length} samples, {count} requested.")
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        slots = self.rng.choice(self.num_windows, size=count, replace=False)
+        windows_per_gap = np.bincount(np.searchsorted(self.cumulative_slots, slots, side='right'), minlength=len(self.gap_starts))
+        starts = []
+        for gap in np.flatnonzero(windows_per_gap):
+            # k windows in a gap of length L: k sorted distinct picks from L - k*w + k positions,
+            # minus their rank, are the non-decreasing amounts of slack before each window
+            k = int(windows_per_gap[gap])
+            picks = np.sort(self.rng.choice(int(self.gap_lengths[gap]) - k * self.window_length + k, size=k, replace=False))
+            rank = np.arange(k)
+            starts.append(self.gap_starts[gap] + picks - rank + rank * self.window_length)
+        return np.concatenate(starts).astype(np.int64)
@@ -0,0 +1,233 @@
+import matplotlib
+matplotlib.use('Agg')  # Headless: figures are only ever saved, never shown
+import matplotlib.pyplot as plt
+import numpy as np
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from scipy.signal import correlate
+from burst_index import load_burst_index
+from fsk_demod import fsk_discriminate, estimate_fsk_parameters
+from iq_dsp import frequency_shift
+from iq_io import open_iq_recording, close_iq_recording
+from waterfall import load_waterfall_pyramid
+
+# --- Report configuration ---
+PLOTS_OUTPUT_DIR = 'sdr_analysis_plots'
+fsk_bit_rate_bps = 48000.5
+fsk_freq_dev_hz = 50000
+BURST_REPORT_PADDING_S = 0.002        # Context shown before and after each burst
+OVERVIEW_MAX_ROWS = 1000              # Rows of the overview waterfall (taken from the pyramid)
+OVERVIEW_MAX_BURST_LABELS = 10        # Bursts listed one by one in the overview legend
+WATERFALL_DYNAMIC_RANGE_DB = 80
+FIGURE_DPI = 100
+
+# Files rendered for every burst; a burst is skipped when all of them exist
+BURST_PLOT_NAMES = ('burst_{n}_analysis.png', 'burst_{n}_autocorrelation.png', 'waterfall_burst_{n}_avg_spectrum.png',
+                    'waterfall_burst_{n}_zoom.png')
+OVERVIEW_PLOT_NAMES = ('overview_waterfall.png', 'waterfall_overview_with_bursts.png')
+
+_worker_state = {}
+
+
+def burst_plot_paths(output_dir, burst_number):
+    return [os.path.join(output_dir, name.format(n=burst_number)) for name in BURST_PLOT_NAMES]
+
+
+def _init_worker(recording_path, output_dir, bit_rate, freq_dev):
+    """
+    Opens the recording (memory-mapped) and its waterfall pyramid once per worker process.
+    """
+    iq_samples, sample_rate = open_iq_recording(recording_path)
+    _worker_state.update(
+        iq_samples=iq_samples, sample_rate=sample_rate, output_dir=output_dir, bit_rate=bit_rate, freq_dev=freq_dev,
+        pyramid=load_waterfall_pyramid(recording_path, iq_samples, sample_rate),
+    )
+
+
+def render_burst(burst_number, burst):
+    """
+    Renders the per-burst figures (zoomed waterfall with instantaneous frequency,
+    transition autocorrelation, average spectrum, zoomed waterfall alone) and
+    returns the paths written.
+    """
+    state = _worker_state
+    sample_rate, bit_rate, freq_dev = state['sample_rate'], state['bit_rate'], state['freq_dev']
+    pyramid = state['pyramid']
+    padding = int(BURST_REPORT_PADDING_S * sample_rate)
+    segment_start = max(burst.start - padding, 0)
+    segment_end = min(burst.end + padding, len(state['iq_samples']))
+    analysis_path, autocorrelation_path, spectrum_path, zoom_path = burst_plot_paths(state['output_dir'], burst_number)
+
+    # Zoomed waterfall and average spectrum come straight from the pyramid's finest level
+    rows_db, (view_start_s, view_end_s), _ = pyramid.view(segment_start / sample_rate, segment_end / sample_rate, max_rows=np.inf)
+    freq_axis_khz = pyramid.freq_axis_hz / 1000.0
+    average_spectrum_db = 10 * np.log10(np.mean(10 ** (rows_db / 10), axis=0))
+    np.maximum(rows_db, rows_db.max() - WATERFALL_DYNAMIC_RANGE_DB, out=rows_db)
+
+    # Instantaneous frequency around the burst centroid (brought to 0 Hz)
+    burst_samples = frequency_shift(state['iq_samples'][segment_start:segment_end], -burst.centroid_hz, sample_rate)
+    instantaneous_frequency = fsk_discriminate(burst_samples, sample_rate, bit_rate)
+    time_axis_s = segment_start / sample_rate + np.arange(len(instantaneous_frequency)) / sample_rate
+
+    fig, (ax_waterfall, ax_frequency) = plt.subplots(2, 1, figsize=(12, 10))
+    im = ax_waterfall.imshow(rows_db, aspect='auto', cmap='jet', extent=[freq_axis_khz[0], freq_axis_khz[-1], view_end_s, view_start_s])
+    ax_waterfall.axvline(burst.centroid_hz / 1000.0, color='white', linestyle='--', label=f'Centroid {burst.centroid_hz / 1e3:.1f} kHz')
+    ax_waterfall.set_xlim((burst.centroid_hz - 3 * freq_dev) / 1000.0, (burst.centroid_hz + 3 * freq_dev) / 1000.0)
+    ax_waterfall.set_title(f"Burst {burst_number}: {burst.start / sample_rate:.4f}-{burst.end / sample_rate:.4f} s, peak {burst.peak_power_db:.1f} dB")
+    ax_waterfall.set_xlabel('Frequency (kHz)')
+    ax_waterfall.set_ylabel('Time (s)')
+    ax_waterfall.legend(loc='upper right')
+    fig.colorbar(im, ax=ax_waterfall, label='Power (dB)')
+
+    ax_frequency.plot(time_axis_s, instantaneous_frequency / 1000.0, linewidth=0.7)
+    ax_frequency.axhline(freq_dev / 1000.0, color='green', linestyle='--', label=f'Mark ({freq_dev / 1e3:.0f} kHz)')
+    ax_frequency.axhline(-freq_dev / 1000.0, color='red', linestyle='--', label=f'Space ({-freq_dev / 1e3:.0f} kHz)')
+    ax_frequency.set_ylim(-3 * freq_dev / 1000.0, 3 * freq_dev / 1000.0)
+    ax_frequency.set_title('Instantaneous Frequency (relative to burst centroid)')
+    ax_frequency.set_xlabel('Time (s)')
+    ax_frequency.set_ylabel('Frequency (kHz)')
+    ax_frequency.grid(True)
+    ax_frequency.legend(loc='upper right')
+    fig.tight_layout()
+    fig.savefig(analysis_path, dpi=FIGURE_DPI)
+    plt.close(fig)
+
+    # Autocorrelation of the bit transitions (|d/dt| of the instantaneous frequency): NRZ data
+    # only correlates at whole bit periods there, so the peaks line up with multiples of the bit period
+    transitions = np.abs(np.diff(instantaneous_frequency[padding : len(instantaneous_frequency) - padding]))
+    transitions -= np.mean(transitions)
+    autocorrelation = correlate(transitions, transitions, mode='full', method='fft')[len(transitions) - 1:]
+    autocorrelation /= autocorrelation[0] + 1e-30
+    lags_s = np.arange(len(autocorrelation)) / sample_rate
+
+    fig, ax = plt.subplots(1, 1, figsize=(12, 5))
+    ax.plot(lags_s * 1e3, autocorrelation, linewidth=0.7)
+    for multiple in range(1, 21):
+        ax.axvline(multiple * 1e3 / bit_rate, color='green', linestyle='--', linewidth=0.5,
+                   label=f'Bit period {1e3 / bit_rate:.4f} ms' if multiple == 1 else None)
+    ax.set_xlim(0, min(lags_s[-1], 20 / bit_rate) * 1e3)
+    ax.set_title(f'Burst {burst_number}: Autocorrelation of Frequency Transitions')
+    ax.set_xlabel('Lag (ms)')
+    ax.set_ylabel('Normalized autocorrelation')
+    ax.grid(True)
+    ax.legend(loc='upper right')
+    fig.tight_layout()
+    fig.savefig(autocorrelation_path, dpi=FIGURE_DPI)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(1, 1, figsize=(12, 5))
+    ax.plot(freq_axis_khz, average_spectrum_db, linewidth=0.8)
+    ax.axvline(burst.centroid_hz / 1000.0, color='red', linestyle='--', label='Centroid')
+    ax.set_title(f'Burst {burst_number}: Average Spectrum')
+    ax.set_xlabel('Frequency (kHz)')
+    ax.set_ylabel('Power (dB)')
+    ax.grid(True)
+    ax.legend(loc='upper right')
+    fig.tight_layout()
+    fig.savefig(spectrum_path, dpi=FIGURE_DPI)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+    im = ax.imshow(rows_db, aspect='auto', cmap='jet', extent=[freq_axis_khz[0], freq_axis_khz[-1], view_end_s, view_start_s])
+    ax.axvline((burst.centroid_hz + freq_dev) / 1000.0, color='green', linestyle=':', label=f'Mark ({freq_dev / 1e3:+.1f} kHz)')
+    ax.axvline((burst.centroid_hz - freq_dev) / 1000.0, color='red', linestyle=':', label=f'Space ({-freq_dev / 1e3:+.1f} kHz)')
+    ax.set_xlim((burst.centroid_hz - 2 * freq_dev) / 1000.0, (burst.centroid_hz + 2 * freq_dev) / 1000.0)
+    ax.set_title(f'Zoomed Waterfall: Burst {burst_number} (starts at {burst.start / sample_rate:.4f} s)')
+    ax.set_xlabel('Frequency (kHz)')
+    ax.set_ylabel('Absolute Time (s)')
+    ax.legend(loc='lower center')
+    fig.colorbar(im, ax=ax, label='Power (dB)')
+    fig.tight_layout()
+    fig.savefig(zoom_path, dpi=FIGURE_DPI)
+    plt.close(fig)
+
+    return [analysis_path, autocorrelation_path, spectrum_path, zoom_path]
+
+
+def render_overview(pyramid, bursts, output_paths):
+    """
+    Writes the overview waterfall twice: plain, and with the bursts shaded.
+    """
+    rows_db, (view_start_s, view_end_s), level = pyramid.view(max_rows=OVERVIEW_MAX_ROWS, dynamic_range_db=WATERFALL_DYNAMIC_RANGE_DB)
+    freq_axis_khz = pyramid.freq_axis_hz / 1000.0
+    plain_path, bursts_path = output_paths
+    for output_path in output_paths:
+        fig, ax = plt.subplots(1, 1, figsize=(15, 8))
+        im = ax.imshow(rows_db, aspect='auto', cmap='jet', extent=[freq_axis_khz[0], freq_axis_khz[-1], view_end_s, view_start_s])
+        if output_path == bursts_path:
+            for number, burst in enumerate(bursts):
+                start_s, end_s = burst.start / pyramid.sample_rate, burst.end / pyramid.sample_rate
+                if len(bursts) <= OVERVIEW_MAX_BURST_LABELS:
+                    label = f'Burst @ {start_s:.2f}s'
+                else:
+                    label = f'{len(bursts)} bursts' if number == 0 else None
+                ax.axhspan(start_s, end_s, color='white', alpha=0.3, label=label)
+            if bursts:
+                ax.legend(loc='upper right')
+        ax.set_title(f"Overview Waterfall (Fs={pyramid.sample_rate / 1e6:.3f} MHz, FFT={pyramid.fft_size}, level {level}, {len(bursts)} bursts)")
+        ax.set_xlabel('Frequency (kHz)')
+        ax.set_ylabel('Time (s)')
+        fig.colorbar(im, ax=ax, label='Power (dB)')
+        fig.tight_layout()
+        fig.savefig(output_path, dpi=FIGURE_DPI)
+        plt.close(fig)
+
+
+def generate_report(recording_path, output_dir=PLOTS_OUTPUT_DIR, workers=None, overwrite=False, limit=None,
+                    bit_rate=None, freq_dev=None):
+    """
+    Renders the overview waterfall and the per-burst figures of a recording
+    into output_dir, spreading bursts over a process pool. Burst index and
+    waterfall pyramid are built first if missing. A bit_rate or freq_dev left
+    as None is estimated from the bursts (falling back to the defaults above).
+    Returns the paths written.
+    """
+    iq_samples, sample_rate = open_iq_recording(recording_path)
+    try:
+        all_bursts = sorted(load_burst_index(recording_path, iq_samples, sample_rate))
+        bursts = all_bursts[:limit]
+        pyramid = load_waterfall_pyramid(recording_path, iq_samples, sample_rate)
+        os.makedirs(output_dir, exist_ok=True)
+        written = []
+
+        overview_paths = [os.path.join(output_dir, name) for name in OVERVIEW_PLOT_NAMES]
+        if overwrite or not all(os.path.exists(path) for path in overview_paths):
+            render_overview(pyramid, bursts, overview_paths)
+            written.extend(overview_paths)
+
+        pending = [(number, burst) for number, burst in enumerate(bursts, start=1)
+                   if overwrite or not all(os.path.exists(path) for path in burst_plot_paths(output_dir, number))]
+        print(f"{len(bursts)} bursts, {len(bursts) - len(pending)} already rendered, rendering {len(pending)}...")
+        if pending and (bit_rate is None or freq_dev is None):
+            # Only the burst figures need the FSK parameters
+            estimated = estimate_fsk_parameters(iq_samples, sample_rate, all_bursts)
+            if estimated is not None:
+                print(f"Estimated from {estimated.num_bursts} bursts: {estimated.bit_rate:.1f} bps, deviation {estimated.freq_dev:.0f} Hz.")
+            bit_rate = bit_rate or (estimated.bit_rate if estimated else fsk_bit_rate_bps)
+            freq_dev = freq_dev or (estimated.freq_dev if estimated else fsk_freq_dev_hz)
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(recording_path, output_dir, bit_rate, freq_dev)) as pool:
+                for number, paths in zip([number for number, _ in pending],
+                                         pool.map(render_burst, *zip(*pending))):
+                    print(f"  Burst {number} -> {', '.join(os.path.basename(path) for path in paths)}")
+                    written.extend(paths)
+        return written
+    finally:
+        close_iq_recording(iq_samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render burst analysis plots for a recording without a display.")
+    parser.add_argument('recording', help="I/Q recording (SDR++ WAV, .iqz archive, SigMF or raw cu8/ci8/ci16)")
+    parser.add_argument('--output-dir', default=PLOTS_OUTPUT_DIR, help="Directory for the PNG files")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--overwrite', action='store_true', help="Re-render bursts whose plots already exist")
+    parser.add_argument('--limit', type=int, default=None, help="Only render the first N bursts")
+    parser.add_argument('--bit-rate', type=float, default=None, help="FSK bit rate (bps; default: estimated from the bursts)")
+    parser.add_argument('--deviation', type=float, default=None, help="FSK frequency deviation (Hz; default: estimated from the bursts)")
+    args = parser.parse_args()
+
+    written = generate_report(args.recording, args.output_dir, args.workers, args.overwrite, args.limit, args.bit_rate, args.deviation)
+    print(f"Report complete: {len(written)} files written to '{args.output_dir}'.")
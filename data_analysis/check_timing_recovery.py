@@ -0,0 +1,80 @@
+import numpy as np
+import sys
+from fsk_demod import (
+    FIRDecimator, StreamingFSKDemod, TimingRecoverySlicer, StreamingPatternSearch, StreamingFrameReader,
+    strings_to_bit_patterns, FSK_PREAMBLE_BITS, FSK_SYNC_WORD
+)
+
+# --- Regression check: closed-loop bit clock over whole multi-burst recordings ---
+# Synthesizes recordings with several frames separated by random noise gaps and runs the
+# pattern-search chain and the frame reader over each one as a single stream (no per-burst
+# reset). Both have to find every message without bit errors; the loop must neither drift on
+# the gaps nor lose a burst.
+# Run: python check_timing_recovery.py   (exit status 1 on a miss)
+SAMPLE_RATE = 2.048e6
+BIT_RATE = 48000.5
+FREQ_DEV = 50000
+MESSAGES = ["Love is all you need", "Hello humans"]
+NUM_RECORDINGS = 20
+SNR_DB_VALUES = [12, 30, 40]
+CLOCK_ERRORS = [0.0, 0.003, -0.003]   # Transmitter bit-rate error the loop has to track
+MAX_GAP_SAMPLES = 200000
+BLOCK_SIZE = 2**15
+
+
+def synthesize_recording(rng, snr_db, clock_error):
+    """
+    Baseband recording of every message as a preamble + sync word + length frame,
+    with random noise gaps before, between and after. Returns complex64 samples.
+    """
+    samples_per_bit = SAMPLE_RATE / (BIT_RATE * (1 + clock_error))
+    frequency, amplitude = [], []
+    for message in MESSAGES:
+        gap = int(rng.integers(2000, MAX_GAP_SAMPLES))
+        frequency.append(np.zeros(gap)); amplitude.append(np.zeros(gap))
+        payload = FSK_SYNC_WORD + bytes([len(message)]) + message.encode()
+        bits = np.concatenate([np.tile([1, 0], FSK_PREAMBLE_BITS // 2), np.unpackbits(np.frombuffer(payload, dtype=np.uint8))])
+        bit_index = (np.arange(int(len(bits) * samples_per_bit)) / samples_per_bit).astype(np.int64)
+        frequency.append(np.where(bits[bit_index] == 1, FREQ_DEV, -FREQ_DEV)); amplitude.append(np.ones(len(bit_index)))
+    tail = int(rng.integers(2000, MAX_GAP_SAMPLES))
+    frequency.append(np.zeros(tail)); amplitude.append(np.zeros(tail))
+
+    frequency, amplitude = np.concatenate(frequency), np.concatenate(amplitude)
+    signal = amplitude * np.exp(2j * np.pi * np.cumsum(frequency) / SAMPLE_RATE + 1j * rng.uniform(0, 2 * np.pi))
+    noise = (rng.standard_normal(len(signal)) + 1j * rng.standard_normal(len(signal))) * 10 ** (-snr_db / 20) / np.sqrt(2)
+    return (signal + noise).astype(np.complex64)
+
+
+def find_messages(samples):
+    """
+    Returns (pattern-search matches, frame-reader payloads) as sets of strings.
+    """
+    decimator = FIRDecimator(SAMPLE_RATE, BIT_RATE, FREQ_DEV)
+    demod = StreamingFSKDemod(decimator.output_rate, BIT_RATE, FREQ_DEV, -FREQ_DEV)
+    slicer = TimingRecoverySlicer(demod.samples_per_bit_float, demod.threshold_freq, FREQ_DEV)
+    search = StreamingPatternSearch(strings_to_bit_patterns(MESSAGES))
+    frame_reader = StreamingFrameReader(decimator.output_rate, BIT_RATE, FREQ_DEV, FREQ_DEV, -FREQ_DEV)
+    found, frames = set(), set()
+    for block_start in range(0, len(samples), BLOCK_SIZE):
+        filtered_frequency, _ = demod.process(decimator.process(samples[block_start:block_start + BLOCK_SIZE]))
+        found.update(key for _, key, _ in search.process(*slicer.process(filtered_frequency)))
+        final = block_start + BLOCK_SIZE >= len(samples)
+        frames.update(payload.decode('ascii', errors='replace') for _, payload in frame_reader.process(filtered_frequency, final))
+    return found, frames
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(2025)
+    failures = 0
+    for snr_db in SNR_DB_VALUES:
+        for clock_error in CLOCK_ERRORS:
+            missed = missed_frames = 0
+            for _ in range(NUM_RECORDINGS):
+                found, frames = find_messages(synthesize_recording(rng, snr_db, clock_error))
+                missed += len(set(MESSAGES) - found)
+                missed_frames += len(set(MESSAGES) - frames)
+            failures += missed + missed_frames
+            print(f"SNR {snr_db:>2} dB, clock error {clock_error:+.1%}: pattern search missed {missed}, "
+                  f"frame reader missed {missed_frames} of {NUM_RECORDINGS * len(MESSAGES)} messages")
+    print("OK" if failures == 0 else f"FAILED: {failures} messages missed")
+    sys.exit(1 if failures else 0)
@@ -1,12 +1,21 @@
 import numpy as np
-import scipy.signal as signal
 from scipy.io import wavfile
 import string
 import os
 import time
 import heapq
 import json
-import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fsk_demod import (
+    StreamingFSKDemod, StreamingFrameReader, TimingRecoverySlicer, StreamingPatternSearch,
+    FIRDecimator, strings_to_bit_patterns, estimate_fsk_parameters, FSKParameters
+)
+from iq_dsp import estimate_carrier_offset, NCOMixer, frequency_shift
+from iq_io import open_iq_recording, close_iq_recording, iter_iq_blocks, active_sample_ranges
+from burst_index import load_burst_index, detect_bursts, burst_sample_ranges, FreeSpaceSampler
+from analysis_cache import AnalysisCache
+from dataset_shards import DatasetShardWriter, is_shard_dataset, shard_part_dir, merge_shard_parts, SHARD_PARTS_DIR
 
 # --- WAV File and SDR Configuration (as recorded) ---
 WAV_FILE_PATH = 'NEW_baseband_433102020Hz_12-09-54_02-08-2025.wav'
@@ -17,6 +26,7 @@ fsk_bit_rate_bps = 48000.5
 fsk_freq_dev_hz = 50000
 f_mark = fsk_freq_dev_hz
 f_space = -fsk_freq_dev_hz
+FALLBACK_FSK_PARAMETERS = (fsk_bit_rate_bps, fsk_freq_dev_hz) # Restored before every recording when they are estimated
 
 # --- List of expected strings to find ---
 EXPECTED_STRINGS = ["Love is all you need", "Hello humans"]
@@ -24,15 +34,32 @@ EXPECTED_STRING_LENGTHS = {s: len(s) for s in EXPECTED_STRINGS} # Map strings to
 
 # --- Parameters for dataset generation ---
 DATASET_DIR = "dataset"
+DATASET_FORMAT = "shards" # "shards": packed .npy shards + example table (dataset_shards.py); "wav": one WAV per example
 NUM_CHUNKS_PER_STRING = 5
-SAMPLE_OFFSET_STEPS = [-500, -250, 0, 250, 500] # Offset from the found starting point
+SAMPLE_OFFSET_STEPS = [-500, -250, 0, 250, 500] # Offset from the found starting point (train.py also augments shard datasets on the fly)
 
-# --- TWEAKABLE RANGE FOR AUTOMATIC start_offset_bits SEARCH ---
-START_OFFSET_BITS_CANDIDATES = range(10, 500, 1)
+# --- Multi-recording mode: one recording per worker process, merged into DATASET_DIR ---
+# Every recording becomes DATASET_DIR/parts/<content hash>/ (shards only); recordings whose part
+# exists are skipped, so adding captures and re-running only processes the new ones.
+DATASET_RECORDINGS = [] # e.g. sorted(glob.glob('captures/*.wav')); empty: WAV_FILE_PATH alone, DATASET_DIR is rebuilt
+DATASET_WORKERS = None  # Worker processes (None: one per CPU)
 
-# --- HIGHLY OPTIMIZED: Narrowed search based on SDR waterfall plot ---
+# --- Pattern-search fallback: tolerated bit errors per message ---
+MAX_PATTERN_BIT_ERRORS = 0
+
+# --- Carrier offset: estimated from the burst spectrum; FREQ_OFFSET_CANDIDATES is the manual fallback ---
+AUTO_FREQ_OFFSET = True
 FREQ_OFFSET_CANDIDATES = [101000]
 
+# --- Burst index: search only the bursts listed in <recording>.bursts.json (built on first use) ---
+USE_BURST_INDEX = True
+
+# --- Bit rate and deviation: estimated from the indexed bursts; the values above are the fallback ---
+AUTO_FSK_PARAMETERS = True
+
+# --- Stage results (parameter estimates, frame search) are memoized per recording content and parameters ---
+USE_ANALYSIS_CACHE = True
+
 WAV_CHUNK_SIZE = 2**15
 
 # --- All functions remain unchanged from the previous version ---
@@ -41,25 +68,9 @@ def read_wav_data(file_path):
         print(f"ERROR: File does not exist at '{file_path}'. Please check the path.")
         return None, None
     try:
-        actual_wav_sample_rate, raw_audio_data = wavfile.read(file_path)
-        print(f"DEBUG: Loaded WAV file. Sample Rate: {actual_wav_sample_rate} Hz, Shape: {raw_audio_data.shape}, Dtype: {raw_audio_data.dtype}")
-        if raw_audio_data.ndim < 2 or raw_audio_data.shape[1] < 2:
-            raise ValueError(f"WAV file is not stereo ({raw_audio_data.ndim}D, channels: {raw_audio_data.shape[1] if raw_audio_data.ndim > 0 else 'N/A'}). Cannot extract I/Q.")
-        i_component = raw_audio_data[:, 0]
-        q_component = raw_audio_data[:, 1]
-        if raw_audio_data.dtype == np.int16:
-            max_int_val = np.iinfo(np.int16).max
-            i_component = i_component.astype(np.float32) / max_int_val
-            q_component = q_component.astype(np.float32) / max_int_val
-        elif raw_audio_data.dtype == np.float32:
-            i_component = i_component.astype(np.float32)
-            q_component = q_component.astype(np.float32)
-        else:
-            print(f"Warning: Unexpected WAV sample data type: {raw_audio_data.dtype}. Attempting conversion to float32 anyway.")
-            i_component = i_component.astype(np.float32)
-            q_component = q_component.astype(np.float32)
-        iq_samples_full = i_component + 1j * q_component
-        print(f"DEBUG: Extracted {len(iq_samples_full)} complex samples.")
+        # Memory-mapped WAV or SigMF/raw (cu8, ci8, ci16): float32 is a zero-copy complex64 view, integers convert per slice
+        iq_samples_full, actual_wav_sample_rate = open_iq_recording(file_path)
+        print(f"DEBUG: Mapped recording. Sample Rate: {actual_wav_sample_rate} Hz, Samples: {len(iq_samples_full)}, Type: {type(iq_samples_full).__name__}")
         return iq_samples_full, actual_wav_sample_rate
     except Exception as e:
         print(f"ERROR: An error occurred while reading WAV file: {e}")
@@ -72,104 +83,155 @@ def calculate_amplitude_entropy(iq_samples, num_bins=100):
     entropy = -np.sum(probabilities * np.log2(probabilities))
     return entropy
 
-def fsk_demodulate_and_decode(samples, sample_rate, bit_rate, freq_dev, mark_freq, space_freq, start_offset_bits_param, target_string_length, freq_offset_hz=0):
-    if len(samples) < 2: return None
-    if freq_offset_hz != 0:
-        t = np.arange(len(samples)) / sample_rate
-        complex_exp = np.exp(1j * 2 * np.pi * freq_offset_hz * t)
-        samples = samples * complex_exp
-    phase = np.unwrap(np.arctan2(samples.imag, samples.real))
-    instantaneous_frequency = np.diff(phase) * (sample_rate / (2 * np.pi))
-    nyquist = 0.5 * sample_rate
-    cutoff_norm = (bit_rate * 2) / nyquist
-    if cutoff_norm >= 1.0: filtered_frequency = instantaneous_frequency
-    else: b, a = signal.butter(5, cutoff_norm, btype='low'); filtered_frequency = signal.lfilter(b, a, instantaneous_frequency)
-    threshold_freq = (mark_freq + space_freq) / 2
-    samples_per_bit_float = sample_rate / bit_rate
-    raw_bits = []
-    num_bits_to_decode = target_string_length * 8
-    current_sample_index_float = float(samples_per_bit_float * start_offset_bits_param)
-    for bit_count_in_loop in range(num_bits_to_decode):
-        sample_index = int(current_sample_index_float + 0.5) 
-        if sample_index < len(filtered_frequency):
-            bit = 1 if filtered_frequency[sample_index] > threshold_freq else 0
-            raw_bits.append(bit)
-        else:
-            break 
-        current_sample_index_float += samples_per_bit_float
-    if len(raw_bits) < num_bits_to_decode: return None
-    decoded_bytes = bytearray(); byte_value = 0; bit_count = 0
-    for bit in raw_bits[:num_bits_to_decode]:
-        byte_value = (byte_value << 1) | bit; bit_count += 1
-        if bit_count == 8: decoded_bytes.append(byte_value); byte_value = 0; bit_count = 0
-    try:
-        decoded_string = decoded_bytes.decode('ascii', errors='replace')
-        if len(decoded_string) < target_string_length:
-            decoded_string += ' ' * (target_string_length - len(decoded_string))
-        elif len(decoded_string) > target_string_length:
-            decoded_string = decoded_string[:target_string_length]
-        return decoded_string
-    except Exception as e: return "[Error during final string assembly]"
-
-# --- NEW FUNCTION: Searches for exact matches for the given strings ---
-def find_exact_matches(full_iq_samples, sdr_sample_rate, expected_strings, freq_offset):
+# --- Frames are located with the preamble/sync-word correlator and only their payloads are decoded.
+# The recording is channel-filtered and decimated to a few samples per bit, then demodulated as one
+# continuous stream (filter/phase state carried between chunks), so messages straddling a
+# WAV_CHUNK_SIZE boundary are decoded like any other. Reported positions are at the full sample rate.
+def find_exact_matches(full_iq_samples, sdr_sample_rate, expected_strings, freq_offset, sample_ranges=None):
     found_matches = {s: None for s in expected_strings}
-    sorted_expected_strings = sorted(expected_strings, key=len, reverse=True)
-    all_found_flag = False
+    samples_per_bit_float = sdr_sample_rate / fsk_bit_rate_bps
 
-    t = np.arange(len(full_iq_samples)) / sdr_sample_rate
-    samples_with_offset = full_iq_samples * np.exp(1j * 2 * np.pi * freq_offset * t)
+    decimator = FIRDecimator(sdr_sample_rate, fsk_bit_rate_bps, fsk_freq_dev_hz)
+    demod = StreamingFSKDemod(decimator.output_rate, fsk_bit_rate_bps, f_mark, f_space)
+    frame_reader = StreamingFrameReader(decimator.output_rate, fsk_bit_rate_bps, fsk_freq_dev_hz, f_mark, f_space,
+                                        max_payload_bytes=max(len(s) for s in expected_strings))
+    print(f"Decimating by {decimator.decimation} to {decimator.output_rate / 1e3:.1f} kS/s ({decimator.output_rate / fsk_bit_rate_bps:.2f} samples/bit) before demodulation.")
 
-    for i in range(0, len(full_iq_samples), WAV_CHUNK_SIZE):
-        if all_found_flag:
-            break
+    mixer = NCOMixer(freq_offset, sdr_sample_rate)
 
-        chunk_samples = samples_with_offset[i : i + WAV_CHUNK_SIZE]
-        if not chunk_samples.any(): continue
+    # Only sample_ranges (e.g. burst regions) are read, archives otherwise skip their quiet blocks;
+    # every range is demodulated as its own stream
+    if sample_ranges is None:
+        sample_ranges = active_sample_ranges(full_iq_samples)
+    for range_start, range_end in sample_ranges:
+        for stage in (mixer, decimator, demod, frame_reader):
+            stage.reset()
+
+        for block in iter_iq_blocks(full_iq_samples, sdr_sample_rate, WAV_CHUNK_SIZE, start_index=range_start, end_index=range_end):
+            chunk_samples = mixer.process(block.samples)
+            filtered_frequency, _ = demod.process(decimator.process(chunk_samples))
+            is_last_chunk = block.start_index + len(block.samples) >= range_end
+
+            for payload_start, payload in frame_reader.process(filtered_frequency, final=is_last_chunk):
+                decoded_text = payload.decode('ascii', errors='replace')
+                if decoded_text not in found_matches or found_matches[decoded_text]:
+                    continue
+                payload_start = range_start + max(0.0, decimator.to_input_index(payload_start))
+                chunk_start = int(payload_start) // WAV_CHUNK_SIZE * WAV_CHUNK_SIZE
+                bit_offset = round(float(payload_start - chunk_start) / samples_per_bit_float, 3)
+                found_matches[decoded_text] = {
+                    "Chunk Start": chunk_start,
+                    "Bit Offset": bit_offset,
+                    "Freq Offset": freq_offset,
+                    "String": decoded_text
+                }
+                print(f"  --> FOUND: '{decoded_text}' at Chunk Start: {chunk_start}, Bit Offset: {bit_offset}, Freq Offset: {freq_offset} Hz")
+
+            if all(found_matches.values()):
+                return found_matches
 
-        for expected_string in sorted_expected_strings:
-            if found_matches[expected_string]:
-                continue
-            
-            length = len(expected_string)
-            if len(chunk_samples) < (length * 8 / fsk_bit_rate_bps):
-                continue
-            
-            for offset in range(10, 500, 1):
-                decoded_text = fsk_demodulate_and_decode(
-                    chunk_samples, sdr_sample_rate, fsk_bit_rate_bps,
-                    fsk_freq_dev_hz, f_mark, f_space, offset, length,
-                    freq_offset_hz=0
-                )
-                
-                if decoded_text and decoded_text.strip() == expected_string:
-                    found_matches[expected_string] = {
-                        "Chunk Start": i,
-                        "Bit Offset": offset,
-                        "Freq Offset": freq_offset,
-                        "String": decoded_text.strip()
-                    }
-                    print(f"  --> FOUND: '{expected_string}' at Chunk Start: {i}, Bit Offset: {offset}, Freq Offset: {freq_offset} Hz")
-
-                    if all(found_matches.values()):
-                        all_found_flag = True
-                        break
-            if all_found_flag:
-                break
-        if all_found_flag:
-            break
-            
     return found_matches
 
-# --- NEW FUNCTION: Creates folders, generates WAV files and metadata ---
-def create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches, dataset_dir, expected_strings):
+# --- Fallback for captures whose preamble/sync word is not recognised: single-pass pattern search ---
+# EXPECTED_STRINGS are converted to bit patterns once and searched for together in the continuous
+# hard-decision bit stream, sliced on a recovered (Gardner) bit clock. Cost scales with recording length only.
+def find_exact_matches_by_pattern_search(full_iq_samples, sdr_sample_rate, expected_strings, freq_offset, max_bit_errors=MAX_PATTERN_BIT_ERRORS, sample_ranges=None):
+    found_matches = {s: None for s in expected_strings}
+    samples_per_bit_float = sdr_sample_rate / fsk_bit_rate_bps
+    bit_patterns = strings_to_bit_patterns(expected_strings)
+
+    decimator = FIRDecimator(sdr_sample_rate, fsk_bit_rate_bps, fsk_freq_dev_hz)
+    demod = StreamingFSKDemod(decimator.output_rate, fsk_bit_rate_bps, f_mark, f_space)
+    slicer = TimingRecoverySlicer(demod.samples_per_bit_float, demod.threshold_freq, fsk_freq_dev_hz)
+    search = StreamingPatternSearch(bit_patterns, max_bit_errors)
+
+    mixer = NCOMixer(freq_offset, sdr_sample_rate)
+
+    # Bit clock and pattern tail start fresh on every burst: without burst ranges from the
+    # caller the bursts are detected here (one extra pass), not the whole recording sliced as one stream
+    if sample_ranges is None:
+        bursts = detect_bursts(full_iq_samples, sdr_sample_rate)
+        sample_ranges = burst_sample_ranges(bursts, sdr_sample_rate, len(full_iq_samples)) if bursts else active_sample_ranges(full_iq_samples)
+    for range_start, range_end in sample_ranges:
+        for stage in (mixer, decimator, demod, slicer, search):
+            stage.reset()
+
+        for block in iter_iq_blocks(full_iq_samples, sdr_sample_rate, WAV_CHUNK_SIZE, start_index=range_start, end_index=range_end):
+            chunk_samples = mixer.process(block.samples)
+            filtered_frequency, _ = demod.process(decimator.process(chunk_samples))
+
+            bits, positions = slicer.process(filtered_frequency)
+            for position, expected_string, bit_errors in search.process(bits, positions):
+                if found_matches[expected_string]:
+                    continue
+                # Strobe (mid-bit) of the first bit -> start of that bit at the full sample rate
+                bit_start = decimator.to_input_index(position - slicer.tracked_samples_per_bit / 2)
+                bit_start = range_start + max(0.0, bit_start)
+                chunk_start = int(bit_start) // WAV_CHUNK_SIZE * WAV_CHUNK_SIZE
+                bit_offset = round(float(bit_start - chunk_start) / samples_per_bit_float, 3)
+                found_matches[expected_string] = {
+                    "Chunk Start": chunk_start,
+                    "Bit Offset": bit_offset,
+                    "Freq Offset": freq_offset,
+                    "String": expected_string,
+                    "Bit Errors": int(bit_errors)
+                }
+                print(f"  --> FOUND: '{expected_string}' at Chunk Start: {chunk_start}, Bit Offset: {bit_offset}, Freq Offset: {freq_offset} Hz ({bit_errors} bit errors)")
+
+            if all(found_matches.values()):
+                return found_matches
+
+    return found_matches
+
+def cached_stage(cache, stage, compute, *inputs, **params):
+    """
+    compute() memoized in the analysis cache under (stage, inputs, params); runs it directly without a cache.
+    """
+    if cache is None:
+        return compute()
+    key = cache.key(stage, *inputs, **params)
+    return cache.json(key, compute)
+
+def write_wav_example(dataset_dir, label, file_name, samples, sample_rate):
+    """
+    Writes one example as an int16 stereo WAV in the label's folder (DATASET_FORMAT = "wav").
+    """
+    label_dir = os.path.join(dataset_dir, label.replace(" ", "_")) # Create folder name from string
+    os.makedirs(label_dir, exist_ok=True)
+    i_data = (samples.real * 32767).astype(np.int16)
+    q_data = (samples.imag * 32767).astype(np.int16)
+    wavfile.write(os.path.join(label_dir, file_name), int(sample_rate), np.stack([i_data, q_data], axis=1))
+
+# --- NEW FUNCTION: Creates folders, generates WAV files (or shards) and metadata ---
+def create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches, dataset_dir, expected_strings, source_path=WAV_FILE_PATH, exclude_ranges=()):
+    noise_chunk_length = 32768 # Use a standard chunk size for noise
+    num_noise_chunks_to_create = 5
+
+    # "random" chunks are drawn, without overlapping each other, from the free space outside the found
+    # signals and exclude_ranges (e.g. every indexed burst); it is checked before anything is written.
+    signal_regions = list(exclude_ranges)
+    for expected_string in expected_strings:
+        match_info = found_matches.get(expected_string)
+        if match_info:
+            length_in_samples = int(len(expected_string) * 8 * (sdr_sample_rate / fsk_bit_rate_bps))
+            signal_regions.append((match_info['Chunk Start'] - 1000, match_info['Chunk Start'] + length_in_samples + 1000)) # Add a buffer
+    noise_sampler = FreeSpaceSampler(signal_regions, len(full_iq_samples), noise_chunk_length)
+    if noise_sampler.num_windows < num_noise_chunks_to_create:
+        print(f"ERROR: Only {noise_sampler.num_windows} noise chunks of {noise_chunk_length} samples fit outside the signal regions, "
+              f"{num_noise_chunks_to_create} needed. Dataset not written.")
+        return False
+
     if os.path.exists(dataset_dir):
         print(f"Folder '{dataset_dir}' already exists. Deleting...")
-        import shutil
         shutil.rmtree(dataset_dir)
     os.makedirs(dataset_dir)
 
     metadata = {}
+    shard_writer = None
+    if DATASET_FORMAT == "shards":
+        # Every example padded to the longest one (the table keeps the real lengths)
+        longest_message = int(max(len(s) for s in expected_strings) * 8 * (sdr_sample_rate / fsk_bit_rate_bps))
+        shard_writer = DatasetShardWriter(dataset_dir, max(longest_message, noise_chunk_length), sdr_sample_rate)
     print("\n--- Generating dataset ---")
 
     for expected_string in expected_strings:
@@ -178,9 +240,6 @@ def create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches,
             print(f"Message '{expected_string}' not found. Skipping.")
             continue
         
-        string_dir = os.path.join(dataset_dir, expected_string.replace(" ", "_")) # Create folder name from string
-        os.makedirs(string_dir)
-        
         start_sample_index = match_info['Chunk Start']
         bit_offset = match_info['Bit Offset']
         length_in_samples = int(len(expected_string) * 8 * (sdr_sample_rate / fsk_bit_rate_bps))
@@ -199,68 +258,40 @@ def create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches,
 
             # Extracting I/Q data and applying frequency correction
             raw_chunk = full_iq_samples[start_capture_index:end_capture_index]
-            t_chunk = np.arange(len(raw_chunk)) / sdr_sample_rate
             freq_offset = match_info['Freq Offset']
-            corrected_chunk = raw_chunk * np.exp(1j * 2 * np.pi * freq_offset * t_chunk)
+            corrected_chunk = frequency_shift(raw_chunk, freq_offset, sdr_sample_rate)
             
-            # Converting to 16-bit format for the WAV file
-            i_data = (corrected_chunk.real * 32767).astype(np.int16)
-            q_data = (corrected_chunk.imag * 32767).astype(np.int16)
-            stereo_data = np.stack([i_data, q_data], axis=1)
+            if shard_writer is not None:
+                example_index = shard_writer.add(corrected_chunk, expected_string, source_path, start_capture_index, freq_offset)
+                print(f"  - Stored example {example_index} for '{expected_string}'")
+                continue
 
-            # Saving the file
+            # Saving the file and adding metadata
             file_name = f"{i+1}.wav"
-            file_path = os.path.join(string_dir, file_name)
-            wavfile.write(file_path, int(sdr_sample_rate), stereo_data)
-            
-            # Adding metadata
+            write_wav_example(dataset_dir, expected_string, file_name, corrected_chunk, sdr_sample_rate)
             metadata[file_name] = expected_string
             print(f"  - Saved {file_name} for '{expected_string}'")
 
     # --- Generate noise chunks ---
     print("\n--- Generating dataset: Creating noise chunks ---")
-    noise_dir = os.path.join(dataset_dir, "random")
-    os.makedirs(noise_dir)
-    
-    # We will pick 5 random chunks from the entire file, but avoid the signal areas.
-    # First, find the locations of the signals to avoid them.
-    signal_starts = [match['Chunk Start'] for match in found_matches.values()]
-    signal_lengths = [len(s) for s in expected_strings]
-    signal_regions = []
-    for start, length in zip(signal_starts, signal_lengths):
-        length_in_samples = int(length * 8 * (sdr_sample_rate / fsk_bit_rate_bps))
-        signal_regions.append((start - 1000, start + length_in_samples + 1000)) # Add a buffer
-
-    total_samples = len(full_iq_samples)
-    noise_chunk_length = 32768 # Use a standard chunk size for noise
-    num_noise_chunks_to_create = 5
-    noise_chunks_created = 0
 
-    while noise_chunks_created < num_noise_chunks_to_create:
-        start_index = random.randint(0, total_samples - noise_chunk_length)
-        end_index = start_index + noise_chunk_length
-        
-        # Check if the random chunk overlaps with any signal region
-        is_in_signal_region = False
-        for signal_start, signal_end in signal_regions:
-            if not (end_index < signal_start or start_index > signal_end):
-                is_in_signal_region = True
-                break
-        
-        if not is_in_signal_region:
-            noise_chunk = full_iq_samples[start_index:end_index]
-            
-            i_data = (noise_chunk.real * 32767).astype(np.int16)
-            q_data = (noise_chunk.imag * 32767).astype(np.int16)
-            stereo_data = np.stack([i_data, q_data], axis=1)
-            
+    for noise_chunks_created, start_index in enumerate(noise_sampler.sample(num_noise_chunks_to_create)):
+        start_index = int(start_index)
+        noise_chunk = full_iq_samples[start_index:start_index + noise_chunk_length]
+
+        if shard_writer is not None:
+            example_index = shard_writer.add(noise_chunk, "random", source_path, start_index)
+            print(f"  - Stored example {example_index} for 'random'")
+        else:
             file_name = f"random_{noise_chunks_created + 1}.wav"
-            file_path = os.path.join(noise_dir, file_name)
-            wavfile.write(file_path, int(sdr_sample_rate), stereo_data)
-            
+            write_wav_example(dataset_dir, "random", file_name, noise_chunk, sdr_sample_rate)
             metadata[file_name] = "random"
             print(f"  - Saved {file_name} for 'random'")
-            noise_chunks_created += 1
+
+    if shard_writer is not None:
+        shard_writer.close()
+        print(f"\nDataset generation complete. {len(shard_writer.table)} examples in {len(shard_writer.shards)} shard(s) in '{dataset_dir}'.")
+        return True
 
     json_path = os.path.join(dataset_dir, 'metadata.json')
     with open(json_path, 'w') as f:
@@ -269,27 +300,145 @@ def create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches,
     print(f"\nDataset generation complete. Metadata saved to '{json_path}'.")
     return True
 
-if __name__ == "__main__":
-    print(f"--- Script for FSK signal dataset generation ---")
-    print(f"Searching for exact strings: {EXPECTED_STRINGS}")
-    
-    full_iq_samples, actual_sdr_sample_rate = read_wav_data(WAV_FILE_PATH)
+def process_recording(recording_path, dataset_dir, expected_strings=EXPECTED_STRINGS):
+    """
+    Full pipeline for one recording: burst index, FSK parameters, carrier offset,
+    frame search and example extraction into dataset_dir. Returns True when all
+    expected strings were found and the dataset was written.
+    """
+    global fsk_bit_rate_bps, fsk_freq_dev_hz, f_mark, f_space
+    if AUTO_FSK_PARAMETERS:
+        fsk_bit_rate_bps, fsk_freq_dev_hz = FALLBACK_FSK_PARAMETERS # Not the previous recording's estimate
+        f_mark, f_space = fsk_freq_dev_hz, -fsk_freq_dev_hz
+
+    full_iq_samples, actual_sdr_sample_rate = read_wav_data(recording_path)
 
     if full_iq_samples is None:
-        print("\nFailed to load WAV file. Exiting.")
-        exit()
+        print("\nFailed to load WAV file.")
+        return False
 
-    sdr_sample_rate = actual_sdr_sample_rate
-    
-    print("\n--- Stage 1: Searching for exact signal coordinates ---")
-    found_matches = find_exact_matches(full_iq_samples, sdr_sample_rate, EXPECTED_STRINGS, FREQ_OFFSET_CANDIDATES[0])
+    try:
+        sdr_sample_rate = actual_sdr_sample_rate
+        analysis_cache = AnalysisCache() if USE_ANALYSIS_CACHE else None
+        recording_hash = analysis_cache.file_hash(recording_path) if analysis_cache else None
+
+        # Burst regions from the recording's sidecar index (built on first use); None scans everything
+        burst_ranges = None
+        if USE_BURST_INDEX:
+            bursts = load_burst_index(recording_path, full_iq_samples, sdr_sample_rate)
+            if bursts:
+                burst_ranges = burst_sample_ranges(bursts, sdr_sample_rate, len(full_iq_samples))
+                print(f"Searching {len(bursts)} bursts ({sum(end - start for start, end in burst_ranges) / len(full_iq_samples):.1%} of the recording).")
+
+        if AUTO_FSK_PARAMETERS and burst_ranges is not None:
+            estimated = cached_stage(analysis_cache, 'fsk_parameters', lambda: estimate_fsk_parameters(full_iq_samples, sdr_sample_rate, bursts),
+                                     recording_hash, bursts=bursts)
+            if estimated is not None:
+                estimated = FSKParameters(*estimated)
+                fsk_bit_rate_bps, fsk_freq_dev_hz = estimated.bit_rate, estimated.freq_dev
+                f_mark, f_space = fsk_freq_dev_hz, -fsk_freq_dev_hz
+                print(f"Estimated from {estimated.num_bursts} bursts: {fsk_bit_rate_bps:.1f} bps, deviation {fsk_freq_dev_hz:.0f} Hz.")
+            else:
+                print(f"No clear bit-rate line in the bursts; keeping {fsk_bit_rate_bps} bps, deviation {fsk_freq_dev_hz} Hz.")
+
+        freq_offset = FREQ_OFFSET_CANDIDATES[0]
+        if AUTO_FREQ_OFFSET:
+            signal_bandwidth_hz = 2 * (fsk_freq_dev_hz + fsk_bit_rate_bps)
+            carrier_offset_hz = cached_stage(analysis_cache, 'carrier_offset', lambda: estimate_carrier_offset(full_iq_samples, sdr_sample_rate, signal_bandwidth_hz=signal_bandwidth_hz),
+                                             recording_hash, signal_bandwidth_hz=signal_bandwidth_hz)
+            if carrier_offset_hz is not None:
+                freq_offset = -carrier_offset_hz
+        print(f"Frequency correction applied: {freq_offset:.0f} Hz")
+
+        print("\n--- Stage 1: Searching for exact signal coordinates ---")
+        # Everything the demodulator depends on; a cached search is reused only when all of it matches
+        search_params = dict(bit_rate=fsk_bit_rate_bps, freq_dev=fsk_freq_dev_hz, f_mark=f_mark, f_space=f_space,
+                             freq_offset=freq_offset, sample_ranges=burst_ranges, chunk_size=WAV_CHUNK_SIZE)
+        found_matches = cached_stage(analysis_cache, 'frame_search', lambda: find_exact_matches(full_iq_samples, sdr_sample_rate, expected_strings, freq_offset, burst_ranges),
+                                     recording_hash, strings=expected_strings, **search_params)
+
+        missing_strings = [s for s, info in found_matches.items() if not info]
+        if missing_strings:
+            print(f"Frame sync did not find {missing_strings}. Falling back to bit-pattern search...")
+            found_matches.update(cached_stage(analysis_cache, 'pattern_search', lambda: find_exact_matches_by_pattern_search(full_iq_samples, sdr_sample_rate, missing_strings, freq_offset, sample_ranges=burst_ranges),
+                                              recording_hash, strings=missing_strings, max_bit_errors=MAX_PATTERN_BIT_ERRORS, **search_params))
+
+        if all(found_matches.values()):
+            print("\n--- Stage 2: Generating dataset files ---")
+            return create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches, dataset_dir, expected_strings, recording_path,
+                                              exclude_ranges=burst_ranges or ())
+        else:
+            print("\n--- Search did not complete successfully ---")
+            for s, info in found_matches.items():
+                if not info:
+                    print(f"Message '{s}' not found.")
+            print("Please make sure that the WAV file contains both messages.")
+            return False
+    finally:
+        close_iq_recording(full_iq_samples)
+
+def build_recording_part(recording_path, dataset_dir):
+    """
+    Multi-recording worker: writes recording_path as the part named after its
+    content hash, unless that part exists. The part is built under a hidden
+    name and renamed when complete; if another worker renamed the same part in
+    first, its copy is kept. Returns (recording_path, part_name, status) with
+    status 'built', 'skipped' or 'failed'.
+    """
+    part_name = AnalysisCache().file_hash(recording_path)
+    part_dir = shard_part_dir(dataset_dir, part_name)
+    if is_shard_dataset(part_dir):
+        return recording_path, part_name, 'skipped'
+    partial_dir = shard_part_dir(dataset_dir, f".{part_name}.{os.getpid()}")
+    try:
+        if not process_recording(recording_path, partial_dir):
+            return recording_path, part_name, 'failed'
+        try:
+            os.replace(partial_dir, part_dir)
+        except OSError:
+            if not is_shard_dataset(part_dir):
+                raise
+            return recording_path, part_name, 'skipped'
+    finally:
+        shutil.rmtree(partial_dir, ignore_errors=True)
+    return recording_path, part_name, 'built'
+
+def create_dataset_from_recordings(recording_paths, dataset_dir, workers=DATASET_WORKERS):
+    """
+    Processes recordings in parallel (one per worker) and merges every finished
+    part into dataset_dir as it arrives. Recordings with identical content are
+    processed once. Returns the number of examples.
+    """
+    if DATASET_FORMAT != "shards":
+        print(f"Multi-recording mode writes shards only (DATASET_FORMAT is '{DATASET_FORMAT}').")
+        return 0
+    os.makedirs(os.path.join(dataset_dir, SHARD_PARTS_DIR), exist_ok=True)
+    num_examples = merge_shard_parts(dataset_dir)
+    hasher = AnalysisCache()
+    unique_paths = {}
+    for path in recording_paths:
+        part_name = hasher.file_hash(path)
+        if part_name in unique_paths:
+            print(f"  {os.path.basename(path)} ({part_name}): same content as {os.path.basename(unique_paths[part_name])}, skipped")
+        else:
+            unique_paths[part_name] = path
+    recording_paths = list(unique_paths.values())
+    print(f"Processing {len(recording_paths)} recordings with {workers or os.cpu_count()} workers ({num_examples} examples already in '{dataset_dir}')...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_recording_part, path, dataset_dir) for path in recording_paths]
+        for future in as_completed(futures):
+            recording_path, part_name, status = future.result()
+            if status == 'built':
+                num_examples = merge_shard_parts(dataset_dir)
+            print(f"  {os.path.basename(recording_path)} ({part_name}): {status}, dataset now {num_examples} examples")
+    return num_examples
+
+if __name__ == "__main__":
+    print(f"--- Script for FSK signal dataset generation ---")
+    print(f"Searching for exact strings: {EXPECTED_STRINGS}")
 
-    if all(found_matches.values()):
-        print("\n--- Stage 2: Generating dataset files ---")
-        create_dataset_from_chunks(full_iq_samples, sdr_sample_rate, found_matches, DATASET_DIR, EXPECTED_STRINGS)
+    if DATASET_RECORDINGS:
+        num_examples = create_dataset_from_recordings(DATASET_RECORDINGS, DATASET_DIR)
+        print(f"\nDataset complete: {num_examples} examples in '{DATASET_DIR}'.")
     else:
-        print("\n--- Search did not complete successfully ---")
-        for s, info in found_matches.items():
-            if not info:
-                print(f"Message '{s}' not found.")
-        print("Please make sure that the WAV file contains both messages.")
+        process_recording(WAV_FILE_PATH, DATASET_DIR)
@@ -0,0 +1,233 @@
+import numpy as np
+import json
+import os
+from iq_io import SIGMF_DATATYPES, LazyIQArray, quantize_iq
+
+# --- Packed dataset shards (<dataset_dir>/shard_NNNNN.npy + examples.npy + manifest.json) ---
+# Every example is padded to the dataset's example_length and stored as one row of a shard:
+# (rows, example_length, 2) interleaved values of a SigMF datatype (ci16_le by default, the scale of
+# the old int16 WAVs; cf32_le keeps complex64). examples.npy is the parallel table (label, shard,
+# row, length, source, offset, freq_offset), so both writing and reading are sequential bulk I/O.
+SHARD_MANIFEST_NAME = 'manifest.json'
+SHARD_TABLE_NAME = 'examples.npy'
+SHARD_DATATYPE = 'ci16_le'
+SHARD_TARGET_BYTES = 128 * 2**20     # Rows per shard = this / bytes per example (at least 1)
+SHARD_PARTS_DIR = 'parts'            # Multi-recording datasets: one complete shard dataset per recording in <dataset_dir>/parts/<name>/
+
+EXAMPLE_TABLE_DTYPE = np.dtype([
+    ('label', np.int32),          # Index into manifest['labels']
+    ('shard', np.int32),
+    ('row', np.int32),
+    ('length', np.int64),         # Samples before padding
+    ('source', np.int32),         # Index into manifest['sources']
+    ('offset', np.int64),         # First sample in the source recording
+    ('freq_offset', np.float32),  # Correction applied before storing (Hz)
+])
+
+
+def shard_file_name(shard_number):
+    return f'shard_{shard_number:05d}.npy'
+
+
+def is_shard_dataset(dataset_dir):
+    return os.path.exists(os.path.join(dataset_dir, SHARD_MANIFEST_NAME))
+
+
+def _index_of(names, name):
+    if name not in names:
+        names.append(name)
+    return names.index(name)
+
+
+class DatasetShardWriter:
+    """
+    Appends fixed-length I/Q examples to .npy shards. A shard is filled in
+    memory (at most SHARD_TARGET_BYTES) and saved in one write; close() saves
+    the last one plus the example table and manifest. Usable as a context manager.
+    """
+
+    def __init__(self, dataset_dir, example_length, sample_rate, datatype=SHARD_DATATYPE, target_bytes=SHARD_TARGET_BYTES):
+        if datatype not in SIGMF_DATATYPES:
+            raise ValueError(f"Unknown shard datatype '{datatype}'. Use one of {sorted(SIGMF_DATATYPES)}.")
+        self.dataset_dir = dataset_dir
+        self.example_length = int(example_length)
+        self.sample_rate = sample_rate
+        self.datatype = datatype
+        value_dtype = SIGMF_DATATYPES[datatype][0]
+        self.rows_per_shard = max(1, target_bytes // (self.example_length * 2 * value_dtype.itemsize))
+        self.buffer = np.zeros((self.rows_per_shard, self.example_length, 2), dtype=value_dtype)
+        self.rows_in_buffer = 0
+        self.shards = []
+        self.labels, self.sources = [], []
+        self.table = []
+        os.makedirs(dataset_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, samples, label, source='', offset=0, freq_offset=0.0):
+        """
+        Quantizes samples (complex, full scale 1.0) into the next row, truncating
+        or zero-padding to example_length. Returns the example index.
+        """
+        length = min(len(samples), self.example_length)
+        row = self.buffer[self.rows_in_buffer]
+        row[:length] = quantize_iq(samples[:length], self.datatype).reshape(-1, 2)
+        row[length:] = 0
+        self.table.append((_index_of(self.labels, label), len(self.shards), self.rows_in_buffer, length,
+                           _index_of(self.sources, os.path.basename(source)), offset, freq_offset))
+        self.rows_in_buffer += 1
+        if self.rows_in_buffer == self.rows_per_shard:
+            self._flush_shard()
+        return len(self.table) - 1
+
+    def _flush_shard(self):
+        if self.rows_in_buffer == 0:
+            return
+        name = shard_file_name(len(self.shards))
+        np.save(os.path.join(self.dataset_dir, name), self.buffer[:self.rows_in_buffer])
+        self.shards.append({'file': name, 'num_examples': self.rows_in_buffer})
+        self.rows_in_buffer = 0
+
+    def close(self):
+        self._flush_shard()
+        np.save(os.path.join(self.dataset_dir, SHARD_TABLE_NAME), np.array(self.table, dtype=EXAMPLE_TABLE_DTYPE))
+        manifest = {
+            'sample_rate': self.sample_rate,
+            'example_length': self.example_length,
+            'datatype': self.datatype,
+            'labels': self.labels,
+            'sources': self.sources,
+            'shards': self.shards,
+        }
+        with open(os.path.join(self.dataset_dir, SHARD_MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+class DatasetShards:
+    """
+    Read side of a shard dataset: the example table plus memory-mapped shards.
+    """
+
+    def __init__(self, dataset_dir):
+        with open(os.path.join(dataset_dir, SHARD_MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+        self.dataset_dir = dataset_dir
+        self.sample_rate = manifest['sample_rate']
+        self.example_length = manifest['example_length']
+        self.datatype = manifest['datatype']
+        self.label_names = manifest['labels']
+        self.sources = manifest['sources']
+        self.shard_files = [shard['file'] for shard in manifest['shards']]
+        self.table = np.load(os.path.join(dataset_dir, SHARD_TABLE_NAME))
+        self.shards = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def labels(self):
+        """Label string of every example."""
+        return [self.label_names[label] for label in self.table['label']]
+
+    def shard(self, shard_number):
+        if shard_number not in self.shards:
+            self.shards[shard_number] = np.load(os.path.join(self.dataset_dir, self.shard_files[shard_number]), mmap_mode='r')
+        return self.shards[shard_number]
+
+    def _decode(self, values, length):
+        _, scale, offset = SIGMF_DATATYPES[self.datatype]
+        return LazyIQArray(values, scale, offset)[:length]
+
+    def example(self, index):
+        """
+        complex64 samples of one example, without the padding.
+        """
+        entry = self.table[index]
+        return self._decode(self.shard(entry['shard'])[entry['row']], entry['length'])
+
+    def iter_examples(self):
+        """
+        Yields (index, complex64 samples) in storage order, reading each shard sequentially.
+        """
+        for shard_number in range(len(self.shard_files)):
+            shard = self.shard(shard_number)
+            for index in np.flatnonzero(self.table['shard'] == shard_number):
+                entry = self.table[index]
+                yield int(index), self._decode(shard[entry['row']], entry['length'])
+
+
+# --- Multi-recording datasets: parts merged by reference ---
+# Every recording is written as its own shard dataset under <dataset_dir>/parts/. The top-level table
+# and manifest are rebuilt from the parts (tables only, shards are referenced in place), so the merged
+# dataset reads like any other and adding a recording never rewrites existing shards.
+def shard_part_dir(dataset_dir, part_name):
+    return os.path.join(dataset_dir, SHARD_PARTS_DIR, part_name)
+
+
+def shard_parts(dataset_dir):
+    """
+    Sorted names of the complete parts of dataset_dir. Entries starting with
+    '.' are parts still being written and are ignored.
+    """
+    parts_dir = os.path.join(dataset_dir, SHARD_PARTS_DIR)
+    if not os.path.isdir(parts_dir):
+        return []
+    return sorted(name for name in os.listdir(parts_dir)
+                  if not name.startswith('.') and is_shard_dataset(os.path.join(parts_dir, name)))
+
+
+def _replace_file(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def merge_shard_parts(dataset_dir):
+    """
+    Rebuilds the example table and manifest of dataset_dir from all of its
+    complete parts, remapping label, source and shard indices. Parts must share
+    sample rate and datatype. Returns the number of examples.
+    """
+    part_names = shard_parts(dataset_dir)
+    labels, sources, shards, tables = [], [], [], []
+    sample_rate, example_length, datatype = None, 0, None
+    for part_name in part_names:
+        part_dir = shard_part_dir(dataset_dir, part_name)
+        with open(os.path.join(part_dir, SHARD_MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+        if datatype is None:
+            sample_rate, datatype = manifest['sample_rate'], manifest['datatype']
+        elif (manifest['sample_rate'], manifest['datatype']) != (sample_rate, datatype):
+            raise ValueError(f"Part '{part_name}' is {manifest['datatype']} at {manifest['sample_rate']} Hz, "
+                             f"the dataset {datatype} at {sample_rate} Hz.")
+        example_length = max(example_length, manifest['example_length'])
+
+        table = np.load(os.path.join(part_dir, SHARD_TABLE_NAME))
+        table['label'] = np.array([_index_of(labels, name) for name in manifest['labels']], dtype=np.int32)[table['label']]
+        table['source'] = np.array([_index_of(sources, name) for name in manifest['sources']], dtype=np.int32)[table['source']]
+        table['shard'] += len(shards)
+        tables.append(table)
+        shards.extend({'file': os.path.join(SHARD_PARTS_DIR, part_name, shard['file']), 'num_examples': shard['num_examples']}
+                      for shard in manifest['shards'])
+
+    if not part_names:
+        return 0
+    table = np.concatenate(tables)
+    manifest = {
+        'sample_rate': sample_rate,
+        'example_length': example_length,  # Largest of the parts; rows keep their part's length
+        'datatype': datatype,
+        'labels': labels,
+        'sources': sources,
+        'shards': shards,
+        'parts': part_names,
+    }
+    # Table first, manifest last: a dataset is only picked up once its manifest exists
+    _replace_file(os.path.join(dataset_dir, SHARD_TABLE_NAME), lambda f: np.save(f, table))
+    _replace_file(os.path.join(dataset_dir, SHARD_MANIFEST_NAME), lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+    return len(table)
@@ -0,0 +1,24 @@
+import numpy as np
+import os
+
+# --- Debug dtype audit: flags silent promotion to complex128 / float64 on the DSP path ---
+# The pipeline runs in complex64 (I/Q) and float32 (frequency, spectrograms, model input).
+# Stage boundaries call audit_dtype(); with the audit off that is one global lookup. Turn it on
+# with SDR_DTYPE_AUDIT=1 in the environment or set_dtype_audit(True) before processing.
+DTYPE_AUDIT = os.environ.get('SDR_DTYPE_AUDIT', '0') not in ('', '0')
+
+
+def set_dtype_audit(enabled=True):
+    global DTYPE_AUDIT
+    DTYPE_AUDIT = enabled
+
+
+def audit_dtype(array, expected_dtype, stage):
+    """
+    With the audit enabled, raises TypeError when array (as returned by stage)
+    is not of expected_dtype. Returns array so it can wrap a return value.
+    """
+    if DTYPE_AUDIT and array.dtype != expected_dtype:
+        raise TypeError(f"dtype audit: {stage} returned {array.dtype}, expected {np.dtype(expected_dtype)} "
+                        f"(shape {array.shape}); look for a float64 constant or complex128 array upstream.")
+    return array
@@ -0,0 +1,727 @@
+import numpy as np
+import scipy.signal as signal
+from scipy.fft import rfft, irfft, rfftfreq, next_fast_len
+from scipy.ndimage import median_filter
+from collections import namedtuple
+from functools import lru_cache
+from dtype_audit import audit_dtype
+
+
+# --- Discriminator low-pass filter (designed once per rate pair) ---
+@lru_cache(maxsize=32)
+def design_discriminator_filter(sample_rate, bit_rate, order=5):
+    """
+    Returns the Butterworth low-pass used to smooth the discriminator output as
+    float32 second-order sections (stable in single precision, so sosfilt keeps
+    float32 data float32), or None when the 2x bit-rate cutoff is at or above Nyquist.
+    """
+    nyquist = 0.5 * sample_rate
+    cutoff_norm = (bit_rate * 2) / nyquist
+    if cutoff_norm >= 1.0:
+        return None
+    return signal.butter(order, cutoff_norm, btype='low', output='sos').astype(np.float32)
+
+
+# --- FM discriminator: phase difference -> low-pass filtered frequency ---
+def fsk_discriminate(samples, sample_rate, bit_rate):
+    """
+    Demodulates complex I/Q samples into the low-pass filtered instantaneous
+    frequency (Hz, float32). The result has len(samples) - 1 values.
+    """
+    samples = np.asarray(samples, dtype=np.complex64)
+    # Phase step of each sample against the previous one == np.diff(np.unwrap(phase)), without
+    # the unwrapped phase whose growing magnitude float32 cannot hold to the needed precision
+    instantaneous_frequency = np.angle(samples[1:] * np.conj(samples[:-1])) * np.float32(sample_rate / (2 * np.pi))
+    sos = design_discriminator_filter(float(sample_rate), float(bit_rate))
+    if sos is not None:
+        instantaneous_frequency = signal.sosfilt(sos, instantaneous_frequency)
+    return audit_dtype(instantaneous_frequency, np.float32, 'fsk_discriminate')
+
+
+# --- Frame format sent by RadioLib beginFSK (SX127x packet mode) ---
+FSK_PREAMBLE_BITS = 16                 # Preamble length passed to beginFSK in lora_transmitter.ino
+FSK_SYNC_WORD = bytes([0x12, 0xAD])    # RadioLib default FSK sync word
+FSK_LENGTH_FIELD_BITS = 8              # Variable-length packets start with a length byte
+FSK_MAX_PAYLOAD_BYTES = 64             # SX1278 FIFO size, upper bound for the length byte
+FRAME_SYNC_THRESHOLD = 0.7             # Normalized correlation needed to accept a frame
+
+
+# --- Hard-decision gather shared by every slicer ---
+def slice_bits(filtered_frequency, start_positions, samples_per_bit_float, num_bits, threshold_freq):
+    """
+    Samples filtered_frequency at start + k * samples_per_bit for every start
+    position (float sample index) and k in range(num_bits).
+
+    Returns (valid, raw_bits): a boolean mask over start_positions and a
+    (valid.sum(), num_bits) bool array of hard decisions for the valid rows.
+    """
+    start_positions = np.asarray(start_positions, dtype=np.float64)
+    sample_indices = (start_positions[:, None] + np.arange(num_bits)[None, :] * samples_per_bit_float + 0.5).astype(np.int64)
+    valid = (sample_indices[:, -1] < len(filtered_frequency)) & (sample_indices[:, 0] >= 0)
+    raw_bits = filtered_frequency[sample_indices[valid]] > threshold_freq
+    return valid, raw_bits
+
+
+# --- Vectorized slicer: every candidate bit offset in one gather ---
+def fsk_decode_all_offsets(filtered_frequency, sample_rate, bit_rate, mark_freq, space_freq, offsets_bits, target_string_length):
+    """
+    Slices the discriminator output at every candidate start offset (in bits)
+    at once and packs the hard decisions into bytes.
+
+    Returns (offsets, decoded) where decoded is a uint8 array of shape
+    (len(offsets), target_string_length). Offsets whose last bit would fall
+    past the end of filtered_frequency are dropped.
+    """
+    offsets = np.asarray(offsets_bits, dtype=np.int64)
+    threshold_freq = (mark_freq + space_freq) / 2
+    samples_per_bit_float = sample_rate / bit_rate
+
+    valid, raw_bits = slice_bits(filtered_frequency, offsets * samples_per_bit_float,
+                                 samples_per_bit_float, target_string_length * 8, threshold_freq)
+    return offsets[valid], np.packbits(raw_bits, axis=1)
+
+
+# --- Frame synchronization: preamble + sync word correlator ---
+def fsk_frame_template(preamble_bits=FSK_PREAMBLE_BITS, sync_word=FSK_SYNC_WORD):
+    """
+    Returns the NRZ (+1/-1) bit template of the 0xAA... preamble followed by the sync word.
+    """
+    preamble = np.tile([1, 0], preamble_bits // 2)
+    sync_bits = np.unpackbits(np.frombuffer(sync_word, dtype=np.uint8))
+    return np.concatenate([preamble, sync_bits]).astype(np.float32) * 2 - 1
+
+
+def find_frame_starts(filtered_frequency, sample_rate, bit_rate, freq_dev, preamble_bits=FSK_PREAMBLE_BITS, sync_word=FSK_SYNC_WORD, threshold=FRAME_SYNC_THRESHOLD):
+    """
+    Locates FSK frames by FFT cross-correlation of the normalized discriminator
+    output against the preamble + sync word waveform.
+
+    Returns the (float) sample indices into filtered_frequency of the boundary
+    of the first bit after the sync word, one per detected frame.
+    """
+    samples_per_bit_float = sample_rate / bit_rate
+    template_bits = fsk_frame_template(preamble_bits, sync_word)
+    template_length = int(round(len(template_bits) * samples_per_bit_float))
+    if len(filtered_frequency) < template_length:
+        return np.zeros(0)
+
+    # Rectangular NRZ waveform of the template at the working sample rate
+    template = template_bits[(np.arange(template_length) / samples_per_bit_float).astype(np.int64)]
+
+    normalized = np.clip(filtered_frequency * np.float32(1 / freq_dev), -1.0, 1.0)
+    correlation = signal.correlate(normalized, template, mode='valid', method='fft') / template_length
+    peaks, _ = signal.find_peaks(correlation, height=threshold, distance=template_length)
+    return peaks + len(template_bits) * samples_per_bit_float
+
+
+def fsk_read_frames(filtered_frequency, sample_rate, bit_rate, mark_freq, space_freq, frame_starts, max_payload_bytes=FSK_MAX_PAYLOAD_BYTES,
+                    timing_recovery=True):
+    """
+    Reads the length byte and payload of every frame found by find_frame_starts.
+
+    Returns a list of (payload_start, payload_bytes) tuples, where payload_start
+    is the float sample index of the first payload bit. Frames that are cut off
+    or carry an invalid length byte are skipped.
+
+    With timing_recovery, each frame is sliced by a TimingRecoverySlicer that
+    locks onto the preamble and sync word, so a transmitter clock a few tenths
+    of a percent off the nominal bit rate still decodes. Otherwise bits are
+    sampled open-loop, half a bit after each nominal boundary.
+    """
+    frame_starts = np.asarray(frame_starts, dtype=np.float64)
+    if frame_starts.size == 0:
+        return []
+    threshold_freq = (mark_freq + space_freq) / 2
+    samples_per_bit_float = sample_rate / bit_rate
+    if timing_recovery:
+        frames = (_read_frame_tracked(filtered_frequency, frame_start, samples_per_bit_float, threshold_freq,
+                                      abs(mark_freq - space_freq) / 2, max_payload_bytes) for frame_start in frame_starts)
+        return [frame for frame in frames if frame is not None]
+
+    valid, length_bits = slice_bits(filtered_frequency, frame_starts + samples_per_bit_float / 2, samples_per_bit_float,
+                                    FSK_LENGTH_FIELD_BITS, threshold_freq)
+    frame_starts = frame_starts[valid]
+    lengths = np.packbits(length_bits, axis=1)[:, 0].astype(np.int64)
+    keep = (lengths > 0) & (lengths <= max_payload_bytes)
+    frame_starts, lengths = frame_starts[keep], lengths[keep]
+    if frame_starts.size == 0:
+        return []
+
+    # One gather for every payload, sized for the longest one, then trimmed per frame
+    payload_starts = frame_starts + FSK_LENGTH_FIELD_BITS * samples_per_bit_float
+    payload_bytes = np.zeros((len(payload_starts), lengths.max()), dtype=np.uint8)
+    complete = np.zeros(len(payload_starts), dtype=bool)
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        valid, raw_bits = slice_bits(filtered_frequency, payload_starts[rows] + samples_per_bit_float / 2, samples_per_bit_float,
+                                     int(length) * 8, threshold_freq)
+        payload_bytes[rows[valid], :length] = np.packbits(raw_bits, axis=1)
+        complete[rows[valid]] = True
+
+    return [(float(payload_starts[r]), payload_bytes[r, :lengths[r]].tobytes())
+            for r in np.flatnonzero(complete)]
+
+
+def _read_frame_tracked(filtered_frequency, frame_start, samples_per_bit_float, threshold_freq, freq_dev, max_payload_bytes):
+    """
+    Slices one frame with a fresh TimingRecoverySlicer started at the preamble
+    (or as much of it as the buffer holds). Returns (payload_start, payload_bytes)
+    or None when the frame is cut off or its length byte is invalid.
+    """
+    lead_bits = int(min(FSK_PREAMBLE_BITS + len(FSK_SYNC_WORD) * 8, np.floor(frame_start / samples_per_bit_float)))
+    segment_start = frame_start - lead_bits * samples_per_bit_float
+    first_sample = int(np.floor(segment_start))
+    slicer = TimingRecoverySlicer(samples_per_bit_float, threshold_freq, freq_dev,
+                                  bit_phase=0.5 + (segment_start - first_sample) / samples_per_bit_float)
+
+    # Header first; the rest of the frame is fed once the length byte is known
+    header_end = int(np.ceil(frame_start + (FSK_LENGTH_FIELD_BITS + 1) * samples_per_bit_float))
+    bits, positions = slicer.process(filtered_frequency[first_sample:header_end])
+    if len(bits) < lead_bits + FSK_LENGTH_FIELD_BITS or header_end > len(filtered_frequency):
+        return None
+    length = int(np.packbits(bits[lead_bits:lead_bits + FSK_LENGTH_FIELD_BITS])[0])
+    if not 0 < length <= max_payload_bytes:
+        return None
+
+    payload_bit = lead_bits + FSK_LENGTH_FIELD_BITS
+    frame_end = int(np.ceil(frame_start + (FSK_LENGTH_FIELD_BITS + 8 * length + 1) * samples_per_bit_float))
+    more_bits, more_positions = slicer.process(filtered_frequency[header_end:frame_end])
+    bits, positions = np.concatenate([bits, more_bits]), np.concatenate([positions, more_positions])
+    if len(bits) < payload_bit + 8 * length:
+        return None
+    payload_start = first_sample + positions[payload_bit] - slicer.tracked_samples_per_bit / 2
+    return float(payload_start), np.packbits(bits[payload_bit:payload_bit + 8 * length]).tobytes()
+
+
+# --- Streaming demodulator: filter, phase and bit-clock state carried across chunks ---
+class StreamingSlicer:
+    """
+    Open-loop bit clock over a continuous discriminator stream. The fractional
+    position of the next decision is carried between calls.
+    """
+
+    def __init__(self, samples_per_bit_float, threshold_freq, bit_phase=0.5):
+        self.samples_per_bit_float = samples_per_bit_float
+        self.threshold_freq = threshold_freq
+        self.bit_phase = bit_phase
+        self.reset()
+
+    def reset(self):
+        self.next_bit_position = self.bit_phase * self.samples_per_bit_float  # Relative to the next chunk
+        self.samples_processed = 0
+
+    def process(self, filtered_frequency):
+        """
+        Returns (bits, positions): uint8 hard decisions whose sampling instants
+        fall inside this block, and their absolute (float) sample positions.
+        """
+        num_samples = len(filtered_frequency)
+        num_bits = max(0, int(np.ceil((num_samples - 0.5 - self.next_bit_position) / self.samples_per_bit_float)))
+        positions = self.next_bit_position + np.arange(num_bits) * self.samples_per_bit_float
+        bits = (filtered_frequency[(positions + 0.5).astype(np.int64)] > self.threshold_freq).astype(np.uint8)
+
+        self.next_bit_position += num_bits * self.samples_per_bit_float - num_samples
+        positions += self.samples_processed
+        self.samples_processed += num_samples
+        return bits, positions
+
+
+# --- Closed-loop bit clock: Gardner timing error detector + PI loop filter ---
+TIMING_BLOCK_BITS = 32            # Bits per vectorized loop update
+TIMING_LOOP_KP = 0.2              # Proportional gain (fraction of the timing error removed per block)
+TIMING_LOOP_KI = 0.005            # Integral gain (tracks a transmitter clock offset)
+TIMING_MAX_CLOCK_OFFSET = 0.01    # Clamp on the tracked clock offset (+/- 1%)
+TIMING_SQUELCH_PLATEAU = (0.5, 1.25) # |normalized frequency| range of a mark/space plateau
+TIMING_SQUELCH_FRACTION = 0.7     # Plateau samples needed in a block to update the loop (noise: ~0.4, bursts: ~0.9)
+
+
+class TimingRecoverySlicer:
+    """
+    Drop-in replacement for StreamingSlicer that tracks the transmitter's bit
+    clock instead of advancing open-loop by samples_per_bit.
+
+    Strobes and Gardner midpoints are linearly interpolated from the
+    discriminator output, one block of TIMING_BLOCK_BITS at a time. The mean
+    timing error of each block drives a PI loop that adjusts both the phase of
+    the next block and the bit period. Works from 2 samples per bit upwards.
+
+    The loop is squelched on blocks that do not look like FSK (too few samples
+    on the mark/space plateaus): between bursts the clock free-runs at the last
+    tracked rate instead of drifting on noise.
+    """
+
+    def __init__(self, samples_per_bit_float, threshold_freq, freq_dev, bit_phase=0.5):
+        self.samples_per_bit_float = samples_per_bit_float
+        self.threshold_freq = threshold_freq
+        self.freq_dev = freq_dev
+        self.bit_phase = bit_phase
+        self.history_length = int(np.ceil(samples_per_bit_float)) + 2
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0                                                     # Absolute index of history[0]
+        self.next_bit_position = self.bit_phase * self.samples_per_bit_float      # Absolute
+        self.clock_offset = 0.0                                                    # Loop integrator
+        self.last_strobe = 0.0
+        self.squelched = True
+
+    @property
+    def tracked_samples_per_bit(self):
+        return self.samples_per_bit_float * (1 - self.clock_offset)
+
+    @staticmethod
+    def _acquire_bit_phase(normalized, start, num_bits, step):
+        """
+        Moves the strobe at start (buffer index) to the middle between bit
+        transitions, using the circular mean of the block's zero crossings.
+        """
+        segment_start = int(max(start - step / 2, 0))
+        segment = normalized[segment_start : int(start + num_bits * step) + 1]
+        crossings = np.flatnonzero(np.signbit(segment[:-1]) != np.signbit(segment[1:]))
+        if len(crossings) < 2:
+            return start
+        crossing_positions = segment_start + crossings + segment[crossings] / (segment[crossings] - segment[crossings + 1])
+        transition = np.angle(np.mean(np.exp(2j * np.pi * crossing_positions / step))) * step / (2 * np.pi)
+        return start + (transition + step - start) % step - step / 2
+
+    def process(self, filtered_frequency):
+        """
+        Returns (bits, positions) like StreamingSlicer.process, with positions
+        following the recovered clock.
+        """
+        buffer = np.concatenate([self.history, filtered_frequency])
+        normalized = np.clip((buffer - self.threshold_freq) / self.freq_dev, -1.5, 1.5)
+        last_index = len(buffer) - 1
+        bit_blocks, position_blocks = [], []
+
+        while True:
+            step = self.tracked_samples_per_bit
+            start = self.next_bit_position - self.history_start
+            num_bits = min(TIMING_BLOCK_BITS, int(np.floor((last_index - start) / step)) + 1) if start <= last_index else 0
+            if num_bits <= 0:
+                break
+
+            # Squelch: fraction of the block's samples sitting on a mark/space plateau
+            block_samples = np.abs(normalized[int(max(start - step / 2, 0)) : int(start + (num_bits - 1) * step) + 1])
+            plateau_fraction = np.mean((block_samples > TIMING_SQUELCH_PLATEAU[0]) & (block_samples < TIMING_SQUELCH_PLATEAU[1]))
+            burst_start = self.squelched and plateau_fraction >= TIMING_SQUELCH_FRACTION
+            self.squelched = plateau_fraction < TIMING_SQUELCH_FRACTION
+            if burst_start:
+                # Acquire the bit phase from the burst's transitions instead of pulling in over many blocks
+                start = self._acquire_bit_phase(normalized, start, num_bits, step)
+                num_bits = min(num_bits, int(np.floor((last_index - start) / step)) + 1)
+                if num_bits <= 0:
+                    self.next_bit_position = start + self.history_start
+                    break
+
+            strobe_positions = start + np.arange(num_bits) * step
+            midpoints = np.clip(strobe_positions - step / 2, 0, last_index)
+            strobes = np.interp(strobe_positions, np.arange(len(buffer)), normalized)
+            midpoint_values = np.interp(midpoints, np.arange(len(buffer)), normalized)
+            previous_strobes = np.concatenate([[strobes[0] if burst_start else self.last_strobe], strobes[:-1]])
+
+            # Gardner: (y[k] - y[k-1]) * y[k-1/2] is positive when the strobes are late.
+            # Squelched blocks (noise between bursts) leave the loop untouched.
+            timing_error = 0.0
+            if not self.squelched:
+                timing_error = np.mean((strobes - previous_strobes) * midpoint_values) / 2
+                self.clock_offset = np.clip(self.clock_offset + TIMING_LOOP_KI * timing_error,
+                                            -TIMING_MAX_CLOCK_OFFSET, TIMING_MAX_CLOCK_OFFSET)
+
+            bit_blocks.append((strobes > 0).astype(np.uint8))
+            position_blocks.append(strobe_positions + self.history_start)
+            self.last_strobe = strobes[-1]
+            self.next_bit_position = self.history_start + start + num_bits * step - TIMING_LOOP_KP * timing_error * step
+
+        # Keep enough samples to interpolate the next strobe and its midpoint
+        keep_from = max(0, min(len(buffer), int(np.floor(self.next_bit_position - self.history_start - self.history_length))))
+        self.history = buffer[keep_from:]
+        self.history_start += keep_from
+
+        if not bit_blocks:
+            return np.zeros(0, dtype=np.uint8), np.zeros(0)
+        return np.concatenate(bit_blocks), np.concatenate(position_blocks)
+
+
+class StreamingFSKDemod:
+    """
+    Chunk-by-chunk FSK demodulator for long recordings and live SDR reads.
+
+    Keeps the sosfilt zi, the last phase sample and the bit-clock state (see
+    StreamingSlicer / TimingRecoverySlicer) between calls, so consecutive chunks
+    are demodulated exactly as if they were one unbroken signal. Discriminator output index n
+    always refers to absolute input sample n.
+    """
+
+    def __init__(self, sample_rate, bit_rate, mark_freq, space_freq, bit_phase=0.5, timing_recovery=False):
+        self.sample_rate = sample_rate
+        self.bit_rate = bit_rate
+        self.samples_per_bit_float = sample_rate / bit_rate
+        self.threshold_freq = (mark_freq + space_freq) / 2
+        if timing_recovery:
+            self.slicer = TimingRecoverySlicer(self.samples_per_bit_float, self.threshold_freq,
+                                               abs(mark_freq - space_freq) / 2, bit_phase)
+        else:
+            self.slicer = StreamingSlicer(self.samples_per_bit_float, self.threshold_freq, bit_phase)
+        self.filter_sos = design_discriminator_filter(float(sample_rate), float(bit_rate))
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all carried state, e.g. after the SDR stream was interrupted.
+        """
+        self.zi = None if self.filter_sos is None else np.zeros((len(self.filter_sos), 2), dtype=np.float32)
+        self.last_phase = None
+        self.slicer.reset()
+        self.samples_processed = 0
+
+    def process(self, samples):
+        """
+        Demodulates one chunk of complex samples.
+
+        Returns (filtered_frequency, bits): the filtered instantaneous frequency
+        (one value per input sample) and the uint8 hard decisions whose sampling
+        instants fell inside this chunk.
+        """
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint8)
+        audit_dtype(samples, np.complex64, 'StreamingFSKDemod input')
+
+        phase = np.arctan2(samples.imag, samples.real)
+        previous_phase = phase[0] if self.last_phase is None else self.last_phase
+        self.last_phase = phase[-1]
+
+        # Wrapped phase difference == np.diff(np.unwrap(phase)), but continuous across chunks
+        phase_step = np.diff(phase, prepend=previous_phase)
+        phase_step = (phase_step + np.pi) % (2 * np.pi) - np.pi
+        instantaneous_frequency = phase_step * np.float32(self.sample_rate / (2 * np.pi))
+
+        if self.filter_sos is None:
+            filtered_frequency = instantaneous_frequency
+        else:
+            filtered_frequency, self.zi = signal.sosfilt(self.filter_sos, instantaneous_frequency, zi=self.zi)
+        audit_dtype(filtered_frequency, np.float32, 'StreamingFSKDemod.process')
+
+        # Bit decisions on the carried (fractional) bit clock
+        bits, _ = self.slicer.process(filtered_frequency)
+
+        self.samples_processed += len(filtered_frequency)
+        return filtered_frequency, bits
+
+
+class StreamingFrameReader:
+    """
+    Runs the preamble/sync-word correlator over the output of StreamingFSKDemod.
+
+    The last maximum-frame-length of discriminator output is kept between calls,
+    so a frame straddling a chunk boundary is decoded exactly once, in the call
+    where it first becomes complete.
+    """
+
+    def __init__(self, sample_rate, bit_rate, freq_dev, mark_freq, space_freq, max_payload_bytes=FSK_MAX_PAYLOAD_BYTES,
+                 timing_recovery=True):
+        self.sample_rate = sample_rate
+        self.bit_rate = bit_rate
+        self.freq_dev = freq_dev
+        self.mark_freq = mark_freq
+        self.space_freq = space_freq
+        self.max_payload_bytes = max_payload_bytes
+        self.timing_recovery = timing_recovery
+        samples_per_bit_float = sample_rate / bit_rate
+        sync_template_bits = FSK_PREAMBLE_BITS + len(FSK_SYNC_WORD) * 8
+        max_frame_bits = sync_template_bits + FSK_LENGTH_FIELD_BITS + 8 * max_payload_bytes
+        self.template_samples = sync_template_bits * samples_per_bit_float
+        self.history_length = int(max_frame_bits * samples_per_bit_float) + 1
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0  # Absolute sample index of history[0]
+
+    def process(self, filtered_frequency, final=False):
+        """
+        Feeds the next block of discriminator output. Returns a list of
+        (payload_start, payload_bytes) with absolute payload_start sample indices.
+        Pass final=True with the last block to flush frames held in the history.
+        """
+        buffer = np.concatenate([self.history, filtered_frequency])
+        buffer_start = self.history_start
+
+        # Frames whose preamble starts in the retained tail are left for the next call
+        owned_limit = len(buffer) if final else len(buffer) - self.history_length
+        frame_starts = find_frame_starts(buffer, self.sample_rate, self.bit_rate, self.freq_dev)
+        frame_starts = frame_starts[frame_starts - self.template_samples < owned_limit]
+        frames = fsk_read_frames(buffer, self.sample_rate, self.bit_rate, self.mark_freq, self.space_freq,
+                                 frame_starts, self.max_payload_bytes, self.timing_recovery)
+
+        self.history = buffer[max(0, owned_limit):]
+        self.history_start = buffer_start + max(0, owned_limit)
+        return [(buffer_start + payload_start, payload) for payload_start, payload in frames]
+
+
+# --- Decimating channel-select front-end ---
+MIN_SAMPLES_PER_BIT = 4            # Slicer resolution kept after decimation
+CHANNEL_FILTER_ATTENUATION_DB = 60 # Stopband attenuation of the channel-select FIR
+
+
+def choose_decimation(sample_rate, bit_rate, freq_dev, min_samples_per_bit=MIN_SAMPLES_PER_BIT):
+    """
+    Largest integer decimation factor that still leaves min_samples_per_bit
+    samples per bit and 25% headroom over the Carson bandwidth 2*(freq_dev + bit_rate/2).
+    """
+    carson_bandwidth = 2 * (freq_dev + bit_rate / 2)
+    min_output_rate = max(1.25 * carson_bandwidth, min_samples_per_bit * bit_rate)
+    return max(1, int(sample_rate // min_output_rate))
+
+
+@lru_cache(maxsize=32)
+def design_channel_filter(sample_rate, decimation, bit_rate, freq_dev):
+    """
+    Kaiser-window low-pass FIR that passes the FSK channel (Carson half-bandwidth)
+    and rejects everything that would alias onto it after decimation.
+    The tap count is rounded up so the group delay is a whole number of output samples.
+    """
+    passband_edge = freq_dev + bit_rate / 2
+    stopband_edge = sample_rate / decimation - passband_edge
+    numtaps, beta = signal.kaiserord(CHANNEL_FILTER_ATTENUATION_DB, (stopband_edge - passband_edge) / (0.5 * sample_rate))
+    numtaps = int(np.ceil((numtaps - 1) / (2 * decimation))) * 2 * decimation + 1
+    taps = signal.firwin(numtaps, (passband_edge + stopband_edge) / 2, window=('kaiser', beta), fs=sample_rate).astype(np.float32)
+    taps.flags.writeable = False
+    return taps
+
+
+class FIRDecimator:
+    """
+    Channel-selects and decimates I/Q samples with a polyphase FIR. Keeps the
+    FIR history and the decimation phase between calls so consecutive chunks
+    give the same output as one long block. Output sample j corresponds to
+    input sample j * decimation - delay (see to_input_index).
+    """
+
+    def __init__(self, sample_rate, bit_rate, freq_dev, decimation=None):
+        if decimation is None:
+            decimation = choose_decimation(sample_rate, bit_rate, freq_dev)
+        self.decimation = decimation
+        self.output_rate = sample_rate / decimation
+        if decimation == 1:
+            self.taps = np.ones(1, dtype=np.float32)
+        else:
+            self.taps = design_channel_filter(float(sample_rate), decimation, float(bit_rate), float(freq_dev))
+        self.delay = (len(self.taps) - 1) // 2
+        self.reset()
+
+    def reset(self):
+        history_length = len(self.taps) - 1
+        self.history = np.zeros(history_length, dtype=np.complex64)
+        self.next_output_position = history_length  # Index into history + next chunk of the next output
+
+    def process(self, samples):
+        """
+        Filters and decimates one chunk, returning the output samples it completes.
+        """
+        if self.decimation == 1:
+            return samples
+        history_length = len(self.taps) - 1
+        buffer = np.concatenate([self.history, samples])
+        start = self.next_output_position
+        num_outputs = max(0, (len(buffer) - 1 - start) // self.decimation + 1)
+
+        # history_length is a multiple of the decimation, so upfirdn's phase matches ours
+        first_output = history_length // self.decimation
+        decimated = signal.upfirdn(self.taps, buffer[start - history_length:], down=self.decimation)
+        decimated = decimated[first_output : first_output + num_outputs]
+
+        self.next_output_position = start + num_outputs * self.decimation - (len(buffer) - history_length)
+        self.history = buffer[len(buffer) - history_length:]
+        return audit_dtype(decimated, np.complex64, 'FIRDecimator.process')
+
+    def to_input_index(self, output_index):
+        """
+        Maps an output sample index (may be fractional) back to the input sample rate.
+        """
+        return output_index * self.decimation - self.delay
+
+
+# --- Multi-pattern search over a continuous hard-decision bit stream ---
+PATTERN_SEARCH_BLOCK_BITS = 1 << 18  # Stream bits per FFT block
+
+
+def strings_to_bit_patterns(strings):
+    """
+    Converts ASCII strings to their MSB-first bit patterns (uint8 0/1 arrays).
+    """
+    return {s: np.unpackbits(np.frombuffer(s.encode('ascii'), dtype=np.uint8)) for s in strings}
+
+
+def search_bit_patterns(bits, patterns, max_hamming_distance=0):
+    """
+    Finds every bit index where any of the patterns occurs with at most
+    max_hamming_distance bit errors.
+
+    The +/-1 stream is transformed once per block and cross-correlated with every
+    pattern (correlation = length - 2 * hamming distance), so the cost grows with
+    the stream length rather than with patterns x offsets.
+    Returns a list of (bit_index, key, distance) sorted by bit_index.
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    max_pattern_bits = max(len(p) for p in patterns.values())
+    pattern_spectra = {}
+    matches = []
+
+    for block_start in range(0, len(bits), PATTERN_SEARCH_BLOCK_BITS):
+        segment = bits[block_start : block_start + PATTERN_SEARCH_BLOCK_BITS + max_pattern_bits - 1]
+        fft_size = next_fast_len(len(segment))
+        stream_spectrum = rfft(segment.astype(np.float64) * 2 - 1, fft_size)
+
+        for key, pattern in patterns.items():
+            pattern_bits = len(pattern)
+            num_positions = min(PATTERN_SEARCH_BLOCK_BITS, len(segment) - pattern_bits + 1)
+            if num_positions <= 0:
+                continue
+            if (key, fft_size) not in pattern_spectra:
+                pattern_spectra[(key, fft_size)] = np.conj(rfft(pattern.astype(np.float64) * 2 - 1, fft_size))
+            correlation = irfft(stream_spectrum * pattern_spectra[(key, fft_size)], fft_size)[:num_positions]
+            distance = np.rint((pattern_bits - correlation) / 2).astype(np.int64)
+            for position in np.flatnonzero(distance <= max_hamming_distance):
+                matches.append((block_start + int(position), key, int(distance[position])))
+
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+
+class StreamingPatternSearch:
+    """
+    search_bit_patterns over a stream delivered in pieces: the last
+    (longest pattern - 1) bits are kept so matches spanning two calls are
+    reported exactly once.
+    """
+
+    def __init__(self, patterns, max_hamming_distance=0):
+        self.patterns = patterns
+        self.max_hamming_distance = max_hamming_distance
+        self.tail_length = max(len(p) for p in patterns.values()) - 1
+        self.reset()
+
+    def reset(self):
+        self.tail_bits = np.zeros(0, dtype=np.uint8)
+        self.tail_positions = np.zeros(0)
+
+    def process(self, bits, positions):
+        """
+        Feeds bits and their sample positions (as returned by StreamingSlicer).
+        Returns a list of (position_of_first_bit, key, distance).
+        """
+        buffer_bits = np.concatenate([self.tail_bits, bits])
+        buffer_positions = np.concatenate([self.tail_positions, positions])
+        previous_tail = len(self.tail_bits)
+
+        matches = []
+        for bit_index, key, distance in search_bit_patterns(buffer_bits, self.patterns, self.max_hamming_distance):
+            # Matches lying entirely inside the old tail were reported by the previous call
+            if bit_index + len(self.patterns[key]) > previous_tail:
+                matches.append((float(buffer_positions[bit_index]), key, distance))
+
+        keep = max(0, len(buffer_bits) - self.tail_length)
+        self.tail_bits = buffer_bits[keep:]
+        self.tail_positions = buffer_positions[keep:]
+        return matches
+
+
+# --- Blind bit-rate / deviation estimation from detected bursts ---
+ESTIMATION_MAX_BURSTS = 32            # Strongest bursts used per estimate
+ESTIMATION_MIN_TRANSITIONS = 16       # Runs needed before a smoothing length is trusted
+ESTIMATION_BACKGROUND_BINS = 64       # Median-filter width of the transition spectrum background
+MIN_ESTIMATED_BIT_RATE = 1000.0       # Longest smoothing tried keeps half a bit at this rate
+MIN_SYMBOL_LINE_RATIO = 4.0           # Bit-rate line must stand this far above the background
+SYMBOL_LINE_SEARCH_FRACTION = 0.25    # Line searched within +/- this fraction of the run-length guess
+
+FSKParameters = namedtuple('FSKParameters', ['bit_rate', 'freq_dev', 'num_bursts'])
+
+
+def _moving_average(values, length):
+    """Boxcar average ('valid' part) via a running sum, so long boxcars cost the same as short ones."""
+    if length <= 1:
+        return values
+    running_sum = np.concatenate([[0], np.cumsum(values, dtype=np.complex128 if np.iscomplexobj(values) else np.float64)])
+    return (running_sum[length:] - running_sum[:-length]) / length
+
+
+def estimate_fsk_parameters(iq_samples, sample_rate, bursts, max_bursts=ESTIMATION_MAX_BURSTS):
+    """
+    Estimates the bit rate and frequency deviation of the 2-FSK bursts found by
+    StreamingBurstDetector (Burst tuples; each is mixed to 0 Hz by its centroid).
+
+    For smoothing lengths of 1, 2, 4, ... samples the burst is low-passed,
+    discriminated, smoothed again and hard-limited at its median. The 25th
+    percentile of the run lengths (a single bit for NRZ data) gives a rough bit
+    period; the spectrum of the transitions, summed over bursts and divided by
+    its median background, has a line at the bit rate near 1/period which is
+    then refined by parabolic interpolation. The smoothing with the strongest
+    line wins. The deviation is half the distance between the medians of the
+    upper and lower frequency plateaus (samples away from any transition).
+
+    Returns FSKParameters, or None when there is no burst or no clear line.
+    """
+    bursts = sorted(bursts, key=lambda burst: burst.peak_power_db, reverse=True)[:max_bursts]
+    burst_samples = []
+    for burst in bursts:
+        samples = np.asarray(iq_samples[burst.start:burst.end], dtype=np.complex64)
+        mixer = np.exp(-2j * np.pi * burst.centroid_hz * np.arange(len(samples)) / sample_rate).astype(np.complex64)
+        burst_samples.append(samples * mixer)
+    if not burst_samples:
+        return None
+    fft_size = next_fast_len(4 * max(len(samples) for samples in burst_samples))
+    freq_axis_hz = rfftfreq(fft_size, 1 / sample_rate)
+
+    best = None  # (line_ratio, line_bin, transition_spectrum, plateau_frequencies)
+    smoothing = 1
+    while sample_rate / (2 * smoothing) >= MIN_ESTIMATED_BIT_RATE:
+        discriminated = []  # (frequency, edges) per burst
+        for samples in burst_samples:
+            if len(samples) < 8 * smoothing:
+                continue
+            # Pre-detection low-pass keeps the discriminator above its noise threshold
+            filtered = _moving_average(samples, max(smoothing // 2, 1))
+            frequency = np.angle(filtered[1:] * np.conj(filtered[:-1])) * (sample_rate / (2 * np.pi))
+            frequency = _moving_average(frequency, smoothing)
+            discriminated.append((frequency, np.flatnonzero(np.diff(np.signbit(frequency - np.median(frequency))))))
+        run_lengths = np.concatenate([np.diff(edges) for _, edges in discriminated]) if discriminated else np.array([])
+        run_lengths = run_lengths[run_lengths >= smoothing]  # Shorter runs are noise chatter at an edge
+        bit_period = np.percentile(run_lengths, 25) if len(run_lengths) >= ESTIMATION_MIN_TRANSITIONS else 0
+        if bit_period < 2 * smoothing:
+            smoothing *= 2
+            continue
+
+        transition_spectrum = np.zeros(len(freq_axis_hz))
+        plateau_frequencies = []
+        for frequency, edges in discriminated:
+            transitions = np.zeros(len(frequency) - 1, dtype=np.float32)
+            transitions[edges] = 1.0
+            near_edge = np.concatenate([np.zeros(smoothing), _moving_average(transitions, 2 * smoothing + 1), np.zeros(smoothing)]) > 1e-9
+            plateau_frequencies.append(frequency[:-1][~near_edge])
+            transitions -= np.mean(transitions)
+            transition_spectrum += np.abs(rfft(transitions * np.hanning(len(transitions)), fft_size)) ** 2
+
+        # Background only around the search band; the line is looked for near the run-length guess
+        rough_rate = sample_rate / bit_period
+        search = np.flatnonzero(np.abs(freq_axis_hz - rough_rate) <= SYMBOL_LINE_SEARCH_FRACTION * rough_rate)
+        band = slice(max(search[0] - ESTIMATION_BACKGROUND_BINS, 0), search[-1] + ESTIMATION_BACKGROUND_BINS)
+        background = median_filter(transition_spectrum[band], size=ESTIMATION_BACKGROUND_BINS)[search - band.start]
+        line_ratio = transition_spectrum[search] / (background + 1e-30)
+        line_bin = search[np.argmax(line_ratio)]
+        if best is None or line_ratio.max() > best[0]:
+            best = (line_ratio.max(), line_bin, transition_spectrum, np.concatenate(plateau_frequencies))
+        smoothing *= 2
+
+    if best is None or best[0] < MIN_SYMBOL_LINE_RATIO:
+        return None
+    _, line_bin, transition_spectrum, plateau_frequencies = best
+    below, center, above = np.log(transition_spectrum[line_bin - 1 : line_bin + 2] + 1e-30)
+    curvature = below - 2 * center + above
+    bin_offset = 0.5 * (below - above) / curvature if curvature < 0 else 0.0
+    bit_rate = float((line_bin + bin_offset) * sample_rate / fft_size)
+
+    middle = np.median(plateau_frequencies)
+    freq_dev = float((np.median(plateau_frequencies[plateau_frequencies >= middle]) - np.median(plateau_frequencies[plateau_frequencies < middle])) / 2)
+    return FSKParameters(bit_rate, freq_dev, len(bursts))
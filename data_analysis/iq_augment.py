@@ -0,0 +1,50 @@
+import numpy as np
+from dtype_audit import audit_dtype
+
+# --- On-the-fly I/Q augmentation (training time, one call per batch) ---
+# Instead of storing shifted copies of every message, each batch gets a fresh random time shift,
+# residual carrier offset, phase rotation, AWGN level and gain per example, applied to the whole
+# (examples, samples) block at once in complex64.
+AUGMENT_MAX_TIME_SHIFT = 500            # Samples, either direction (the span of the old SAMPLE_OFFSET_STEPS)
+AUGMENT_MAX_FREQ_OFFSET_HZ = 5000.0     # Residual carrier offset, either direction
+AUGMENT_SNR_DB_RANGE = (5.0, 30.0)      # AWGN power relative to each example's own power
+AUGMENT_GAIN_DB_RANGE = (-6.0, 6.0)
+
+
+def augment_iq_batch(batch, lengths, sample_rate, rng, max_time_shift=AUGMENT_MAX_TIME_SHIFT,
+                     max_freq_offset_hz=AUGMENT_MAX_FREQ_OFFSET_HZ, snr_db_range=AUGMENT_SNR_DB_RANGE,
+                     gain_db_range=AUGMENT_GAIN_DB_RANGE):
+    """
+    Returns an augmented copy of batch ((examples, samples) complex64, row i
+    valid up to lengths[i] and zero after). Samples shifted in from outside an
+    example are zeros, so they only carry the added noise.
+    """
+    num_examples, num_samples = batch.shape
+    lengths = np.asarray(lengths)
+    sample_index = np.arange(num_samples)
+    inside = sample_index < lengths[:, None]
+
+    # Time shift: per-row gather, zeros where the window leaves the example
+    shifts = rng.integers(-max_time_shift, max_time_shift + 1, size=num_examples)
+    source_index = sample_index + shifts[:, None]
+    valid = inside & (source_index >= 0) & (source_index < lengths[:, None])
+    augmented = np.take_along_axis(batch, np.clip(source_index, 0, num_samples - 1), axis=1)
+    augmented[~valid] = 0
+
+    # Carrier offset and phase rotation in one complex64 multiply
+    freq_offsets = rng.uniform(-max_freq_offset_hz, max_freq_offset_hz, size=num_examples).astype(np.float32)
+    phases = rng.uniform(0, 2 * np.pi, size=num_examples).astype(np.float32)
+    time_s = sample_index.astype(np.float32) / np.float32(sample_rate)
+    angle = np.float32(2 * np.pi) * freq_offsets[:, None] * time_s + phases[:, None]
+    augmented *= np.cos(angle) + 1j * np.sin(angle)
+
+    # AWGN at a per-example SNR, relative to the power over the example's length
+    signal_power = np.sum(np.abs(augmented) ** 2, axis=1) / np.maximum(lengths, 1)
+    snr_db = rng.uniform(*snr_db_range, size=num_examples)
+    noise_std = np.sqrt(signal_power / 10 ** (snr_db / 10) / 2).astype(np.float32)
+    noise = rng.standard_normal((num_examples, num_samples, 2), dtype=np.float32).view(np.complex64)[..., 0]
+    augmented += np.where(inside, noise * noise_std[:, None], 0)
+
+    gains = (10 ** (rng.uniform(*gain_db_range, size=num_examples) / 20)).astype(np.float32)
+    augmented *= gains[:, None]
+    return audit_dtype(augmented, np.complex64, 'augment_iq_batch')
@@ -0,0 +1,276 @@
+import numpy as np
+from collections import namedtuple
+from scipy.fft import fft, fftshift, fftfreq
+from iq_io import iter_iq_blocks
+from spectrogram import cached_window
+from dtype_audit import audit_dtype
+
+# --- Parameters for burst-gated spectrum estimation ---
+OFFSET_ESTIMATION_FFT_SIZE = 4096     # Welch segment length (frequency resolution = fs / size)
+PSD_SEGMENTS_PER_BLOCK = 256          # Segments materialized at once when scanning a recording
+BURST_THRESHOLD_DB = 6.0              # Segment power above the median segment power to count as a burst
+NOISE_FLOOR_MARGIN_DB = 3.0           # PSD bins below median * margin are treated as noise
+DC_EXCLUSION_HZ = 2000.0              # Ignore the RTL-SDR DC spike when locating the carrier
+TONE_SMOOTHING_BINS = 5               # Moving-average width used when locating the mark/space lobes
+TONE_MIN_RELATIVE_POWER = 0.25        # Weaker lobe must reach this fraction of the stronger one
+
+
+# --- Averaged Welch PSD over the active (burst) segments only ---
+def burst_averaged_psd(samples, sample_rate, fft_size=OFFSET_ESTIMATION_FFT_SIZE, burst_threshold_db=BURST_THRESHOLD_DB):
+    """
+    Splits the I/Q samples into non-overlapping segments, keeps the segments whose
+    power is burst_threshold_db above the median segment power, and returns the
+    averaged, fftshifted power spectrum of those segments.
+
+    Works out-of-core in two passes over PSD_SEGMENTS_PER_BLOCK-segment blocks:
+    segment powers first, then FFTs of the blocks that contain bursts.
+    Returns (freq_axis_hz, psd, num_burst_segments). When no segment stands out
+    (e.g. one long continuous burst), every segment is used.
+    """
+    num_segments = len(samples) // fft_size
+    if num_segments == 0:
+        return None, None, 0
+    block_size = fft_size * PSD_SEGMENTS_PER_BLOCK
+    end_index = num_segments * fft_size
+
+    segment_power = np.concatenate([
+        np.mean(np.abs(np.reshape(block.samples, (-1, fft_size))) ** 2, axis=1)
+        for block in iter_iq_blocks(samples, sample_rate, block_size, end_index=end_index)
+    ])
+    active = segment_power > np.median(segment_power) * 10 ** (burst_threshold_db / 10)
+    if not np.any(active):
+        active[:] = True
+
+    window = cached_window('hanning', fft_size)  # float32, so the segments stay complex64
+    psd = np.zeros(fft_size)
+    for block in iter_iq_blocks(samples, sample_rate, block_size, end_index=end_index):
+        first_segment = block.start_index // fft_size
+        block_active = active[first_segment : first_segment + len(block.samples) // fft_size]
+        if np.any(block_active):
+            segments = np.reshape(block.samples, (-1, fft_size))[block_active]
+            psd += np.sum(np.abs(fft(segments * window, axis=-1)) ** 2, axis=0)
+
+    num_bursts = int(np.count_nonzero(active))
+    psd = fftshift(psd / num_bursts)
+    freq_axis_hz = fftshift(fftfreq(fft_size, 1 / sample_rate))
+    return freq_axis_hz, psd, num_bursts
+
+
+# --- Coarse carrier offset from the burst PSD (centroid, refined to the mark/space midpoint) ---
+def estimate_carrier_offset(samples, sample_rate, signal_bandwidth_hz=None, fft_size=OFFSET_ESTIMATION_FFT_SIZE, burst_threshold_db=BURST_THRESHOLD_DB):
+    """
+    Estimates where the (2-FSK) signal is centered relative to the tuner frequency.
+
+    The burst-averaged PSD has its noise floor removed and the power-weighted
+    centroid of what remains gives a first estimate. If a mark and a space lobe
+    are visible on either side of it, the midpoint between their peaks is
+    returned instead. With signal_bandwidth_hz the centroid is refined inside a
+    window of that width around the strongest bin, which keeps other
+    transmitters out of the estimate.
+
+    Returns the carrier offset in Hz, or None if the recording is too short.
+    Multiply by np.exp(-1j * 2 * np.pi * offset * t) to bring the signal to 0 Hz.
+    """
+    freq_axis_hz, psd, num_bursts = burst_averaged_psd(samples, sample_rate, fft_size, burst_threshold_db)
+    if psd is None:
+        return None
+
+    noise_floor = np.median(psd) * 10 ** (NOISE_FLOOR_MARGIN_DB / 10)
+    excess = np.clip(psd - noise_floor, 0, None)
+    excess[np.abs(freq_axis_hz) < DC_EXCLUSION_HZ] = 0
+    if not np.any(excess > 0):
+        return 0.0
+
+    if signal_bandwidth_hz is None:
+        in_band = np.ones(len(excess), dtype=bool)
+    else:
+        # Start at the strongest bin, then re-center the window on the centroid a few times
+        center_hz = freq_axis_hz[np.argmax(excess)]
+        for _ in range(3):
+            in_band = np.abs(freq_axis_hz - center_hz) <= signal_bandwidth_hz / 2
+            center_hz = np.sum(freq_axis_hz[in_band] * excess[in_band]) / (np.sum(excess[in_band]) + 1e-30)
+
+    carrier_offset_hz = np.sum(freq_axis_hz[in_band] * excess[in_band]) / (np.sum(excess[in_band]) + 1e-30)
+
+    # The centroid leans towards whichever tone the payload uses more (ASCII is 0-heavy);
+    # when two tone lobes are visible, their midpoint is the unbiased carrier
+    smoothed = np.convolve(excess * in_band, np.ones(TONE_SMOOTHING_BINS) / TONE_SMOOTHING_BINS, mode='same')
+    below = freq_axis_hz < carrier_offset_hz
+    if np.any(below & in_band) and np.any(~below & in_band):
+        lower_tone = np.argmax(np.where(below, smoothed, 0))
+        upper_tone = np.argmax(np.where(below, 0, smoothed))
+        if min(smoothed[lower_tone], smoothed[upper_tone]) > TONE_MIN_RELATIVE_POWER * smoothed.max():
+            carrier_offset_hz = (freq_axis_hz[lower_tone] + freq_axis_hz[upper_tone]) / 2
+
+    print(f"DEBUG: Carrier offset estimated at {carrier_offset_hz / 1e3:.2f} kHz from {num_bursts} burst segments.")
+    return float(carrier_offset_hz)
+
+
+# --- Phase-continuous NCO mixer, applied chunk by chunk ---
+MIXER_CHUNK_SIZE = 2**16  # Samples per rotation-table multiply in frequency_shift
+
+
+class NCOMixer:
+    """
+    Shifts I/Q samples by freq_offset_hz (multiplies by exp(1j*2*pi*f*t)) one
+    chunk at a time. The rotation table exp(1j*2*pi*f*n/fs) is computed once
+    for the largest chunk seen and reused, and the phase reached at the end of
+    each chunk is carried into the next, so the output is identical to shifting
+    the whole recording at once, without any full-length time or exp arrays.
+    """
+
+    def __init__(self, freq_offset_hz, sample_rate):
+        self.freq_offset_hz = freq_offset_hz
+        self.sample_rate = sample_rate
+        self.phase_increment = 2 * np.pi * freq_offset_hz / sample_rate
+        self.rotation_table = np.ones(0, dtype=np.complex64)
+        self.reset()
+
+    def reset(self):
+        self.phase = 0.0
+
+    def _rotation(self, num_samples):
+        if len(self.rotation_table) < num_samples:
+            # Angles in float64 (exact up to large n), stored as complex64 like the samples
+            self.rotation_table = np.exp(1j * self.phase_increment * np.arange(num_samples)).astype(np.complex64)
+        return self.rotation_table[:num_samples]
+
+    def process(self, samples):
+        """
+        Returns the frequency-shifted chunk and advances the carried phase.
+        """
+        num_samples = len(samples)
+        if self.freq_offset_hz == 0 or num_samples == 0:
+            return samples
+        shifted = samples * self._rotation(num_samples)
+        shifted *= np.complex64(np.exp(1j * self.phase))
+        self.phase = (self.phase + self.phase_increment * num_samples) % (2 * np.pi)
+        return audit_dtype(shifted, np.complex64, 'NCOMixer.process')
+
+
+def frequency_shift(samples, freq_offset_hz, sample_rate, chunk_size=MIXER_CHUNK_SIZE):
+    """
+    Drop-in replacement for samples * np.exp(1j * 2 * np.pi * f * np.arange(N) / fs)
+    that only ever allocates the output plus one chunk-sized rotation table.
+    """
+    if freq_offset_hz == 0:
+        return samples
+    mixer = NCOMixer(freq_offset_hz, sample_rate)
+    shifted = np.empty(len(samples), dtype=np.result_type(samples.dtype, np.complex64))
+    for i in range(0, len(samples), chunk_size):
+        shifted[i : i + chunk_size] = mixer.process(samples[i : i + chunk_size])
+    return shifted
+
+
+# --- Streaming burst detector: smoothed frame energy, CFAR threshold and hysteresis ---
+BURST_FRAME_SIZE = 256                # Samples averaged per power/FFT frame (125 us at 2.048 MS/s)
+BURST_ON_THRESHOLD_DB = 8.0           # Frame power above the noise estimate that opens a burst
+BURST_OFF_THRESHOLD_DB = 4.0          # Frame power below which an open burst closes (hysteresis)
+BURST_MIN_FRAMES = 4                  # Shorter detections are dropped as clicks
+NOISE_PERCENTILE = 10                 # Low percentile of quiet-frame power taken as the block's noise level
+NOISE_ADAPTATION = 0.1                # Weight of each block's noise level in the running estimate
+
+Burst = namedtuple('Burst', ['start', 'end', 'peak_power_db', 'centroid_hz'])
+
+
+class StreamingBurstDetector:
+    """
+    Finds bursts in an I/Q stream fed block by block. Power is averaged over
+    frames of frame_size samples; a burst opens when a frame exceeds the noise
+    estimate by on_threshold_db and closes at the first frame below
+    off_threshold_db. The noise estimate (CFAR) tracks a low percentile of the
+    power of the quiet frames of every block, so it holds even when bursts fill
+    most of a block. process() returns the bursts
+    completed so far as Burst(start, end, peak_power_db, centroid_hz) with
+    absolute sample indices; the spectral centroid is taken from the
+    noise-subtracted power spectrum of the burst frames.
+    """
+
+    def __init__(self, sample_rate, frame_size=BURST_FRAME_SIZE, on_threshold_db=BURST_ON_THRESHOLD_DB,
+                 off_threshold_db=BURST_OFF_THRESHOLD_DB, min_frames=BURST_MIN_FRAMES):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.on_factor = 10 ** (on_threshold_db / 10)
+        self.off_factor = 10 ** (off_threshold_db / 10)
+        self.min_frames = min_frames
+        self.freq_axis_hz = fftfreq(frame_size, 1 / sample_rate)
+        self.reset()
+
+    def reset(self):
+        self.pending = np.zeros(0, dtype=np.complex64)  # Samples short of a whole frame
+        self.frames_processed = 0
+        self.noise_power = None
+        self.in_burst = False
+        self._open_burst(0)
+
+    def _open_burst(self, frame_index):
+        self.burst_start_frame = frame_index
+        self.burst_frames = 0
+        self.burst_peak_power = 0.0
+        self.burst_spectrum = np.zeros(self.frame_size)
+
+    def _close_burst(self, end_frame):
+        """
+        Returns the open burst as a Burst, or None if it was too short.
+        """
+        if self.burst_frames < self.min_frames:
+            return None
+        excess = np.clip(self.burst_spectrum - self.burst_frames * self.frame_size * self.noise_power, 0, None)
+        if not np.any(excess > 0):
+            excess = self.burst_spectrum
+        centroid_hz = np.sum(self.freq_axis_hz * excess) / (np.sum(excess) + 1e-30)
+        return Burst(int(self.burst_start_frame * self.frame_size), int(end_frame * self.frame_size),
+                     float(10 * np.log10(self.burst_peak_power + 1e-30)), float(centroid_hz))
+
+    def process(self, samples):
+        data = np.concatenate([self.pending, samples])
+        num_frames = len(data) // self.frame_size
+        self.pending = data[num_frames * self.frame_size:]
+        if num_frames == 0:
+            return []
+        frames = np.reshape(data[:num_frames * self.frame_size], (num_frames, self.frame_size))
+        first_frame = self.frames_processed
+        self.frames_processed += num_frames
+
+        power = np.mean(np.abs(frames) ** 2, axis=1)
+        if self.noise_power is None:
+            self.noise_power = float(np.percentile(power, NOISE_PERCENTILE)) + 1e-30
+
+        # Hysteresis: frames above 'on' set the state, frames below 'off' clear it, others keep it
+        above_on = power > self.noise_power * self.on_factor
+        below_off = power < self.noise_power * self.off_factor
+        last_decided = np.maximum.accumulate(np.where(above_on | below_off, np.arange(num_frames), -1))
+        active = np.where(last_decided >= 0, above_on[np.maximum(last_decided, 0)], self.in_burst)
+
+        bursts = []
+        if self.in_burst and not active[0]:
+            burst = self._close_burst(first_frame)
+            if burst is not None:
+                bursts.append(burst)
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], active, [False]]).astype(np.int8)))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            if not (run_start == 0 and self.in_burst):
+                self._open_burst(first_frame + run_start)
+            self.burst_frames += run_end - run_start
+            self.burst_peak_power = max(self.burst_peak_power, float(np.max(power[run_start:run_end])))
+            self.burst_spectrum += np.sum(np.abs(fft(frames[run_start:run_end], axis=-1)) ** 2, axis=0)
+            if run_end < num_frames:
+                burst = self._close_burst(first_frame + run_end)
+                if burst is not None:
+                    bursts.append(burst)
+        self.in_burst = bool(active[-1])
+
+        quiet_power = power[~active]
+        if len(quiet_power):
+            self.noise_power += NOISE_ADAPTATION * (float(np.percentile(quiet_power, NOISE_PERCENTILE)) - self.noise_power)
+        return bursts
+
+    def flush(self):
+        """
+        Closes a burst still open at the end of the stream.
+        """
+        if not self.in_burst:
+            return []
+        self.in_burst = False
+        burst = self._close_burst(self.frames_processed)
+        return [] if burst is None else [burst]
@@ -0,0 +1,612 @@
+import numpy as np
+from scipy.io import wavfile
+from collections import namedtuple
+from datetime import datetime, timezone
+import json
+import lzma
+import os
+import re
+import struct
+import zlib
+from dtype_audit import audit_dtype
+
+
+# --- Lazily converted view over integer I/Q data ---
+class LazyIQArray:
+    """
+    Read-only, array-like view over interleaved I/Q samples of shape (N, 2).
+    Nothing is converted until it is indexed; slicing returns a new complex64
+    array computed as (value + offset) * scale (offset centers unsigned formats
+    such as cu8), so read-only float32 storage is never written to.
+    """
+
+    def __init__(self, interleaved, scale, offset=0.0):
+        self.interleaved = interleaved
+        self.scale = np.float32(scale)
+        self.offset = np.float32(offset)
+        self.dtype = np.dtype(np.complex64)
+
+    def __len__(self):
+        return len(self.interleaved)
+
+    @property
+    def shape(self):
+        return (len(self.interleaved),)
+
+    @property
+    def ndim(self):
+        return 1
+
+    def __getitem__(self, index):
+        block = np.array(self.interleaved[index], dtype=np.float32)
+        if self.offset:
+            block += self.offset
+        block *= self.scale
+        if block.ndim == 1:  # Single sample
+            return block.view(np.complex64)[0]
+        return np.ascontiguousarray(block).view(np.complex64)[:, 0]
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self[:]
+        return samples if dtype is None else samples.astype(dtype)
+
+
+# --- Memory-mapped WAV loader ---
+def open_iq_wav(file_path):
+    """
+    Memory-maps a stereo I/Q WAV (SDR++ baseband recording) without reading the samples.
+
+    Returns (iq_samples, sample_rate). For float32 recordings iq_samples is a
+    zero-copy complex64 view of the mapped file; for int16 (and other integer)
+    recordings it is a LazyIQArray that converts only the blocks that are sliced.
+    Raises ValueError for files that are not 2-channel.
+    """
+    try:
+        sample_rate, data = wavfile.read(file_path, mmap=True)
+    except ValueError:
+        # Formats scipy cannot map (e.g. 24-bit) are read into memory instead
+        sample_rate, data = wavfile.read(file_path)
+
+    if data.ndim < 2 or data.shape[1] != 2:
+        raise ValueError(f"WAV file is not stereo ({data.ndim}D, channels: {data.shape[1] if data.ndim > 1 else 1}). Cannot extract I/Q.")
+
+    if data.dtype == np.float32:
+        iq_samples = data.view(np.complex64)[:, 0]
+    elif data.dtype == np.int16:
+        iq_samples = LazyIQArray(data, 1.0 / np.iinfo(np.int16).max)
+    elif np.issubdtype(data.dtype, np.integer):
+        print(f"Warning: Unexpected WAV sample data type: {data.dtype}. Converting to float32 without normalization.")
+        iq_samples = LazyIQArray(data, 1.0)
+    else:
+        print(f"Warning: Unexpected WAV sample data type: {data.dtype}. Converting to complex64.")
+        iq_samples = data.astype(np.float32).view(np.complex64)[:, 0]
+    return iq_samples, sample_rate
+
+
+# --- Raw interleaved recordings (cu8 / ci8 / ci16) with SigMF metadata ---
+SIGMF_VERSION = '1.0.0'
+
+# SigMF core:datatype -> (dtype of one I or Q value, scale, offset); complex = (value + offset) * scale
+SIGMF_DATATYPES = {
+    'cu8': (np.dtype(np.uint8), 1 / 127.5, -127.5),   # RTL-SDR native format
+    'ci8': (np.dtype(np.int8), 1 / 127, 0.0),
+    'ci16_le': (np.dtype('<i2'), 1 / 32767, 0.0),
+    'cf32_le': (np.dtype('<f4'), 1.0, 0.0),
+}
+
+# Extensions used by rtl_sdr, SDR# and GNU Radio for headerless captures
+RAW_EXTENSION_DATATYPES = {
+    '.cu8': 'cu8', '.ci8': 'ci8', '.cs8': 'ci8',
+    '.ci16': 'ci16_le', '.cs16': 'ci16_le',
+    '.cf32': 'cf32_le', '.cfile': 'cf32_le',
+}
+
+# Gain has no SigMF core field, so it lives in a small declared extension namespace
+SIGMF_GAIN_KEY = 'iq:gain_db'
+
+
+def sigmf_paths(file_path):
+    """
+    Returns (data_path, meta_path) for a recording given either of its files.
+    Raw captures (capture.cu8) keep their name and get a capture.sigmf-meta sidecar.
+    """
+    base, extension = os.path.splitext(file_path)
+    if extension in ('.sigmf-meta', '.sigmf-data', '.sigmf'):
+        return base + '.sigmf-data', base + '.sigmf-meta'
+    return file_path, base + '.sigmf-meta'
+
+
+def read_sigmf_metadata(file_path):
+    """
+    Loads the SigMF metadata next to a recording, or returns None if there is none.
+    """
+    _, meta_path = sigmf_paths(file_path)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+
+def write_sigmf_metadata(file_path, datatype, sample_rate, center_frequency=None, gain_db=None, capture_time=None):
+    """
+    Writes the .sigmf-meta sidecar for a recording. capture_time is a POSIX
+    timestamp (defaults to now) and is stored as an ISO-8601 UTC core:datetime.
+    """
+    if datatype not in SIGMF_DATATYPES:
+        raise ValueError(f"Unsupported SigMF datatype '{datatype}'. Expected one of {list(SIGMF_DATATYPES)}.")
+    _, meta_path = sigmf_paths(file_path)
+    capture_time = datetime.now().timestamp() if capture_time is None else capture_time
+
+    global_info = {'core:datatype': datatype, 'core:sample_rate': float(sample_rate), 'core:version': SIGMF_VERSION}
+    if gain_db is not None:
+        global_info['core:extensions'] = [{'name': 'iq', 'version': '0.0.1', 'optional': True}]
+        global_info[SIGMF_GAIN_KEY] = float(gain_db)
+    capture = {
+        'core:sample_start': 0,
+        'core:datetime': datetime.fromtimestamp(capture_time, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+    }
+    if center_frequency is not None:
+        capture['core:frequency'] = float(center_frequency)
+
+    with open(meta_path, 'w') as f:
+        json.dump({'global': global_info, 'captures': [capture], 'annotations': []}, f, indent=2)
+    return meta_path
+
+
+def open_iq_raw(file_path, datatype=None, sample_rate=None):
+    """
+    Memory-maps a headerless interleaved I/Q file (SigMF dataset or raw capture).
+
+    datatype and sample_rate default to the SigMF metadata; without metadata the
+    datatype is taken from the file extension and sample_rate must be given.
+    Returns (iq_samples, sample_rate) like open_iq_wav: a complex64 view for
+    cf32 data, otherwise a LazyIQArray that decodes only the sliced blocks.
+    """
+    data_path, _ = sigmf_paths(file_path)
+    metadata = read_sigmf_metadata(file_path)
+    if metadata is not None:
+        datatype = datatype or metadata['global']['core:datatype']
+        sample_rate = sample_rate or metadata['global']['core:sample_rate']
+    datatype = datatype or RAW_EXTENSION_DATATYPES.get(os.path.splitext(data_path)[1].lower())
+    if datatype not in SIGMF_DATATYPES:
+        raise ValueError(f"Unknown I/Q datatype for '{file_path}'. Add SigMF metadata or pass datatype.")
+    if sample_rate is None:
+        raise ValueError(f"No sample rate for '{file_path}'. Add SigMF metadata or pass sample_rate.")
+
+    value_dtype, scale, offset = SIGMF_DATATYPES[datatype]
+    num_samples = os.path.getsize(data_path) // (2 * value_dtype.itemsize)
+    interleaved = np.memmap(data_path, dtype=value_dtype, mode='r', shape=(num_samples, 2))
+    if value_dtype == np.float32:
+        iq_samples = interleaved.view(np.complex64)[:, 0]
+    else:
+        iq_samples = LazyIQArray(interleaved, scale, offset)
+    return iq_samples, int(sample_rate) if float(sample_rate).is_integer() else sample_rate
+
+
+def iq_from_bytes(raw_bytes, datatype='cu8'):
+    """
+    Converts a buffer of interleaved I/Q values (e.g. RtlSdr.read_bytes) to
+    complex64, scaled like the recordings. pyrtlsdr's packed_bytes_to_iq
+    returns complex128 for the same data. Always returns a new, writable array.
+    """
+    value_dtype, scale, offset = SIGMF_DATATYPES[datatype]
+    if value_dtype == np.float32:  # Already complex64 in memory: one copy, no conversion
+        return np.frombuffer(raw_bytes, dtype=value_dtype).view(np.complex64).copy()
+    interleaved = np.frombuffer(raw_bytes, dtype=value_dtype).reshape(-1, 2)
+    return LazyIQArray(interleaved, scale, offset)[:]
+
+
+def open_iq_recording(file_path, **kwargs):
+    """
+    Opens any supported recording (SDR++ WAV, .iqz archive, SigMF, raw
+    cu8/ci8/ci16/cf32) without reading it. Returns (iq_samples, sample_rate).
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.wav':
+        return open_iq_wav(file_path)
+    if extension == ARCHIVE_EXTENSION:
+        return open_iq_archive(file_path)
+    return open_iq_raw(file_path, **kwargs)
+
+
+def close_iq_recording(iq_samples):
+    """
+    Releases a recording returned by open_iq_recording. Only archives hold an
+    open file; memory-mapped recordings are released with their last reference.
+    """
+    if isinstance(iq_samples, IQArchive):
+        iq_samples.close()
+
+
+def quantize_iq(samples, datatype):
+    """
+    Converts complex samples (full scale = 1.0) to interleaved values of a SigMF
+    datatype, rounding and clipping integer formats.
+    """
+    value_dtype, scale, offset = SIGMF_DATATYPES[datatype]
+    interleaved = np.ascontiguousarray(samples, dtype=np.complex64).view(np.float32)
+    if value_dtype == np.float32:
+        return interleaved.astype(value_dtype, copy=False)
+    limits = np.iinfo(value_dtype)
+    return np.clip(np.rint(interleaved / scale - offset), limits.min, limits.max).astype(value_dtype)
+
+
+class IQRecordingWriter:
+    """
+    Appends I/Q blocks to a headerless data file and writes its SigMF metadata
+    on close. write() takes complex samples, which are quantized to datatype,
+    or raw bytes already in that format (e.g. RtlSdr.read_bytes() for cu8).
+    Usable as a context manager.
+    """
+
+    def __init__(self, file_path, datatype, sample_rate, center_frequency=None, gain_db=None, capture_time=None):
+        if datatype not in SIGMF_DATATYPES:
+            raise ValueError(f"Unsupported SigMF datatype '{datatype}'. Expected one of {list(SIGMF_DATATYPES)}.")
+        self.data_path, self.meta_path = sigmf_paths(file_path)
+        self.datatype = datatype
+        self.sample_rate = sample_rate
+        self.center_frequency = center_frequency
+        self.gain_db = gain_db
+        self.capture_time = datetime.now().timestamp() if capture_time is None else capture_time
+        self.num_samples = 0
+        self.file = open(self.data_path, 'wb')
+
+    def write(self, samples):
+        if isinstance(samples, (bytes, bytearray, memoryview)):
+            data = bytes(samples)
+        elif np.iscomplexobj(samples):
+            data = quantize_iq(samples, self.datatype).tobytes()
+        else:
+            data = np.asarray(samples).tobytes()
+        self.file.write(data)
+        self.num_samples += len(data) // (2 * SIGMF_DATATYPES[self.datatype][0].itemsize)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        write_sigmf_metadata(self.data_path, self.datatype, self.sample_rate,
+                             self.center_frequency, self.gain_db, self.capture_time)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# --- Seekable compressed archive (.iqz) ---
+# Layout: ARCHIVE_MAGIC, independently compressed blocks of quantized interleaved I/Q,
+# a JSON index, then a footer of the index offset (uint64 LE) and ARCHIVE_MAGIC again.
+ARCHIVE_EXTENSION = '.iqz'
+ARCHIVE_MAGIC = b'IQZ1'
+ARCHIVE_FOOTER = struct.Struct('<Q4s')
+ARCHIVE_BLOCK_SIZE = 2**16            # Samples per compressed block (32 ms at 2.048 MS/s)
+ARCHIVE_ENERGY_SEGMENT = 4096         # Peak energy is the loudest segment of this size in a block
+ARCHIVE_ACTIVE_THRESHOLD_DB = 6.0     # Peak energy above the quiet-block level to count as active
+ARCHIVE_COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+class IQArchiveWriter:
+    """
+    Writes an .iqz archive: samples are buffered into ARCHIVE_BLOCK_SIZE blocks,
+    each quantized to datatype and compressed on its own, and the index of
+    (file offset, sample start, energy, peak energy) per block is written on close.
+    Takes the same arguments as IQRecordingWriter. Usable as a context manager.
+    """
+
+    def __init__(self, file_path, datatype, sample_rate, center_frequency=None, gain_db=None, capture_time=None,
+                 compression='zlib', block_size=ARCHIVE_BLOCK_SIZE):
+        if datatype not in SIGMF_DATATYPES:
+            raise ValueError(f"Unsupported SigMF datatype '{datatype}'. Expected one of {list(SIGMF_DATATYPES)}.")
+        if compression not in ARCHIVE_COMPRESSORS:
+            raise ValueError(f"Unsupported compression '{compression}'. Expected one of {list(ARCHIVE_COMPRESSORS)}.")
+        self.path = file_path
+        self.block_size = block_size
+        self.compress = ARCHIVE_COMPRESSORS[compression][0]
+        self.index = {
+            'datatype': datatype, 'sample_rate': sample_rate, 'center_frequency': center_frequency,
+            'gain_db': gain_db, 'start_time': datetime.now().timestamp() if capture_time is None else capture_time,
+            'compression': compression, 'block_size': block_size,
+            'blocks': {'offset': [], 'size': [], 'sample_start': [], 'energy': [], 'peak_energy': []},
+        }
+        self.pending = []
+        self.num_pending = 0
+        self.num_samples = 0
+        self.file = open(file_path, 'wb')
+        self.file.write(ARCHIVE_MAGIC)
+
+    def write(self, samples):
+        self.pending.append(np.asarray(samples, dtype=np.complex64))
+        self.num_pending += len(samples)
+        if self.num_pending >= self.block_size:
+            buffered = np.concatenate(self.pending)
+            num_full = len(buffered) // self.block_size * self.block_size
+            for i in range(0, num_full, self.block_size):
+                self._write_block(buffered[i : i + self.block_size])
+            self.pending = [buffered[num_full:]]
+            self.num_pending = len(buffered) - num_full
+
+    def _write_block(self, samples):
+        power = np.abs(samples) ** 2
+        segment_starts = np.arange(0, len(samples), ARCHIVE_ENERGY_SEGMENT)
+        segment_lengths = np.diff(np.append(segment_starts, len(samples)))
+        compressed = self.compress(quantize_iq(samples, self.index['datatype']).tobytes())
+
+        blocks = self.index['blocks']
+        blocks['offset'].append(self.file.tell())
+        blocks['size'].append(len(compressed))
+        blocks['sample_start'].append(self.num_samples)
+        blocks['energy'].append(float(np.mean(power)))
+        blocks['peak_energy'].append(float(np.max(np.add.reduceat(power, segment_starts) / segment_lengths)))
+        self.file.write(compressed)
+        self.num_samples += len(samples)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.num_pending:
+            self._write_block(np.concatenate(self.pending))
+            self.pending, self.num_pending = [], 0
+        self.index['num_samples'] = self.num_samples
+        index_offset = self.file.tell()
+        self.file.write(json.dumps(self.index).encode('utf-8'))
+        self.file.write(ARCHIVE_FOOTER.pack(index_offset, ARCHIVE_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IQArchive:
+    """
+    Read-only, array-like view over an .iqz archive (like LazyIQArray): slicing
+    seeks straight to the blocks covering the range and decompresses only those,
+    returning complex64. The per-block energies are available without decompressing.
+    Keeps the file open until close(). Usable as a context manager.
+    """
+
+    def __init__(self, file_path):
+        self.path = file_path
+        self.file = open(file_path, 'rb')
+        try:
+            self.file.seek(-ARCHIVE_FOOTER.size, os.SEEK_END)
+            index_offset, magic = ARCHIVE_FOOTER.unpack(self.file.read(ARCHIVE_FOOTER.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"'{file_path}' is not a complete .iqz archive (missing index).")
+            self.file.seek(index_offset)
+            index = json.loads(self.file.read(os.path.getsize(file_path) - ARCHIVE_FOOTER.size - index_offset))
+        except BaseException:
+            self.file.close()
+            raise
+
+        self.sample_rate = index['sample_rate']
+        self.center_frequency = index['center_frequency']
+        self.gain_db = index['gain_db']
+        self.start_time = index['start_time']
+        self.num_samples = index['num_samples']
+        self.value_dtype, self.scale, self.offset = SIGMF_DATATYPES[index['datatype']]
+        self.decompress = ARCHIVE_COMPRESSORS[index['compression']][1]
+        blocks = index['blocks']
+        self.block_offsets = np.array(blocks['offset'], dtype=np.int64)
+        self.block_sizes = np.array(blocks['size'], dtype=np.int64)
+        self.block_starts = np.array(blocks['sample_start'], dtype=np.int64)
+        self.block_energy = np.array(blocks['energy'])
+        self.block_peak_energy = np.array(blocks['peak_energy'])
+        self.dtype = np.dtype(np.complex64)
+        self.cached_block = (None, None)  # (block number, decoded samples)
+
+    def close(self):
+        self.file.close()
+        self.cached_block = (None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def shape(self):
+        return (self.num_samples,)
+
+    @property
+    def ndim(self):
+        return 1
+
+    def _decode_block(self, block_number):
+        if self.cached_block[0] != block_number:
+            self.file.seek(self.block_offsets[block_number])
+            raw = self.decompress(self.file.read(self.block_sizes[block_number]))
+            values = np.frombuffer(raw, dtype=self.value_dtype).astype(np.float32)
+            if self.offset:
+                values += self.offset
+            values *= self.scale
+            self.cached_block = (block_number, values.view(np.complex64))
+        return self.cached_block[1]
+
+    def read(self, start, stop):
+        """
+        Returns samples [start, stop) as complex64, decompressing only the blocks they span.
+        """
+        start, stop = max(start, 0), min(stop, self.num_samples)
+        if stop <= start:
+            return np.zeros(0, dtype=np.complex64)
+        first_block = np.searchsorted(self.block_starts, start, side='right') - 1
+        last_block = np.searchsorted(self.block_starts, stop, side='left')
+        parts = []
+        for block_number in range(first_block, last_block):
+            block_start = self.block_starts[block_number]
+            samples = self._decode_block(block_number)
+            parts.append(samples[max(start - block_start, 0) : stop - block_start])
+        return parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.num_samples)
+            samples = self.read(start, stop)
+            return samples if step == 1 else samples[::step]
+        if index < 0:
+            index += self.num_samples
+        if not 0 <= index < self.num_samples:
+            raise IndexError(f"Sample index {index} out of range for {self.num_samples} samples.")
+        return self.read(index, index + 1)[0]
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self[:]
+        return samples if dtype is None else samples.astype(dtype)
+
+    def time_to_index(self, seconds):
+        """
+        Sample index of a time in seconds from the start of the recording.
+        """
+        return int(np.clip(round(seconds * self.sample_rate), 0, self.num_samples))
+
+    def read_time_range(self, start_seconds, end_seconds):
+        return self.read(self.time_to_index(start_seconds), self.time_to_index(end_seconds))
+
+    def active_ranges(self, threshold_db=ARCHIVE_ACTIVE_THRESHOLD_DB):
+        """
+        Returns merged [start, end) sample ranges of the blocks whose peak energy is
+        threshold_db above the quiet-block level (10th percentile), padded by one
+        block on each side so bursts cut at a block edge stay whole. If no block
+        stands out, the whole archive is returned.
+        """
+        if self.num_samples == 0:
+            return []
+        quiet_level = np.percentile(self.block_peak_energy, 10)
+        active = self.block_peak_energy > quiet_level * 10 ** (threshold_db / 10)
+        if not np.any(active):
+            return [(0, self.num_samples)]
+        active = np.convolve(active, np.ones(3), mode='same') > 0
+        block_ends = np.append(self.block_starts[1:], self.num_samples)
+        ranges = []
+        for block_number in np.flatnonzero(active):
+            if ranges and ranges[-1][1] == self.block_starts[block_number]:
+                ranges[-1][1] = block_ends[block_number]
+            else:
+                ranges.append([self.block_starts[block_number], block_ends[block_number]])
+        return [(int(start), int(end)) for start, end in ranges]
+
+
+def open_iq_archive(file_path):
+    """
+    Opens an .iqz archive. Returns (archive, sample_rate) like open_iq_wav.
+    """
+    archive = IQArchive(file_path)
+    return archive, archive.sample_rate
+
+
+def active_sample_ranges(iq_samples, threshold_db=ARCHIVE_ACTIVE_THRESHOLD_DB):
+    """
+    Returns the [start, end) ranges of a recording worth demodulating: the active
+    blocks of an IQArchive (known from its index), otherwise the whole recording.
+    """
+    if isinstance(iq_samples, IQArchive):
+        return iq_samples.active_ranges(threshold_db)
+    return [(0, len(iq_samples))]
+
+
+# --- Out-of-core block iteration ---
+IQBlock = namedtuple('IQBlock', ['samples', 'start_index', 'timestamp'])
+
+# SDR++ names baseband recordings like baseband_433102020Hz_12-09-54_02-08-2025.wav
+SDRPP_FILENAME_TIME = re.compile(r'_(\d{2})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{4})')
+SDRPP_FILENAME_FREQ = re.compile(r'_(\d+)Hz_')
+
+
+def recording_start_time(file_path):
+    """
+    Returns the capture start as a POSIX timestamp, taken from SigMF metadata or
+    parsed from an SDR++ file name when possible, otherwise the file's modification time.
+    """
+    if file_path.endswith(ARCHIVE_EXTENSION):
+        with IQArchive(file_path) as archive:
+            return archive.start_time
+    metadata = read_sigmf_metadata(file_path)
+    if metadata and metadata.get('captures') and 'core:datetime' in metadata['captures'][0]:
+        return datetime.fromisoformat(metadata['captures'][0]['core:datetime'].replace('Z', '+00:00')).timestamp()
+    match = SDRPP_FILENAME_TIME.search(os.path.basename(file_path))
+    if match:
+        hour, minute, second, day, month, year = (int(g) for g in match.groups())
+        return datetime(year, month, day, hour, minute, second).timestamp()
+    return os.path.getmtime(sigmf_paths(file_path)[0])
+
+
+def recording_center_frequency(file_path):
+    """
+    Returns the tuner frequency in Hz from archive or SigMF metadata or an SDR++ file name, or None.
+    """
+    if file_path.endswith(ARCHIVE_EXTENSION):
+        with IQArchive(file_path) as archive:
+            return archive.center_frequency
+    metadata = read_sigmf_metadata(file_path)
+    if metadata and metadata.get('captures') and 'core:frequency' in metadata['captures'][0]:
+        return metadata['captures'][0]['core:frequency']
+    match = SDRPP_FILENAME_FREQ.search(os.path.basename(file_path))
+    return float(match.group(1)) if match else None
+
+
+def iter_iq_blocks(iq_samples, sample_rate, block_size, overlap=0, start_index=0, end_index=None, start_time=0.0):
+    """
+    Yields IQBlock(samples, start_index, timestamp) over iq_samples (array,
+    memmap or LazyIQArray), so only one block is materialized at a time.
+
+    Consecutive blocks start block_size - overlap samples apart; each block
+    repeats the last `overlap` samples of the previous one. start_index is the
+    absolute index of the block's first sample and timestamp is
+    start_time + start_index / sample_rate. The final block may be shorter.
+    """
+    if not 0 <= overlap < block_size:
+        raise ValueError(f"overlap must be in [0, block_size), got {overlap} for block_size {block_size}.")
+    end_index = len(iq_samples) if end_index is None else min(end_index, len(iq_samples))
+    step = block_size - overlap
+
+    for block_start in range(start_index, end_index, step):
+        block_end = min(block_start + block_size, end_index)
+        samples = audit_dtype(iq_samples[block_start:block_end], np.complex64, 'iter_iq_blocks')
+        yield IQBlock(samples, block_start, start_time + block_start / sample_rate)
+        if block_end == end_index:
+            break
+
+
+def iter_iq_recording_blocks(file_path, block_size, overlap=0):
+    """
+    Opens a recording with open_iq_recording and iterates it with iter_iq_blocks,
+    time-stamping blocks from the recording start time.
+    """
+    iq_samples, sample_rate = open_iq_recording(file_path)
+    try:
+        yield from iter_iq_blocks(iq_samples, sample_rate, block_size, overlap,
+                                  start_time=recording_start_time(file_path))
+    finally:
+        close_iq_recording(iq_samples)
+
+
+def convert_recording(source_path, target_path, datatype='cu8', block_size=2**20):
+    """
+    Re-encodes a recording (e.g. a float32 SDR++ WAV) block by block into a
+    compact SigMF dataset, or into a seekable archive if target_path ends in
+    .iqz, carrying over sample rate, frequency and start time. cu8 needs a
+    quarter of the space of float32 WAV.
+    """
+    iq_samples, sample_rate = open_iq_recording(source_path)
+    writer_class = IQArchiveWriter if target_path.endswith(ARCHIVE_EXTENSION) else IQRecordingWriter
+    try:
+        with writer_class(target_path, datatype, sample_rate,
+                          center_frequency=recording_center_frequency(source_path),
+                          capture_time=recording_start_time(source_path)) as writer:
+            for block in iter_iq_blocks(iq_samples, sample_rate, block_size):
+                writer.write(block.samples)
+    finally:
+        close_iq_recording(iq_samples)
+    return target_path
@@ -1,13 +1,15 @@
 import os
 import json
 import numpy as np
-import scipy.signal
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 from rtlsdr import RtlSdr
 from scipy.io import wavfile
 from sklearn.preprocessing import LabelEncoder
 from tensorflow.keras.utils import to_categorical
+from spectrogram import stft_magnitude, min_max_normalize
+from iq_io import iq_from_bytes
+from dtype_audit import audit_dtype
 
 # --- Model and Configuration ---
 MODEL_FILENAME = "fsk_model.h5"
@@ -28,7 +30,7 @@ SDR_CHUNK_SIZE = 32768             # Number of samples to read at a time
 CLASS_LABELS = ['Hello humans', 'Love is all you need', 'random']
 
 # --- Function to load and preprocess a single audio chunk ---
-def preprocess_chunk(data_chunk, sample_rate, nperseg, noverlap, target_shape):
+def preprocess_chunk(data_chunk, sample_rate, nperseg, noverlap, target_shape, output=None):
     """
     Preprocesses a single chunk of I/Q data into a normalized spectrogram.
     
@@ -38,6 +40,7 @@ def preprocess_chunk(data_chunk, sample_rate, nperseg, noverlap, target_shape):
         nperseg (int): Length of each segment for the STFT.
         noverlap (int): Number of points to overlap.
         target_shape (tuple): The expected shape of the spectrogram from training.
+        output (np.ndarray, optional): float32 (1, *target_shape) buffer reused between chunks.
 
     Returns:
         np.ndarray: The normalized spectrogram, padded to match the training shape.
@@ -47,22 +50,17 @@ def preprocess_chunk(data_chunk, sample_rate, nperseg, noverlap, target_shape):
             # Handle chunks that are too small for STFT
             return None
 
-        # Compute spectrogram using STFT
-        _, _, Zxx = scipy.signal.stft(
-            data_chunk, 
-            fs=sample_rate, 
-            nperseg=nperseg, 
-            noverlap=noverlap
-        )
-        
-        spectrogram = np.abs(Zxx)
-        spectrogram_normalized = (spectrogram - spectrogram.min()) / (spectrogram.max() - spectrogram.min() + 1e-9)
+        # Compute spectrogram using STFT (complex64 batched FFTs, same layout as scipy.signal.stft)
+        spectrogram_normalized = min_max_normalize(stft_magnitude(data_chunk, nperseg, noverlap))
 
-        # Pad or truncate the spectrogram to a uniform shape
-        padded_spec = np.zeros(target_shape)
-        padded_spec[:spectrogram_normalized.shape[0], :spectrogram_normalized.shape[1]] = spectrogram_normalized
+        # Pad or truncate the spectrogram to a uniform shape (batch dimension first)
+        if output is None:
+            output = np.empty((1,) + tuple(target_shape), dtype=np.float32)
+        output.fill(0)
+        rows, cols = min(spectrogram_normalized.shape[0], target_shape[0]), min(spectrogram_normalized.shape[1], target_shape[1])
+        output[0, :rows, :cols] = spectrogram_normalized[:rows, :cols]
         
-        return np.expand_dims(padded_spec, axis=0) # Add batch dimension
+        return audit_dtype(output, np.float32, 'preprocess_chunk')
     
     except Exception as e:
         print(f"Error processing chunk: {e}")
@@ -83,6 +81,7 @@ if __name__ == '__main__':
     
     # The input shape of the model can be used to define the spectrogram shape
     model_input_shape = model.input_shape[1:]
+    model_input = np.zeros((1,) + tuple(model_input_shape), dtype=np.float32)
     
     # Initialize the SDR
     try:
@@ -103,11 +102,12 @@ if __name__ == '__main__':
     print("\nStarting real-time analysis. Press Ctrl+C to stop.")
     try:
         while True:
-            # Read a chunk of complex samples from the SDR
-            samples = sdr.read_samples(SDR_CHUNK_SIZE)
+            # Read a chunk of raw cu8 samples from the SDR and convert straight to complex64
+            # (read_samples would return complex128)
+            samples = iq_from_bytes(sdr.read_bytes(2 * SDR_CHUNK_SIZE), 'cu8')
 
-            # Preprocess the chunk into a spectrogram
-            spectrogram_input = preprocess_chunk(samples, sdr.sample_rate, NPERSEG, NOVERLAP, model_input_shape)
+            # Preprocess the chunk into a spectrogram (into the same input buffer every time)
+            spectrogram_input = preprocess_chunk(samples, sdr.sample_rate, NPERSEG, NOVERLAP, model_input_shape, model_input)
             
             if spectrogram_input is None:
                 continue
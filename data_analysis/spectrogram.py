@@ -0,0 +1,114 @@
+import numpy as np
+import os
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import fft, fftshift
+from scipy.signal import get_window
+from dtype_audit import audit_dtype
+
+# --- Shared spectrogram engine (plots, burst scan, training and live classification) ---
+SPECTROGRAM_WORKERS = os.cpu_count() or 1   # Threads used by scipy.fft for each batch
+SPECTROGRAM_BATCH_WINDOWS = 4096            # Windows transformed per FFT call (bounds temporary memory)
+DB_FLOOR = 1e-10                            # Added before log10 so empty bins stay finite
+
+
+@lru_cache(maxsize=None)
+def cached_window(name, size):
+    """
+    Returns a read-only float32 window. 'hanning' is np.hanning (symmetric, as
+    used by the plotting code); other names go to scipy.signal.get_window
+    (periodic, as used by scipy.signal.stft).
+    """
+    window = np.hanning(size) if name == 'hanning' else get_window(name, size)
+    window = window.astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+def spectrogram(samples, fft_size, step_size, window='hanning', magnitude=False, db=False,
+                dynamic_range_db=None, shift=True, scale=1.0, workers=SPECTROGRAM_WORKERS):
+    """
+    Power (or magnitude) spectrogram of complex samples as a float32 array of
+    shape (num_windows, fft_size), one row per window starting every step_size
+    samples. Windows are strided views transformed in batches of
+    SPECTROGRAM_BATCH_WINDOWS in complex64.
+
+    shift puts 0 Hz in the middle of each row (fftshift); scale multiplies the
+    FFT before squaring. With db the rows are converted to dB in place (10*log10
+    for power, 20*log10 for magnitude) and, with dynamic_range_db, clipped to
+    that range below the maximum.
+    """
+    samples = audit_dtype(np.asarray(samples), np.complex64, 'spectrogram input').astype(np.complex64, copy=False)
+    num_windows = (len(samples) - fft_size) // step_size + 1 if len(samples) >= fft_size else 0
+    output = np.empty((num_windows, fft_size), dtype=np.float32)
+    if num_windows == 0:
+        return output
+
+    windows = sliding_window_view(samples, fft_size)[::step_size]
+    window_values = cached_window(window, fft_size)
+    if scale != 1.0:
+        window_values = window_values * np.float32(scale)
+    for start in range(0, num_windows, SPECTROGRAM_BATCH_WINDOWS):
+        batch = fft(windows[start : start + SPECTROGRAM_BATCH_WINDOWS] * window_values, axis=-1, workers=workers)
+        rows = output[start : start + len(batch)]
+        np.abs(batch, out=rows)
+        if not magnitude:
+            np.square(rows, out=rows)
+
+    if shift:
+        output = fftshift(output, axes=-1)
+    if db:
+        to_db(output, 20 if magnitude else 10, dynamic_range_db)
+    return output
+
+
+def to_db(values, factor=10, dynamic_range_db=None):
+    """
+    In place: values -> factor * log10(values + DB_FLOOR), optionally clipped to
+    dynamic_range_db below the maximum. Returns values.
+    """
+    values += DB_FLOOR
+    np.log10(values, out=values)
+    values *= factor
+    if dynamic_range_db is not None:
+        np.maximum(values, values.max() - dynamic_range_db, out=values)
+    return values
+
+
+def min_max_normalize(values):
+    """
+    In place: scales values to [0, 1] as (v - min) / (max - min + 1e-9). Returns values.
+    """
+    minimum = values.min()
+    values -= minimum
+    values /= values.max() + 1e-9
+    return values
+
+
+def stft_magnitude(samples, nperseg, noverlap, window='hann', workers=SPECTROGRAM_WORKERS):
+    """
+    |Zxx| with the same layout and values as
+    np.abs(scipy.signal.stft(samples, nperseg=nperseg, noverlap=noverlap)[2])
+    for complex input (two-sided, frequency x time, half a segment of zeros at
+    both edges, zero-padded to whole segments, 'spectrum' scaling), so models
+    trained on scipy's STFT keep seeing the same features. Returns float32.
+    """
+    step_size = nperseg - noverlap
+    samples = np.asarray(samples, dtype=np.complex64)
+    edge = np.zeros(nperseg // 2, dtype=np.complex64)
+    padded_length = len(samples) + 2 * len(edge)
+    tail = np.zeros((-(padded_length - nperseg) % step_size) % nperseg, dtype=np.complex64)
+    padded = np.concatenate([edge, samples, edge, tail])
+    magnitude = spectrogram(padded, nperseg, step_size, window=window, magnitude=True, shift=False,
+                            scale=1.0 / cached_window(window, nperseg).sum(), workers=workers)
+    return magnitude.T
+
+
+def stft_shape(num_samples, nperseg, noverlap):
+    """
+    (frequencies, frames) of stft_magnitude for num_samples samples, without computing it.
+    """
+    step_size = nperseg - noverlap
+    padded_length = num_samples + 2 * (nperseg // 2)
+    padded_length += (-(padded_length - nperseg) % step_size) % nperseg
+    return nperseg, (padded_length - nperseg) // step_size + 1
@@ -1,9 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.io import wavfile
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt
 from scipy.fft import fft, fftshift
 import os
+from iq_dsp import estimate_carrier_offset, frequency_shift
+from iq_io import open_iq_recording, close_iq_recording, iter_iq_blocks
+from spectrogram import spectrogram, cached_window
+from burst_index import load_burst_index
+from fsk_demod import estimate_fsk_parameters, fsk_discriminate
+from waterfall import load_waterfall_pyramid
 
 # --- WAV File and SDR Configuration ---
 # IMPORTANT: Update this path to your actual WAV file.
@@ -17,11 +22,13 @@ fsk_bit_rate_bps = 9600.0
 fsk_freq_dev_hz = 10000.0
 f_mark = fsk_freq_dev_hz
 f_space = -fsk_freq_dev_hz
+AUTO_FSK_PARAMETERS = True # Replace the values above with estimates from the recording's bursts
 
 # --- Parameters for finding the best signal chunk ---
 WAV_CHUNK_SIZE_FOR_ANALYSIS = 2**15 # Size of chunks for initial power analysis
 FFT_SIZE_FOR_ANALYSIS = 1024 # FFT size for power spectrum calculation
 OVERLAP_PERCENT_FOR_ANALYSIS = 50 # Overlap for FFT windows (e.g., 50% overlap)
+STFT_SCAN_BLOCK_WINDOWS = 2048 # FFT windows transformed per batch when scanning
 
 # Define a dummy longest expected string length for chunk sizing,
 # as the actual string content is not used for decoding here.
@@ -35,15 +42,16 @@ samples_per_bit_float = sdr_sample_rate_ref / fsk_bit_rate_bps
 # --- Function to read WAV file data and extract I/Q ---
 def read_iq_wav(file_path):
     """
-    Reads an I/Q WAV file recorded by SDR++ (Baseband, Float32)
-    and returns complex I/Q data and sample rate.
+    Opens an I/Q recording memory-mapped (SDR++ Baseband WAV in Float32 or Int16,
+    or a SigMF / raw cu8, ci8, ci16 capture), and returns complex64 I/Q data and sample rate.
     """
     if not os.path.exists(file_path):
         print(f"Error: File not found at {file_path}. Please ensure the path is correct.")
         return None, None
     try:
-        sample_rate, data = wavfile.read(file_path)
-        print(f"Loaded WAV file. Sample Rate: {sample_rate} Hz, Shape: {data.shape}, Dtype: {data.dtype}")
+        # Memory-mapped WAV or SigMF/raw (cu8, ci8, ci16): float32 is a zero-copy complex64 view, integers convert per slice
+        iq_samples_full, sample_rate = open_iq_recording(file_path)
+        print(f"Mapped recording. Sample Rate: {sample_rate} Hz, Samples: {len(iq_samples_full)}, Type: {type(iq_samples_full).__name__}")
         
         # Ensure the sdr_sample_rate_ref matches the actual_wav_sample_rate for consistency
         global sdr_sample_rate_ref # Declare global to modify it
@@ -55,27 +63,6 @@ def read_iq_wav(file_path):
             samples_per_bit_float = sdr_sample_rate_ref / fsk_bit_rate_bps
             print(f"DEBUG: samples_per_bit_float recalculated to {samples_per_bit_float:.2f}")
 
-        if data.ndim < 2 or data.shape[1] < 2:
-            raise ValueError(f"WAV file is not stereo ({data.ndim}D, channels: {data.shape[1] if data.ndim > 0 else 'N/A'}). Cannot extract I/Q.")
-        i_component = data[:, 0]
-        q_component = data[:, 1]
-        
-        if data.dtype == np.int16:
-            max_int_val = np.iinfo(np.int16).max
-            i_component = i_component.astype(np.float32) / max_int_val
-            q_component = q_component.astype(np.float32) / max_int_val
-            print("Converted Int16 to normalized Float32.")
-        elif data.dtype == np.float32:
-            i_component = i_component.astype(np.float32)
-            q_component = q_component.astype(np.float32)
-            print("Data already Float32.")
-        else:
-            print(f"Warning: Unexpected WAV sample data type: {data.dtype}. Attempting conversion to float32 anyway.")
-            i_component = i_component.astype(np.float32)
-            q_component = q_component.astype(np.float32)
-        
-        iq_samples_full = i_component + 1j * q_component
-        print(f"Extracted {len(iq_samples_full)} complex samples.")
         return iq_samples_full, sample_rate
     except Exception as e:
         print(f"Error reading WAV file: {e}")
@@ -86,44 +73,41 @@ def find_best_signal_chunk(full_iq_samples, sample_rate, chunk_size, fft_size, o
     """
     Analyzes the full IQ samples to find the chunk with the highest peak power in its spectrum.
     This simulates finding the 'brightest line' in a waterfall plot.
+
+    The windows are FFT'd by the shared spectrogram engine one block of
+    STFT_SCAN_BLOCK_WINDOWS windows at a time; only the winning chunk is sliced out.
     """
     print(f"\nAnalyzing full IQ data to find the chunk with the highest signal power...")
     
-    max_peak_power_db = -np.inf
+    max_peak_power = -np.inf
     best_chunk_start_idx = -1
     best_chunk_samples = None
 
     overlap = int(fft_size * overlap_percent / 100)
     step_size = fft_size - overlap
+    last_window_start = len(full_iq_samples) - fft_size  # Exclusive, as in range(0, N - fft_size, step)
+    block_size = (STFT_SCAN_BLOCK_WINDOWS - 1) * step_size + fft_size
 
-    # Iterate through the data, calculating spectrum for each window
-    for i in range(0, len(full_iq_samples) - fft_size, step_size):
-        chunk = full_iq_samples[i : i + fft_size]
-        if len(chunk) < fft_size: # Ensure full FFT window
-            continue
-
-        # Calculate power spectrum for the current chunk
-        yf = fft(chunk * np.hanning(fft_size))
-        power_spectrum_db = 20 * np.log10(np.abs(fftshift(yf)) + 1e-10) # Add small epsilon to avoid log(0)
-        
-        # Find the peak power in this spectrum
-        current_peak_power_db = np.max(power_spectrum_db)
-
-        if current_peak_power_db > max_peak_power_db:
-            max_peak_power_db = current_peak_power_db
-            best_chunk_start_idx = i
-            
-            # Extract a larger chunk around the peak for plotting
-            # Ensure it's at least the size needed for a message (LONGEST_EXPECTED_STRING_LENGTH)
-            min_samples_for_string = int(LONGEST_EXPECTED_STRING_LENGTH * 8 * samples_per_bit_float)
-            
-            # Take a chunk of `chunk_size` around the peak, ensuring it's large enough for a message
-            # and doesn't go out of bounds.
-            end_idx_for_plot = best_chunk_start_idx + max(chunk_size, min_samples_for_string)
-            if end_idx_for_plot > len(full_iq_samples):
-                end_idx_for_plot = len(full_iq_samples)
-            best_chunk_samples = full_iq_samples[best_chunk_start_idx : end_idx_for_plot]
-
+    for block in iter_iq_blocks(full_iq_samples, sample_rate, block_size, overlap=fft_size - step_size):
+        if len(block.samples) < fft_size or block.start_index >= last_window_start:
+            break
+        num_windows = min((len(block.samples) - fft_size) // step_size, (last_window_start - block.start_index - 1) // step_size) + 1
+
+        # Peak |X|^2 per window; the dB conversion is done once for the winner
+        block_spectrogram = spectrogram(block.samples[: (num_windows - 1) * step_size + fft_size], fft_size, step_size, shift=False)
+        peak_power = np.max(block_spectrogram, axis=-1)
+        best_window = int(np.argmax(peak_power))
+        if peak_power[best_window] > max_peak_power:
+            max_peak_power = peak_power[best_window]
+            best_chunk_start_idx = block.start_index + best_window * step_size
+
+    if best_chunk_start_idx != -1:
+        max_peak_power_db = 20 * np.log10(np.sqrt(max_peak_power) + 1e-10)
+        # Extract a larger chunk around the peak for plotting
+        # Ensure it's at least the size needed for a message (LONGEST_EXPECTED_STRING_LENGTH)
+        min_samples_for_string = int(LONGEST_EXPECTED_STRING_LENGTH * 8 * samples_per_bit_float)
+        end_idx_for_plot = min(best_chunk_start_idx + max(chunk_size, min_samples_for_string), len(full_iq_samples))
+        best_chunk_samples = full_iq_samples[best_chunk_start_idx : end_idx_for_plot]
 
     if best_chunk_start_idx != -1 and best_chunk_samples is not None:
         print(f"Found best signal chunk starting at sample {best_chunk_start_idx} with peak power {max_peak_power_db:.2f} dB.")
@@ -145,11 +129,9 @@ def plot_spectrum(ax, iq_data, sample_rate, title="Spectrum of Best Signal", cen
 
     # Apply frequency offset correction to the IQ data before FFT
     if center_freq_offset_hz != 0:
-        t = np.arange(N) / sample_rate
-        complex_exp = np.exp(1j * 2 * np.pi * center_freq_offset_hz * t)
-        iq_data = iq_data * complex_exp
+        iq_data = frequency_shift(iq_data, center_freq_offset_hz, sample_rate)
 
-    yf = fft(iq_data * np.hanning(N))
+    yf = fft(iq_data * cached_window('hanning', N))
     xf = fftshift(np.fft.fftfreq(N, 1 / sample_rate))
     power_spectrum = np.abs(fftshift(yf))
     power_spectrum = power_spectrum / np.max(power_spectrum) if np.max(power_spectrum) > 0 else power_spectrum
@@ -179,23 +161,10 @@ def plot_instantaneous_frequency(ax, iq_data, sample_rate, bit_rate, freq_dev, m
 
     # Apply frequency offset correction to the IQ data
     if center_freq_offset_hz != 0:
-        t = np.arange(len(iq_data)) / sample_rate
-        complex_exp = np.exp(1j * 2 * np.pi * center_freq_offset_hz * t)
-        iq_data = iq_data * complex_exp
-
-    # Instantaneous Frequency Discrimination
-    phase = np.unwrap(np.angle(iq_data))
-    instantaneous_frequency = np.diff(phase) * (sample_rate / (2 * np.pi))
+        iq_data = frequency_shift(iq_data, center_freq_offset_hz, sample_rate)
 
-    # Low-pass filter the instantaneous frequency
-    nyquist = 0.5 * sample_rate
-    cutoff_norm = (bit_rate * 2) / nyquist # Use 2x bit rate as a heuristic for cutoff
-    if cutoff_norm >= 1.0:
-        filtered_frequency = instantaneous_frequency
-    else:
-        # Corrected: Use butter and lfilter directly
-        b, a = butter(5, cutoff_norm, btype='low')
-        filtered_frequency = lfilter(b, a, instantaneous_frequency)
+    # Instantaneous frequency, low-pass filtered at 2x the bit rate (float32 throughout)
+    filtered_frequency = fsk_discriminate(iq_data, sample_rate, bit_rate)
     
     print(f"Filtered Freq. Stats (Min/Max/Mean): {np.min(filtered_frequency):.2f}/{np.max(filtered_frequency):.2f}/{np.mean(filtered_frequency):.2f} Hz. Len: {len(filtered_frequency)}")
 
@@ -229,9 +198,7 @@ def plot_spectrogram(ax, iq_data, sample_rate, fft_size=256, overlap_percent=75,
 
     # Apply frequency offset correction to the IQ data
     if center_freq_offset_hz != 0:
-        t = np.arange(len(iq_data)) / sample_rate
-        complex_exp = np.exp(1j * 2 * np.pi * center_freq_offset_hz * t)
-        iq_data = iq_data * complex_exp
+        iq_data = frequency_shift(iq_data, center_freq_offset_hz, sample_rate)
 
     # --- NEW: Bandpass filter the IQ data for display ---
     # This acts as a "zoom in" on the FSK signal's bandwidth
@@ -249,8 +216,8 @@ def plot_spectrogram(ax, iq_data, sample_rate, fft_size=256, overlap_percent=75,
         print("Warning: Spectrogram bandpass filter cutoff frequencies are invalid. Skipping filter.")
         filtered_iq_data = iq_data
     else:
-        b_bp, a_bp = butter(4, [lowcut_norm, highcut_norm], btype='band', analog=False)
-        filtered_iq_data = lfilter(b_bp, a_bp, iq_data)
+        sos_bp = butter(4, [lowcut_norm, highcut_norm], btype='band', analog=False, output='sos').astype(np.float32)
+        filtered_iq_data = sosfilt(sos_bp, iq_data) # float32 sections keep the complex64 samples complex64
     # --- END NEW BANDPASS FILTER ---
 
 
@@ -263,24 +230,8 @@ def plot_spectrogram(ax, iq_data, sample_rate, fft_size=256, overlap_percent=75,
         print("Not enough data for at least one FFT window for spectrogram.")
         return
 
-    spectrogram_data = np.zeros((num_windows, fft_size))
-    window = np.hanning(fft_size)
-
-    for i in range(num_windows):
-        start_idx = i * step_size
-        end_idx = start_idx + fft_size
-        if end_idx > num_samples:
-            break
-
-        chunk = filtered_iq_data[start_idx:end_idx] * window # Use filtered data
-        fft_result = np.fft.fftshift(np.fft.fft(chunk))
-        power_spectrum = np.abs(fft_result)**2
-        power_spectrum_db = 10 * np.log10(power_spectrum + 1e-10)
-        spectrogram_data[i, :] = power_spectrum_db
-
-    # Normalize data for better visualization
-    min_val = np.max(spectrogram_data) - dynamic_range_db
-    spectrogram_data[spectrogram_data < min_val] = min_val
+    # Batched power spectrogram in dB, clipped to dynamic_range_db for better visualization
+    spectrogram_data = spectrogram(filtered_iq_data, fft_size, step_size, db=True, dynamic_range_db=dynamic_range_db)
     
     # Calculate frequency axis in kHz (offset from center frequency)
     freq_axis_khz = np.linspace(-sample_rate / 2, sample_rate / 2, fft_size) / 1000.0
@@ -308,6 +259,23 @@ def plot_spectrogram(ax, iq_data, sample_rate, fft_size=256, overlap_percent=75,
     plt.colorbar(im, ax=ax, label='Power (dB)')
 
 
+# --- Function to plot a waterfall from the precomputed pyramid (no FFTs) ---
+def plot_waterfall(ax, pyramid, start_s=0.0, end_s=None, max_rows=1000, dynamic_range_db=90, center_freq_offset_hz=0, title="Waterfall"):
+    """
+    Displays [start_s, end_s) of a recording from its waterfall pyramid.
+    The frequency correction only shifts the axis, as the pyramid is in the tuner frame.
+    """
+    ax.clear()
+    rows_db, (view_start_s, view_end_s), level = pyramid.view(start_s, end_s, max_rows=max_rows, dynamic_range_db=dynamic_range_db)
+    freq_axis_khz = (pyramid.freq_axis_hz + center_freq_offset_hz) / 1000.0
+    im = ax.imshow(rows_db, aspect='auto', cmap='jet',
+                   extent=[freq_axis_khz[0], freq_axis_khz[-1], view_end_s, view_start_s])
+    ax.set_title(f"{title} (level {level}, {pyramid.row_duration_s(level) * 1e3:.2f} ms/row)")
+    ax.set_xlabel('Frequency Offset (kHz)')
+    ax.set_ylabel('Time (s)')
+    plt.colorbar(im, ax=ax, label='Power (dB)')
+
+
 # --- Main part of the script ---
 if __name__ == "__main__":
     print(f"Starting SDR signal analysis from WAV file: '{WAV_FILE_PATH}'")
@@ -318,66 +286,92 @@ if __name__ == "__main__":
         print("\nFailed to load WAV file. Exiting.")
         exit()
 
-    sdr_sample_rate = actual_sdr_sample_rate # Use actual sample rate from WAV
-
-    print(f"\nSearching for the chunk with the highest signal power...")
-    best_signal_chunk, best_signal_chunk_start_idx = find_best_signal_chunk(
-        full_iq_samples, sdr_sample_rate,
-        WAV_CHUNK_SIZE_FOR_ANALYSIS, FFT_SIZE_FOR_ANALYSIS, OVERLAP_PERCENT_FOR_ANALYSIS
-    )
-
-    if best_signal_chunk is None:
-        print("\nCould not find a significant signal chunk in the WAV file. Exiting.")
-        exit()
-
-    # --- IMPORTANT: Determine this offset from the SDR++ waterfall or by inspecting the raw IQ data ---
-    # Based on your last screenshot, the peaks are roughly around -70kHz to -40kHz.
-    # The center of these peaks is around (-70 + -40) / 2 = -55kHz.
-    # To bring this to 0kHz, we need to add 55000Hz.
-    # Let's use -60000.0 Hz as a starting point as you previously tried,
-    # but be prepared to fine-tune this based on the new plots' 'Mean' value.
-    center_freq_offset_hz_for_plotting = -60000.0 # Adjusted based on your last screenshot's peaks
-    # -------------------------------------------------------------------------------------------------
-
-    # Create a figure with three subplots
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 15)) # 3 rows, 1 column
-    fig.suptitle(f"Analysis of Brightest Signal Line (Start Sample: {best_signal_chunk_start_idx})")
-
-    print(f"\nPlotting the spectrum of the brightest signal line...")
-    plot_spectrum(
-        ax1, # Pass the first subplot axis
-        best_signal_chunk,
-        sdr_sample_rate,
-        title="Spectrum of Best Signal Chunk (After Freq Correction)",
-        center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
-    )
-
-    print(f"\nPlotting the instantaneous frequency of the brightest signal line...")
-    # plot_instantaneous_frequency(
-    #     ax2, # Pass the second subplot axis
-    #     best_signal_chunk,
-    #     sdr_sample_rate,
-    #     fsk_bit_rate_bps,
-    #     fsk_freq_dev_hz,
-    #     f_mark,
-    #     f_space,
-    #     title="Instantaneous Frequency of Best Signal Chunk (After Freq Correction)",
-    #     center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
-    # )
-
-    print(f"\nPlotting the spectrogram of the brightest signal line...")
-    plot_spectrogram(
-        ax2 , # Pass the third subplot axis
-        best_signal_chunk,
-        sdr_sample_rate,
-        fft_size=256, # Smaller FFT size for better time resolution in spectrogram
-        overlap_percent=75,
-        dynamic_range_db=90,
-        center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
-    )
-
-
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95]) # Adjust layout to prevent title overlap
-    plt.show()
-
-    print("\nAnalysis complete. Observe the plots to identify signal characteristics.")
+    try:
+        sdr_sample_rate = actual_sdr_sample_rate # Use actual sample rate from WAV
+
+        # The strongest burst from the recording's burst index (built on first use); the sliding-FFT
+        # search is kept as the fallback for recordings without detectable bursts
+        bursts = load_burst_index(WAV_FILE_PATH, full_iq_samples, sdr_sample_rate)
+        estimated = estimate_fsk_parameters(full_iq_samples, sdr_sample_rate, bursts) if AUTO_FSK_PARAMETERS and bursts else None
+        if estimated is not None:
+            fsk_bit_rate_bps, fsk_freq_dev_hz = estimated.bit_rate, estimated.freq_dev
+            f_mark, f_space = fsk_freq_dev_hz, -fsk_freq_dev_hz
+            samples_per_bit_float = sdr_sample_rate / fsk_bit_rate_bps
+            print(f"Estimated from {estimated.num_bursts} bursts: {fsk_bit_rate_bps:.1f} bps, deviation {fsk_freq_dev_hz:.0f} Hz.")
+        if bursts:
+            strongest_burst = max(bursts, key=lambda burst: burst.peak_power_db)
+            best_signal_chunk_start_idx = strongest_burst.start
+            min_samples_for_string = int(LONGEST_EXPECTED_STRING_LENGTH * 8 * samples_per_bit_float)
+            chunk_length = max(WAV_CHUNK_SIZE_FOR_ANALYSIS, min_samples_for_string, strongest_burst.end - strongest_burst.start)
+            best_signal_chunk = full_iq_samples[best_signal_chunk_start_idx : best_signal_chunk_start_idx + chunk_length]
+            print(f"Strongest of {len(bursts)} indexed bursts starts at sample {best_signal_chunk_start_idx} ({strongest_burst.peak_power_db:.2f} dB, centroid {strongest_burst.centroid_hz / 1e3:.1f} kHz).")
+        else:
+            print(f"\nSearching for the chunk with the highest signal power...")
+            best_signal_chunk, best_signal_chunk_start_idx = find_best_signal_chunk(
+                full_iq_samples, sdr_sample_rate,
+                WAV_CHUNK_SIZE_FOR_ANALYSIS, FFT_SIZE_FOR_ANALYSIS, OVERLAP_PERCENT_FOR_ANALYSIS
+            )
+
+        if best_signal_chunk is None:
+            print("\nCould not find a significant signal chunk in the WAV file. Exiting.")
+            exit()
+
+        # --- Frequency correction: estimated from the burst spectrum of the whole recording ---
+        # The mark/space midpoint is brought to 0 Hz. -60000.0 Hz (read off an old waterfall) is kept
+        # as the fallback when the recording is too short to estimate from.
+        center_freq_offset_hz_for_plotting = -60000.0
+        carrier_offset_hz = estimate_carrier_offset(full_iq_samples, sdr_sample_rate, signal_bandwidth_hz=2 * (fsk_freq_dev_hz + fsk_bit_rate_bps))
+        if carrier_offset_hz is not None:
+            center_freq_offset_hz_for_plotting = -carrier_offset_hz
+        print(f"Frequency correction for plotting: {center_freq_offset_hz_for_plotting:.0f} Hz")
+        # -------------------------------------------------------------------------------------------------
+
+        # Create a figure with three subplots
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 15)) # 3 rows, 1 column
+        fig.suptitle(f"Analysis of Brightest Signal Line (Start Sample: {best_signal_chunk_start_idx})")
+
+        print(f"\nPlotting the spectrum of the brightest signal line...")
+        plot_spectrum(
+            ax1, # Pass the first subplot axis
+            best_signal_chunk,
+            sdr_sample_rate,
+            title="Spectrum of Best Signal Chunk (After Freq Correction)",
+            center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
+        )
+
+        print(f"\nPlotting the instantaneous frequency of the brightest signal line...")
+        # plot_instantaneous_frequency(
+        #     ax2, # Pass the second subplot axis
+        #     best_signal_chunk,
+        #     sdr_sample_rate,
+        #     fsk_bit_rate_bps,
+        #     fsk_freq_dev_hz,
+        #     f_mark,
+        #     f_space,
+        #     title="Instantaneous Frequency of Best Signal Chunk (After Freq Correction)",
+        #     center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
+        # )
+
+        print(f"\nPlotting the spectrogram of the brightest signal line...")
+        plot_spectrogram(
+            ax2 , # Pass the third subplot axis
+            best_signal_chunk,
+            sdr_sample_rate,
+            fft_size=256, # Smaller FFT size for better time resolution in spectrogram
+            overlap_percent=75,
+            dynamic_range_db=90,
+            center_freq_offset_hz=center_freq_offset_hz_for_plotting # Apply correction for plotting
+        )
+
+
+        print(f"\nPlotting the overview waterfall of the whole recording...")
+        pyramid = load_waterfall_pyramid(WAV_FILE_PATH, full_iq_samples, sdr_sample_rate)
+        plot_waterfall(ax3, pyramid, title="Overview Waterfall", center_freq_offset_hz=center_freq_offset_hz_for_plotting)
+        ax3.axhline(best_signal_chunk_start_idx / sdr_sample_rate, color='white', linestyle='--')
+
+        plt.tight_layout(rect=[0, 0.03, 1, 0.95]) # Adjust layout to prevent title overlap
+        plt.show()
+
+        print("\nAnalysis complete. Observe the plots to identify signal characteristics.")
+    finally:
+        close_iq_recording(full_iq_samples)
@@ -1,14 +1,18 @@
 import os
 import json
 import numpy as np
-import scipy.signal
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Flatten
 from tensorflow.keras.utils import to_categorical
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
-from scipy.io import wavfile
+from iq_io import open_iq_wav
+from spectrogram import stft_magnitude, stft_shape, min_max_normalize
+from analysis_cache import AnalysisCache, ANALYSIS_CACHE_DIR
+from dtype_audit import audit_dtype
+from dataset_shards import DatasetShards, is_shard_dataset, SHARD_TABLE_NAME
+from iq_augment import augment_iq_batch
 
 # --- Dataset and Model Configuration ---
 DATASET_DIR = "dataset"
@@ -19,6 +23,55 @@ MODEL_FILENAME = "fsk_model.h5"
 NPERSEG = 128
 NOVERLAP = NPERSEG // 2
 
+# --- Training ---
+EPOCHS = 25
+BATCH_SIZE = 4
+
+# --- Shard datasets: training batches are augmented on the fly (time shift, carrier offset, phase, AWGN, gain; see iq_augment.py) ---
+AUGMENT_TRAINING = True
+AUGMENT_SEED = None     # Seeds the in-memory generator only; tf.data draws fresh randomness per batch
+
+# --- tf.data input pipeline: examples listed up front, spectrograms computed on parallel calls, cached and prefetched ---
+USE_TF_DATA = True
+TF_DATA_CACHE_DIR = os.path.join(ANALYSIS_CACHE_DIR, 'tf_data') # On-disk spectrogram cache, keyed by dataset content, split and STFT parameters; None: no cache
+
+# --- Spectrograms are memoized per file content and STFT parameters (see analysis_cache.py) ---
+USE_ANALYSIS_CACHE = True
+
+def list_wav_examples(dataset_dir):
+    """
+    (file paths, labels) of the WAV examples in the class folders of dataset_dir.
+    """
+    file_paths, labels = [], []
+
+    # Get a list of subdirectories to use as class labels
+    class_folders = [d for d in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, d))]
+    print(f"Found class folders: {class_folders}")
+
+    for folder_name in class_folders:
+        label = folder_name.replace("_", " ")  # Convert folder name back to original label
+        folder_path = os.path.join(dataset_dir, folder_name)
+        for filename in os.listdir(folder_path):
+            if filename.endswith('.wav'):
+                file_paths.append(os.path.join(folder_path, filename))
+                labels.append(label)
+    return file_paths, labels
+
+def wav_spectrogram(file_path, nperseg, noverlap, cache=None):
+    """
+    Normalized STFT magnitude of one WAV example, memoized in cache when given.
+    """
+    def compute_spectrogram():
+        iq_samples, sample_rate = open_iq_wav(file_path)
+        complex_data = np.asarray(iq_samples)  # complex64
+        # Same values as np.abs(scipy.signal.stft(...)[2]), computed as float32 batched FFTs
+        return min_max_normalize(stft_magnitude(complex_data, nperseg, noverlap))
+
+    if cache is None:
+        return compute_spectrogram()
+    key = cache.key('stft_magnitude_normalized', cache.file_hash(file_path), nperseg=nperseg, noverlap=noverlap)
+    return cache.array(key, compute_spectrogram)
+
 # --- Function to load and preprocess audio data ---
 def load_and_preprocess_data(metadata_file, nperseg, noverlap):
     """
@@ -31,47 +84,20 @@ def load_and_preprocess_data(metadata_file, nperseg, noverlap):
 
     X_data = []
     y_labels = []
+    cache = AnalysisCache() if USE_ANALYSIS_CACHE else None
 
-    # Get a list of subdirectories to use as class labels
-    class_folders = [d for d in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, d))]
-    
-    if not class_folders:
-        print(f"Error: No class folders found in {DATASET_DIR}")
+    file_paths, labels = list_wav_examples(DATASET_DIR)
+    if not file_paths:
+        print(f"Error: No WAV files found in the class folders of {DATASET_DIR}")
         return None, None, None
 
-    print(f"Found class folders: {class_folders}")
-
-    # Process files within each class folder
-    for folder_name in class_folders:
-        label = folder_name.replace("_", " ")  # Convert folder name back to original label
-        folder_path = os.path.join(DATASET_DIR, folder_name)
-        
-        for filename in os.listdir(folder_path):
-            if filename.endswith('.wav'):
-                file_path = os.path.join(folder_path, filename)
-                
-                try:
-                    sample_rate, data = wavfile.read(file_path)
-                    i_component = data[:, 0]
-                    q_component = data[:, 1]
-                    complex_data = i_component + 1j * q_component
-                    
-                    _, _, Zxx = scipy.signal.stft(
-                        complex_data, 
-                        fs=sample_rate, 
-                        nperseg=nperseg, 
-                        noverlap=noverlap
-                    )
-                    
-                    spectrogram = np.abs(Zxx)
-                    spectrogram_normalized = (spectrogram - spectrogram.min()) / (spectrogram.max() - spectrogram.min() + 1e-9)
-
-                    X_data.append(spectrogram_normalized)
-                    y_labels.append(label)
-
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
-                    continue
+    for file_path, label in zip(file_paths, labels):
+        try:
+            X_data.append(wav_spectrogram(file_path, nperseg, noverlap, cache))
+            y_labels.append(label)
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+            continue
     
     if not X_data:
         print("No valid data found to process.")
@@ -81,11 +107,11 @@ def load_and_preprocess_data(metadata_file, nperseg, noverlap):
     print(f"Padding spectrograms to a uniform shape: {max_shape}")
     X_data_padded = []
     for spec in X_data:
-        padded_spec = np.zeros(max_shape)
+        padded_spec = np.zeros(max_shape, dtype=np.float32)
         padded_spec[:spec.shape[0], :spec.shape[1]] = spec
         X_data_padded.append(padded_spec)
 
-    X_data_array = np.array(X_data_padded)
+    X_data_array = audit_dtype(np.array(X_data_padded), np.float32, 'training spectrograms')
     
     label_encoder = LabelEncoder()
     integer_encoded = label_encoder.fit_transform(y_labels)
@@ -96,6 +122,163 @@ def load_and_preprocess_data(metadata_file, nperseg, noverlap):
 
     return X_data_array, y_data, label_encoder
 
+# --- Packed shard datasets (create_dataset.py with DATASET_FORMAT = "shards") ---
+def load_shard_dataset(dataset_dir, nperseg, noverlap):
+    """
+    Same result as load_and_preprocess_data for a shard dataset: shards are read
+    sequentially and every example's spectrogram is padded to the largest one.
+    The whole spectrogram stack is one analysis-cache entry.
+    """
+    shards = DatasetShards(dataset_dir)
+    print(f"Loading {len(shards)} examples from {len(shards.shard_files)} shard(s) in '{dataset_dir}'...")
+    if len(shards) == 0:
+        print(f"Error: No examples found in {dataset_dir}")
+        return None, None, None
+
+    def compute_spectrograms():
+        spectrograms = {index: min_max_normalize(stft_magnitude(samples, nperseg, noverlap)) for index, samples in shards.iter_examples()}
+        max_shape = tuple(int(size) for size in np.max([spec.shape for spec in spectrograms.values()], axis=0))
+        print(f"Padding spectrograms to a uniform shape: {max_shape}")
+        padded = np.zeros((len(shards),) + max_shape, dtype=np.float32)
+        for index, spec in spectrograms.items():
+            padded[index, :spec.shape[0], :spec.shape[1]] = spec
+        return padded
+
+    if USE_ANALYSIS_CACHE:
+        cache = AnalysisCache()
+        inputs = [cache.file_hash(os.path.join(dataset_dir, name)) for name in [SHARD_TABLE_NAME] + shards.shard_files]
+        X_data_array = cache.array(cache.key('shard_spectrograms', *inputs, nperseg=nperseg, noverlap=noverlap), compute_spectrograms)
+    else:
+        X_data_array = compute_spectrograms()
+    X_data_array = audit_dtype(np.asarray(X_data_array), np.float32, 'training spectrograms')
+
+    label_encoder = LabelEncoder()
+    y_data = to_categorical(label_encoder.fit_transform(shards.labels))
+    print(f"\nUnique labels found in dataset: {label_encoder.classes_}")
+    return X_data_array, y_data, label_encoder
+
+def augmented_spectrogram_batches(shards, indices, y_data, batch_size, nperseg, noverlap, spectrogram_shape, seed=AUGMENT_SEED):
+    """
+    Endless (X, y) batches for model.fit: the examples at indices are reshuffled
+    every pass, augmented as I/Q (augment_iq_batch) and turned into normalized
+    spectrograms padded to spectrogram_shape, as in load_shard_dataset.
+    """
+    rng = np.random.default_rng(seed)
+    while True:
+        order = rng.permutation(indices)
+        for batch_start in range(0, len(order), batch_size):
+            batch_indices = order[batch_start:batch_start + batch_size]
+            yield augmented_spectrogram_batch(shards, batch_indices, nperseg, noverlap, spectrogram_shape, rng), y_data[batch_indices]
+
+def augmented_spectrogram_batch(shards, batch_indices, nperseg, noverlap, spectrogram_shape, rng):
+    """
+    One augmented batch: (len(batch_indices),) + spectrogram_shape float32.
+    """
+    lengths = shards.table['length'][batch_indices]
+    batch = np.zeros((len(batch_indices), lengths.max()), dtype=np.complex64)
+    for row, index in enumerate(batch_indices):
+        batch[row, :lengths[row]] = shards.example(index)
+    augmented = augment_iq_batch(batch, lengths, shards.sample_rate, rng)
+
+    X_batch = np.zeros((len(batch_indices),) + tuple(spectrogram_shape), dtype=np.float32)
+    for row, length in enumerate(lengths):
+        spec = min_max_normalize(stft_magnitude(augmented[row, :length], nperseg, noverlap))
+        rows, columns = min(spec.shape[0], spectrogram_shape[0]), min(spec.shape[1], spectrogram_shape[1])
+        X_batch[row, :rows, :columns] = spec[:rows, :columns]
+    return X_batch
+
+# --- tf.data pipelines: nothing is loaded up front, so training is not bounded by RAM ---
+def spectrogram_dataset(load_spectrogram, keys, y_data, spectrogram_shape, batch_size, shuffle=False, cache_file=None):
+    """
+    Batches of (spectrogram, label) for keys (file paths or shard example
+    indices): load_spectrogram(key) runs on AUTOTUNE parallel calls, results
+    are cached in cache_file (on disk) after the first epoch when given, then
+    shuffled, zero-padded to spectrogram_shape and prefetched.
+    """
+    def load(key, label):
+        spec = tf.numpy_function(lambda key: np.asarray(load_spectrogram(key), dtype=np.float32), [key], tf.float32)
+        spec.set_shape([None, None])
+        return spec, label
+
+    dataset = tf.data.Dataset.from_tensor_slices((keys, y_data))
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache_file is not None:
+        dataset = dataset.cache(cache_file)
+    if shuffle:
+        dataset = dataset.shuffle(len(keys), reshuffle_each_iteration=True)
+    dataset = dataset.padded_batch(batch_size, padded_shapes=(list(spectrogram_shape), [y_data.shape[1]]))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def augmented_dataset(shards, indices, y_data, batch_size, nperseg, noverlap, spectrogram_shape):
+    """
+    tf.data version of augmented_spectrogram_batches: index batches are
+    reshuffled every epoch and augmented on AUTOTUNE parallel calls (each with
+    its own generator), then prefetched. Not cached: every epoch is new data.
+    """
+    def load(batch_indices):
+        rng = np.random.default_rng()
+        return augmented_spectrogram_batch(shards, batch_indices, nperseg, noverlap, spectrogram_shape, rng), y_data[batch_indices]
+
+    def load_batch(batch_indices):
+        X_batch, y_batch = tf.numpy_function(load, [batch_indices], (tf.float32, tf.float32))
+        X_batch.set_shape([None] + list(spectrogram_shape))
+        y_batch.set_shape([None, y_data.shape[1]])
+        return X_batch, y_batch
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices).shuffle(len(indices), reshuffle_each_iteration=True).batch(batch_size)
+    return dataset.map(load_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+def make_input_pipelines(dataset_dir, nperseg, noverlap, batch_size):
+    """
+    Training and validation tf.data pipelines for a shard or WAV dataset, split
+    like the in-memory path. Only the example list and lengths are read here.
+    Returns (train_dataset, val_dataset, input_shape, label_encoder).
+    """
+    cache = AnalysisCache() if USE_ANALYSIS_CACHE else None
+    shards = None
+    if is_shard_dataset(dataset_dir):
+        shards = DatasetShards(dataset_dir)
+        keys, labels = np.arange(len(shards)), shards.labels
+        num_samples = int(shards.table['length'].max()) if len(shards) else 0
+        load_spectrogram = lambda index: min_max_normalize(stft_magnitude(shards.example(int(index)), nperseg, noverlap))
+    else:
+        keys, labels = list_wav_examples(dataset_dir)
+        num_samples = max((len(open_iq_wav(file_path)[0]) for file_path in keys), default=0)
+        load_spectrogram = lambda file_path: wav_spectrogram(file_path.decode(), nperseg, noverlap, cache)
+    if len(keys) == 0:
+        print(f"Error: No examples found in {dataset_dir}")
+        return None, None, None, None
+
+    label_encoder = LabelEncoder()
+    y_data = to_categorical(label_encoder.fit_transform(labels)).astype(np.float32)
+    print(f"\nUnique labels found in dataset: {label_encoder.classes_}")
+    input_shape = stft_shape(num_samples, nperseg, noverlap)
+    print(f"{len(keys)} examples, spectrograms padded to {input_shape}")
+
+    train_keys, val_keys, y_train, y_val = train_test_split(
+        keys, y_data, test_size=0.2, random_state=42, stratify=y_data
+    )
+
+    # A cache file is only valid for the same examples (content), split and STFT parameters
+    cache_file = lambda split_keys: None
+    if TF_DATA_CACHE_DIR is not None:
+        hasher = cache or AnalysisCache()
+        if shards is not None:
+            content = [hasher.file_hash(os.path.join(dataset_dir, name)) for name in [SHARD_TABLE_NAME] + shards.shard_files]
+        else:
+            content = [hasher.file_hash(file_path) for file_path in keys]
+        os.makedirs(TF_DATA_CACHE_DIR, exist_ok=True)
+        cache_file = lambda split_keys: os.path.join(TF_DATA_CACHE_DIR, hasher.key('tf_data_spectrograms', *content, keys=list(split_keys),
+                                                                                    nperseg=nperseg, noverlap=noverlap))
+    if AUGMENT_TRAINING and shards is not None:
+        print(f"Augmenting the {len(train_keys)} training examples on the fly; validation uses the stored examples.")
+        train_dataset = augmented_dataset(shards, np.asarray(train_keys), y_data, batch_size, nperseg, noverlap, input_shape)
+    else:
+        train_dataset = spectrogram_dataset(load_spectrogram, train_keys, y_train, input_shape, batch_size, shuffle=True,
+                                            cache_file=cache_file(train_keys))
+    val_dataset = spectrogram_dataset(load_spectrogram, val_keys, y_val, input_shape, batch_size, cache_file=cache_file(val_keys))
+    return train_dataset, val_dataset, input_shape, label_encoder
+
 # --- Function to build the neural network model ---
 def build_model(input_shape, num_classes):
     model = Sequential([
@@ -115,18 +298,36 @@ def build_model(input_shape, num_classes):
 # --- Main execution block ---
 if __name__ == '__main__':
     print("--- Step 1: Loading and preprocessing the dataset for training ---")
-    X, y, label_encoder = load_and_preprocess_data(METADATA_FILE, NPERSEG, NOVERLAP)
+    if USE_TF_DATA:
+        train_data, val_data, input_shape, label_encoder = make_input_pipelines(DATASET_DIR, NPERSEG, NOVERLAP, BATCH_SIZE)
+        if train_data is None:
+            print("Exiting due to data loading error.")
+            exit()
+        num_classes = len(label_encoder.classes_)
+        fit_args = dict(x=train_data, validation_data=val_data)
+    else:
+        if is_shard_dataset(DATASET_DIR):
+            X, y, label_encoder = load_shard_dataset(DATASET_DIR, NPERSEG, NOVERLAP)
+        else:
+            X, y, label_encoder = load_and_preprocess_data(METADATA_FILE, NPERSEG, NOVERLAP)
 
-    if X is None or y is None:
-        print("Exiting due to data loading error.")
-        exit()
+        if X is None or y is None:
+            print("Exiting due to data loading error.")
+            exit()
 
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    
-    num_classes = y_train.shape[1]
-    input_shape = X_train.shape[1:]
+        train_indices, val_indices = train_test_split(
+            np.arange(len(y)), test_size=0.2, random_state=42, stratify=y
+        )
+        X_val, y_val = X[val_indices], y[val_indices]
+
+        num_classes = y.shape[1]
+        input_shape = X.shape[1:]
+        if AUGMENT_TRAINING and is_shard_dataset(DATASET_DIR):
+            print(f"Augmenting the {len(train_indices)} training examples on the fly; validation uses the stored examples.")
+            fit_args = dict(x=augmented_spectrogram_batches(DatasetShards(DATASET_DIR), train_indices, y, BATCH_SIZE, NPERSEG, NOVERLAP, input_shape),
+                            steps_per_epoch=-(-len(train_indices) // BATCH_SIZE), validation_data=(X_val, y_val))
+        else:
+            fit_args = dict(x=X[train_indices], y=y[train_indices], batch_size=BATCH_SIZE, validation_data=(X_val, y_val))
 
     print("\nBuilding model...")
     model = build_model(input_shape, num_classes)
@@ -134,11 +335,9 @@ if __name__ == '__main__':
 
     print("\nStarting model training...")
     history = model.fit(
-        X_train, y_train,
-        epochs=25,
-        batch_size=4,
-        validation_data=(X_val, y_val),
-        verbose=1
+        epochs=EPOCHS,
+        verbose=1,
+        **fit_args
     )
 
     print(f"\nTraining complete. Saving model to {MODEL_FILENAME}")
@@ -0,0 +1,154 @@
+import numpy as np
+import json
+import os
+from iq_io import open_iq_recording, close_iq_recording, iter_iq_blocks
+from spectrogram import spectrogram
+
+# --- Multi-resolution waterfall pyramid (<recording>.waterfall/) ---
+# Level 0 holds one dB power row per WATERFALL_FFT_SIZE samples; every level above pools
+# WATERFALL_POOL_FACTOR rows of the one below, keeping both the mean (of linear power) and the
+# max. Rows are stored as float16 dB in .npy files that are memory-mapped when viewing.
+WATERFALL_FFT_SIZE = 1024             # Bins per row; also the level-0 hop (no overlap)
+WATERFALL_POOL_FACTOR = 4             # Rows merged per level
+WATERFALL_TOP_ROWS = 2048             # No further levels once a level is this short
+WATERFALL_BLOCK_ROWS = 4096           # Rows computed or pooled per step while building
+WATERFALL_DTYPE = np.float16          # ~0.03 dB resolution at typical levels, half the size of float32
+
+
+def waterfall_dir(file_path):
+    return file_path + '.waterfall'
+
+
+def _level_file(directory, level, reduce):
+    return os.path.join(directory, 'level_0.npy' if level == 0 else f'level_{level}_{reduce}.npy')
+
+
+def build_waterfall_pyramid(file_path, iq_samples=None, sample_rate=None, fft_size=WATERFALL_FFT_SIZE):
+    """
+    Computes the waterfall pyramid of a recording in one pass over the samples
+    (level 0) plus one pass per level over the level below, writing every level
+    straight into a memory-mapped .npy file. Returns the WaterfallPyramid.
+    """
+    if iq_samples is None:
+        iq_samples, sample_rate = open_iq_recording(file_path)
+        try:
+            return build_waterfall_pyramid(file_path, iq_samples, sample_rate, fft_size)
+        finally:
+            close_iq_recording(iq_samples)
+    directory = waterfall_dir(file_path)
+    os.makedirs(directory, exist_ok=True)
+
+    num_rows = len(iq_samples) // fft_size
+    if num_rows == 0:
+        raise ValueError(f"Recording '{file_path}' is shorter than one {fft_size}-sample waterfall row.")
+    level_0 = np.lib.format.open_memmap(_level_file(directory, 0, None), mode='w+', dtype=WATERFALL_DTYPE, shape=(num_rows, fft_size))
+    for block in iter_iq_blocks(iq_samples, sample_rate, WATERFALL_BLOCK_ROWS * fft_size, end_index=num_rows * fft_size):
+        row = block.start_index // fft_size
+        rows = spectrogram(block.samples, fft_size, fft_size, db=True)
+        level_0[row : row + len(rows)] = rows
+    level_0.flush()
+
+    level_rows = [num_rows]
+    below_mean = below_max = level_0
+    while level_rows[-1] > WATERFALL_TOP_ROWS:
+        level = len(level_rows)
+        rows_below = level_rows[-1]
+        num_rows = -(-rows_below // WATERFALL_POOL_FACTOR)
+        level_mean = np.lib.format.open_memmap(_level_file(directory, level, 'mean'), mode='w+', dtype=WATERFALL_DTYPE, shape=(num_rows, fft_size))
+        level_max = np.lib.format.open_memmap(_level_file(directory, level, 'max'), mode='w+', dtype=WATERFALL_DTYPE, shape=(num_rows, fft_size))
+
+        step = WATERFALL_BLOCK_ROWS * WATERFALL_POOL_FACTOR
+        for start in range(0, rows_below, step):
+            group_starts = np.arange(0, min(step, rows_below - start), WATERFALL_POOL_FACTOR)
+            group_sizes = np.diff(np.append(group_starts, min(step, rows_below - start)))[:, None]
+            out = slice(start // WATERFALL_POOL_FACTOR, start // WATERFALL_POOL_FACTOR + len(group_starts))
+            # Mean of linear power, back to dB; max works on dB directly
+            linear = 10 ** (below_mean[start : start + step].astype(np.float32) / 10)
+            level_mean[out] = 10 * np.log10(np.add.reduceat(linear, group_starts, axis=0) / group_sizes)
+            level_max[out] = np.maximum.reduceat(below_max[start : start + step], group_starts, axis=0)
+        level_mean.flush()
+        level_max.flush()
+        level_rows.append(num_rows)
+        below_mean, below_max = level_mean, level_max
+
+    metadata = {
+        'recording': os.path.basename(file_path),
+        'sample_rate': sample_rate,
+        'fft_size': fft_size,
+        'pool_factor': WATERFALL_POOL_FACTOR,
+        'level_rows': level_rows,
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return WaterfallPyramid(directory)
+
+
+class WaterfallPyramid:
+    """
+    Memory-mapped view of a waterfall pyramid. view() picks the finest level
+    that fits the requested time range into max_rows rows and slices it, so
+    overview and zoom plots need no FFTs.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            metadata = json.load(f)
+        self.directory = directory
+        self.sample_rate = metadata['sample_rate']
+        self.fft_size = metadata['fft_size']
+        self.pool_factor = metadata['pool_factor']
+        self.level_rows = metadata['level_rows']
+        self.freq_axis_hz = (np.arange(self.fft_size) - self.fft_size // 2) * self.sample_rate / self.fft_size
+        self.levels = {}
+
+    @property
+    def num_levels(self):
+        return len(self.level_rows)
+
+    @property
+    def duration_s(self):
+        return self.level_rows[0] * self.fft_size / self.sample_rate
+
+    def row_duration_s(self, level):
+        return self.fft_size * self.pool_factor ** level / self.sample_rate
+
+    def level(self, level, reduce='max'):
+        """
+        The memory-mapped (rows, fft_size) float16 dB array of a level ('mean' or 'max').
+        """
+        key = (level, 'max' if level == 0 else reduce)
+        if key not in self.levels:
+            self.levels[key] = np.load(_level_file(self.directory, level, reduce), mmap_mode='r')
+        return self.levels[key]
+
+    def view(self, start_s=0.0, end_s=None, max_rows=1000, reduce='max', dynamic_range_db=None):
+        """
+        Returns (rows_db, (start_s, end_s), level): a float32 copy of the rows
+        covering [start_s, end_s) from the finest level with at most max_rows
+        rows in that range, optionally clipped to dynamic_range_db below its maximum.
+        """
+        end_s = self.duration_s if end_s is None else min(end_s, self.duration_s)
+        start_s = max(start_s, 0.0)
+        level = 0
+        while level + 1 < self.num_levels and (end_s - start_s) / self.row_duration_s(level) > max_rows:
+            level += 1
+        row_duration = self.row_duration_s(level)
+        first_row = int(start_s / row_duration)
+        last_row = max(int(np.ceil(end_s / row_duration)), first_row + 1)
+        rows_db = np.array(self.level(level, reduce)[first_row:last_row], dtype=np.float32)
+        if dynamic_range_db is not None and rows_db.size:
+            np.maximum(rows_db, rows_db.max() - dynamic_range_db, out=rows_db)
+        return rows_db, (first_row * row_duration, first_row * row_duration + len(rows_db) * row_duration), level
+
+
+def load_waterfall_pyramid(file_path, iq_samples=None, sample_rate=None):
+    """
+    Opens the waterfall pyramid of a recording, building it first if it is missing or stale.
+    """
+    meta_path = os.path.join(waterfall_dir(file_path), 'meta.json')
+    if os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(file_path):
+        return WaterfallPyramid(waterfall_dir(file_path))
+    print(f"Building waterfall pyramid for '{file_path}'...")
+    pyramid = build_waterfall_pyramid(file_path, iq_samples, sample_rate)
+    print(f"Waterfall pyramid saved to '{pyramid.directory}' ({pyramid.num_levels} levels).")
+    return pyramid
@@ -1,16 +1,25 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from rtlsdr import RtlSdr
-import scipy.signal as signal
 from scipy.fft import fft, fftshift
 import time
 import string 
+import os
+import sys
+
+# Shared FSK DSP helpers live next to the offline analysis scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_analysis'))
+from fsk_demod import FIRDecimator, StreamingFSKDemod, StreamingFrameReader, fsk_discriminate, fsk_decode_all_offsets
+from iq_io import IQRecordingWriter, iq_from_bytes
+from spectrogram import cached_window
+from iq_dsp import StreamingBurstDetector
 
 # --- SDR Configuration ---
 sdr_center_freq = 433e6       # Frequency (Hz) where the LoRa module transmits
 sdr_sample_rate = 2.048e6     # SDR sample rate (samples per second)
 sdr_gain = 40                 # SDR Gain (dB) - adjust for best reception
 PACKET_CHUNK_SIZE = 2**15      # ЗБІЛЬШЕНО: Розмір блоку вибірок для постійного прослуховування (32768 вибірок)
+RECORD_FILE_PATH = None        # e.g. 'capture.sigmf-data' to keep the raw cu8 stream (+ SigMF metadata), None to disable
 
 # --- FSK Parameters (MUST EXACTLY MATCH ARDUINO TRANSMITTER) ---
 fsk_bit_rate_bps = 48000.5      # Bit rate (in bits/s) from Arduino sketch
@@ -23,18 +32,18 @@ f_space = -fsk_freq_dev_hz    # Frequency for '0'
 # Expected string (for verification)
 EXPECTED_STRING = "Hello humans from InQuatro! " 
 
-# --- Packet Detection Thresholds ---
-SIGNAL_ENERGY_THRESHOLD = 0.6 # Minimum average power to consider a packet detected
-
 # --- TWEAKABLE RANGE FOR AUTOMATIC start_offset_bits SEARCH ---
 START_OFFSET_BITS_CANDIDATES = range(150, 250, 1) # Test from 150 to 249, step 1 bit.
 # --- END TWEAK ---
 
 # --- Function to capture samples from RTL-SDR ---
-def capture_chunk(sdr_obj, chunk_size):
+def capture_chunk(sdr_obj, chunk_size, recorder=None):
     try:
-        samples = sdr_obj.read_samples(chunk_size)
-        return samples
+        # Native cu8 bytes: stored as-is when recording, converted to complex64 for processing
+        raw_bytes = sdr_obj.read_bytes(2 * chunk_size)
+        if recorder is not None:
+            recorder.write(raw_bytes)
+        return iq_from_bytes(raw_bytes, 'cu8')
     except Exception as e:
         return None
 
@@ -42,7 +51,7 @@ def capture_chunk(sdr_obj, chunk_size):
 def update_spectrum_plot(ax, samples, sample_rate, title="Packet Spectrum"):
     ax.clear() 
     N = len(samples)
-    yf = fft(samples * np.hanning(N))
+    yf = fft(samples * cached_window('hanning', N))
     xf = fftshift(np.fft.fftfreq(N, 1 / sample_rate))
     
     ax.plot(xf / 1e3, 20 * np.log10(np.abs(fftshift(yf))))
@@ -56,13 +65,7 @@ def update_spectrum_plot(ax, samples, sample_rate, title="Packet Spectrum"):
 # --- Function to update the Instantaneous Frequency plot dynamically ---
 def update_instantaneous_frequency_plot(ax, samples, sample_rate, bit_rate, freq_dev, mark_freq, space_freq, title="Instantaneous Frequency after FSK Demodulation"):
     ax.clear()
-    phase = np.unwrap(np.arctan2(samples.imag, samples.real))
-    instantaneous_frequency = np.diff(phase) * (sample_rate / (2 * np.pi))
-    
-    nyquist = 0.5 * sample_rate
-    cutoff_norm = (bit_rate * 2) / nyquist 
-    b, a = signal.butter(5, cutoff_norm, btype='low')
-    filtered_frequency = signal.lfilter(b, a, instantaneous_frequency)
+    filtered_frequency = fsk_discriminate(samples, sample_rate, bit_rate)
     
     time_axis = np.arange(len(filtered_frequency)) / sample_rate
     ax.plot(time_axis, filtered_frequency)
@@ -76,65 +79,21 @@ def update_instantaneous_frequency_plot(ax, samples, sample_rate, bit_rate, freq
     ax.set_ylim(space_freq * 1.5, mark_freq * 1.5)
 
 
-# --- Function for FSK Demodulation and Decoding ---
-def fsk_demodulate_and_decode(samples, sample_rate, bit_rate, freq_dev, mark_freq, space_freq, start_offset_bits_param, target_string_length):
+# --- Offset search: discriminate the chunk once, slice every candidate offset ---
+def fsk_decode_best_offset(samples, sample_rate, bit_rate, mark_freq, space_freq, offsets_bits, target_string_length):
+    """
+    Returns the best-scoring decoded string over all candidate start offsets
+    (in bits), or None when no offset fits in the chunk.
+    """
     if len(samples) < 2:
         return None
-        
-    phase = np.unwrap(np.arctan2(samples.imag, samples.real))
-    instantaneous_frequency = np.diff(phase) * (sample_rate / (2 * np.pi))
-    
-    nyquist = 0.5 * sample_rate
-    cutoff_norm = (bit_rate * 2) / nyquist 
-    b, a = signal.butter(5, cutoff_norm, btype='low')
-    filtered_frequency = signal.lfilter(b, a, instantaneous_frequency)
-    
-    threshold_freq = (mark_freq + space_freq) / 2
-    
-    samples_per_bit = sample_rate / bit_rate
-    
-    start_offset_samples = int(samples_per_bit * start_offset_bits_param)
-
-    if start_offset_samples >= len(filtered_frequency):
-        return None
-
-    raw_bits = []
-    num_bits_to_decode = target_string_length * 8
-    
-    for i in range(start_offset_samples, len(filtered_frequency), int(samples_per_bit)):
-        if i < len(filtered_frequency) and len(raw_bits) < num_bits_to_decode:
-            bit = 1 if filtered_frequency[i] > threshold_freq else 0
-            raw_bits.append(bit)
-        elif len(raw_bits) >= num_bits_to_decode:
-            break 
-    
-    if len(raw_bits) < num_bits_to_decode: 
-        return None 
-
-    decoded_bytes = bytearray()
-    byte_value = 0
-    bit_count = 0
-
-    for bit in raw_bits[:num_bits_to_decode]:
-        byte_value = (byte_value << 1) | bit
-        bit_count += 1
-        if bit_count == 8:
-            decoded_bytes.append(byte_value)
-            byte_value = 0
-            bit_count = 0
-    
-    try:
-        decoded_string = decoded_bytes.decode('ascii', errors='replace')
-        
-        if len(decoded_string) < target_string_length:
-            decoded_string += ' ' * (target_string_length - len(decoded_string))
-        elif len(decoded_string) > target_string_length:
-            decoded_string = decoded_string[:target_string_length]
-
-        return decoded_string
-            
-    except Exception as e:
-        return "[Error during final string assembly]"
+    filtered_frequency = fsk_discriminate(samples, sample_rate, bit_rate)
+    _, decoded = fsk_decode_all_offsets(filtered_frequency, sample_rate, bit_rate, mark_freq, space_freq,
+                                        offsets_bits, target_string_length)
+    candidates = [row.tobytes().decode('ascii', errors='replace') for row in decoded]
+    if EXPECTED_STRING in candidates:
+        return EXPECTED_STRING
+    return max(candidates, key=score_decoded_string, default=None)
 
 
 # --- Function to score decoded string quality (used internally for best guess) ---
@@ -175,57 +134,66 @@ if __name__ == "__main__":
     fig.suptitle("FSK Signal Live Demodulation") # Main title for the figure
     plt.tight_layout(rect=[0, 0.03, 1, 0.95]) # Adjust layout to make space for suptitle
 
+    # Decimating front-end + streaming demodulator + frame reader: filter/phase state and
+    # partial frames carry across reads, and demodulation runs at a few samples per bit
+    decimator = FIRDecimator(sdr_sample_rate, fsk_bit_rate_bps, fsk_freq_dev_hz)
+    demod = StreamingFSKDemod(decimator.output_rate, fsk_bit_rate_bps, f_mark, f_space)
+    frame_reader = StreamingFrameReader(decimator.output_rate, fsk_bit_rate_bps, fsk_freq_dev_hz, f_mark, f_space)
+    # Packet detection: adaptive (CFAR) burst detector instead of a fixed energy threshold
+    burst_detector = StreamingBurstDetector(sdr_sample_rate)
+    print(f"Demodulating at {decimator.output_rate / 1e3:.1f} kS/s (decimation {decimator.decimation}).")
+
+    recorder = None
+    if RECORD_FILE_PATH:
+        recorder = IQRecordingWriter(RECORD_FILE_PATH, 'cu8', sdr_sample_rate, sdr_center_freq, sdr_gain)
+        print(f"Recording raw cu8 samples to '{recorder.data_path}'.")
+
     try:
         while True:
-            chunk_samples = capture_chunk(sdr, PACKET_CHUNK_SIZE)
+            chunk_samples = capture_chunk(sdr, PACKET_CHUNK_SIZE, recorder)
             
             if chunk_samples is None:
                 print("Problem capturing samples. Check SDR connection.")
+                decimator.reset()
+                demod.reset()
+                frame_reader.reset()
+                burst_detector.reset()
                 time.sleep(0.1) 
                 continue
+
+            # Every read is demodulated (not only energetic ones) so the stream stays unbroken
+            filtered_frequency, _ = demod.process(decimator.process(chunk_samples))
+            decoded_frames = frame_reader.process(filtered_frequency)
+            for _, payload in decoded_frames:
+                decoded_text = payload.decode('ascii', errors='replace')
+                print(f"Decoded: '{decoded_text}'", end='')
+                if EXPECTED_STRING == decoded_text:
+                    print(" -> SUCCESS!")
+                else:
+                    print(" -> MISMATCH.")
             
             signal_power_chunk = np.mean(np.abs(chunk_samples)**2)
+            bursts_ended = burst_detector.process(chunk_samples)
             
-            if signal_power_chunk > SIGNAL_ENERGY_THRESHOLD:
-                best_decoded_string = None
-                best_score = -2 
-
-                # Iterate through candidate offsets
-                for offset in START_OFFSET_BITS_CANDIDATES:
-                    decoded_text_candidate = fsk_demodulate_and_decode(
-                        chunk_samples, sdr_sample_rate, fsk_bit_rate_bps, 
-                        fsk_freq_dev_hz, f_mark, f_space, offset, len(EXPECTED_STRING) # Pass target length
+            if bursts_ended or burst_detector.in_burst:
+                # Fall back to the brute-force offset search when no frame was recognised
+                if not decoded_frames:
+                    best_decoded_string = fsk_decode_best_offset(
+                        chunk_samples, sdr_sample_rate, fsk_bit_rate_bps, f_mark, f_space,
+                        START_OFFSET_BITS_CANDIDATES, len(EXPECTED_STRING)
                     )
-                    
-                    current_score = score_decoded_string(decoded_text_candidate)
-                    
-                    if current_score > best_score:
-                        best_score = current_score
-                        best_decoded_string = decoded_text_candidate
-                        
-                        if EXPECTED_STRING == str(best_decoded_string): # Check for perfect match
-                            break 
-                
-                # --- Update and redraw plots for the best-found decoding ---
+                    if best_decoded_string:
+                        print(f"Decoded (offset search): '{best_decoded_string}'", end='')
+                        print(" -> SUCCESS!" if EXPECTED_STRING == best_decoded_string else " -> MISMATCH.")
+                    else:
+                        print("Decoded: [No readable text after trying all offsets]")
+
+                # --- Update and redraw plots for the energetic chunk ---
                 update_spectrum_plot(ax1, chunk_samples, sdr_sample_rate, title=f"Packet Spectrum (Energy: {signal_power_chunk:.2e})")
                 update_instantaneous_frequency_plot(ax2, chunk_samples, sdr_sample_rate, fsk_bit_rate_bps, fsk_freq_dev_hz, f_mark, f_space, title="Packet Instantaneous Frequency")
                 
                 fig.canvas.draw()
                 fig.canvas.flush_events()
-                
-                # --- STREAM DECODED CHARACTERS IN FIXED LENGTH ---
-                if best_decoded_string:
-                    print(f"Decoded: '{best_decoded_string}'", end='')
-                    if EXPECTED_STRING == best_decoded_string:
-                        print(" -> SUCCESS!")
-                    else:
-                        print(" -> MISMATCH.")
-                else:
-                    print("Decoded: [No readable text after trying all offsets]")
-                
-                time.sleep(0.5) 
-            
-            time.sleep(0.01) 
 
     except KeyboardInterrupt:
         print("\nStopping reception.")
@@ -234,5 +202,7 @@ if __name__ == "__main__":
     finally:
         plt.ioff() 
         plt.show(block=True) 
+        if recorder is not None:
+            recorder.close()
         sdr.close()
         print("SDR closed.")
\ No newline at end of file